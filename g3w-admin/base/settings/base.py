@@ -233,6 +233,51 @@ SITE_TITLE = 'g3w-admin'
 QDJANGO_SERVER_URL = 'http://localhost'
 QDJANGO_PRJ_CACHE_KEY = 'qdjango_prj_{}'
 
+# Name of the Django cache (key of CACHES) used to share access control rules snapshots of QGIS Server
+# access control filters between requests. It has to be a cache shared between processes. None to disable it.
+QDJANGO_ACL_CACHE = None
+QDJANGO_ACL_CACHE_TIMEOUT = 3600
+
+# Name of the Django cache (key of CACHES) storing QGIS Server rendered responses (file based, Memcached, Redis...),
+# None to disable it.
+QDJANGO_OWS_CACHE = None
+QDJANGO_OWS_CACHE_TIMEOUT = 3600
+QDJANGO_OWS_CACHE_REQUESTS = ('GETMAP', 'GETLEGENDGRAPHIC')
+QDJANGO_OWS_CACHE_MAX_SIZE = 5 * 1024 * 1024
+
+# Addresses (unix socket paths or host:port) of QGIS Server render workers (qgis_render_worker command),
+# empty to render OWS requests into Django processes.
+QDJANGO_RENDER_WORKERS = []
+QDJANGO_RENDER_WORKERS_TIMEOUT = 60
+QDJANGO_RENDER_WORKERS_FALLBACK = True
+
+# QGIS Server projects cache of every process: max number of projects and max process memory (MB),
+# None for no limits. Least recently used projects are evicted.
+QDJANGO_PROJECT_CACHE_SIZE = None
+QDJANGO_PROJECT_CACHE_MAX_RSS = None
+
+# Projects loaded at worker start: list of project ids and number of most requested projects,
+# counted into the Django cache named by QDJANGO_PROJECT_USAGE_CACHE (None to disable).
+QDJANGO_PRELOAD_PROJECTS = []
+QDJANGO_PRELOAD_MOST_USED = 0
+QDJANGO_PROJECT_USAGE_CACHE = None
+
+# Name of the Django cache (key of CACHES) used to notify project changes to QGIS Server caches of every process,
+# it has to be a cache shared between processes. None to disable it.
+QDJANGO_PROJECT_EVENTS_CACHE = None
+QDJANGO_PROJECT_EVENTS_INTERVAL = 1
+
+# Seconds between checks of a project file modification time by the custom cache invalidator, 0 for every call
+G3WADMIN_CACHE_INVALIDATOR_STAT_INTERVAL = 0
+
+# Directory of layers search index files (SQLite FTS5), None for `search_index` into MEDIA_ROOT
+QDJANGO_SEARCH_INDEX_PATH = None
+# Max number of features ids matched by a search index, above it the search filter is applied by the provider
+QDJANGO_SEARCH_INDEX_MAX_HITS = 10000
+
+# Build missing spatial and attribute indexes of file based layers (OGR, SpatiaLite) on project import/update
+QDJANGO_AUTO_LAYER_INDEXES = True
+
 # data for proxy server
 PROXY_SERVER = False
 
@@ -296,6 +341,22 @@ G3WFILE_FORM_UPLOAD_FORMATS = ['qgs', 'qgz', 'png', 'jpg', 'jpeg', 'pdf', 'doc',
 G3WADMIN_VECTOR_LAYER_DOWNLOAD_FORMATS = ['shp', 'xls', 'csv', 'gpkg']
 G3WADMIN_RASTER_LAYER_DOWNLOAD_FORMATS = ['geotiff', 'xls', 'csv', 'gpkg']
 
+# Name of the Django cache (key of CACHES) used to store vector layer API results, i.e. features counts.
+# It has to be a cache shared between processes (i.e. Memcached, Redis). None to disable it.
+G3WADMIN_VECTOR_CACHE = None
+G3WADMIN_VECTOR_CACHE_TIMEOUT = 3600
+
+# Layer providers for which vector API data responses have an ETag (conditional GET with If-None-Match).
+# Data of DB providers changed outside G3W-SUITE are not detected: add i.e. 'postgres' only if data are edited by G3W-SUITE.
+G3WADMIN_VECTOR_API_ETAG_PROVIDERS = ('ogr', 'spatialite', 'delimitedtext')
+
+# Search, suggest and field filters of vector API are added to the layer subset string as provider SQL
+# (postgres, spatialite, GeoPackage) when possible, set to False to apply them always as QGIS expressions.
+G3WADMIN_VECTOR_API_FILTER_PUSHDOWN = True
+
+# Set to True to send an ETag with client project config responses (conditional GET with If-None-Match).
+G3WADMIN_PROJECT_CONFIG_ETAG = False
+
 # Setting to activate/deactivate user password reset by email.
 RESET_USER_PASSWORD = False
 
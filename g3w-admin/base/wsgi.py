@@ -19,3 +19,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "base.settings")
 
 application = get_wsgi_application()
+
+# Warm up the QGIS Server projects cache before serving requests
+from qdjango.utils.project_cache import preload_qgs_projects
+
+preload_qgs_projects()
@@ -7,9 +7,11 @@ from django.utils.translation import get_language
 from guardian.utils import get_anonymous_user
 from core.api.serializers import GroupSerializer, Group, update_serializer_data
 from core.api.permissions import ProjectPermission
-from core.signals import perform_client_search, post_serialize_project
+from core.signals import perform_client_search, post_serialize_project, project_config_version
 from core.models import GeneralSuiteData
-from usersmanage.utils import get_roles, G3W_VIEWER1, G3W_VIEWER2, G3W_EDITOR2, G3W_EDITOR1
+from core.utils.response import build_etag, not_modified_response, set_conditional_headers
+from usersmanage.utils import get_roles, get_project_permissions, G3W_VIEWER1, G3W_VIEWER2, G3W_EDITOR2, \
+    G3W_EDITOR1
 
 
 class ClientConfigApiView(APIView):
@@ -19,6 +21,54 @@ class ClientConfigApiView(APIView):
 
     permission_classes = (ProjectPermission,)
 
+    def get_etag(self, request, project, project_type):
+        """
+        Return the ETag of the project config for the request user, None if G3WADMIN_PROJECT_CONFIG_ETAG is False.
+        It is built from project and layers data versions, user permissions, column ACLs and the versions
+        returned by project_config_version signal receivers.
+
+        :param request: DjangoREST API request object
+        :param project: project model instance
+        :param project_type: project app name, i.e. 'qdjango'
+        :return: quoted ETag or None
+        """
+
+        if not getattr(settings, 'G3WADMIN_PROJECT_CONFIG_ETAG', False) or not hasattr(project, 'layer_set'):
+            return None
+
+        user = get_anonymous_user() if request.user.is_anonymous else request.user
+        groups = list(user.groups.all())
+
+        # Permissions snapshot, shared with the project serializer
+        perms = get_project_permissions(request, project)
+        checker = perms.checker
+        layers = sorted(perms.layers, key=lambda l: l.pk)
+
+        # Columns visible by the user on layers with column ACL
+        column_acls = [(l.pk, sorted(l.visible_fields_for_user(user)))
+                       for l in layers if getattr(l, 'has_column_acl', False)]
+
+        # Versions of modules data added to the config
+        modules_versions = sorted(
+            (f'{signal_receiver.__module__}.{signal_receiver.__name__}', str(version))
+            for signal_receiver, version in project_config_version.send(
+                self, app_name=project_type, project=project, request=request) if version is not None)
+
+        return build_etag(
+            project_type,
+            project.pk,
+            project.modified,
+            [(l.pk, l.data_version, sorted(checker.get_perms(l))) for l in layers],
+            sorted(checker.get_perms(project)),
+            user.pk,
+            sorted(g.pk for g in groups),
+            column_acls,
+            modules_versions,
+            get_language(),
+            request.META.get('HTTP_HOST'),
+            sorted(request.query_params.lists())
+        )
+
     def get(self, request, format=None, group_slug=None, project_type=None, project_id=None):
 
         # get serializer
@@ -27,10 +77,18 @@ class ClientConfigApiView(APIView):
 
         project = projectAppModule.models.Project.objects.get(pk=project_id)
 
+        # Conditional GET: the client copy of the config is still valid
+        etag = self.get_etag(request, project, project_type)
+        if etag:
+            not_modified = not_modified_response(request, etag)
+            if not_modified is not None:
+                return not_modified
+
         ps = projectSerializer(project, request=request)
 
         # add wms_url to project metadata if user anonimous has grant view on project
-        if get_anonymous_user().has_perm('{}.view_project'.format(project_type), project) and \
+        if get_project_permissions(request, project, get_anonymous_user()).has_perm(
+                '{}.view_project'.format(project_type), project) and \
                 'metadata' in ps.data and \
                 (
                         ps.data['metadata'].get('onlineresource', False) or
@@ -56,7 +114,10 @@ class ClientConfigApiView(APIView):
             if data:
                 update_serializer_data(ps_data, data)
 
-        return Response(ps_data)
+        response = Response(ps_data)
+        if etag:
+            set_conditional_headers(response, etag, project.modified.timestamp())
+        return response
 
 
 class GroupConfigApiView(APIView):
@@ -22,6 +22,7 @@ from qdjango.models import Project
 from qdjango.utils.data import QgisProject
 from core.tests.base import CoreTestBase
 from core.models import MacroGroup, Group, G3WSpatialRefSys
+from core.signals import project_config_version
 from core.utils.structure import FIELD_TYPES_MAPPING
 from qdjango.models import Widget, WIDGET_TYPES
 from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransformContext
@@ -455,6 +456,32 @@ class ClientApiTest(CoreTestBase):
 
         self.assertEqual(resp["initextent"], resp["extent"])
 
+    @override_settings(G3WADMIN_PROJECT_CONFIG_ETAG=True)
+    def test_config_etag_modules_versions(self):
+        """ Test project config ETag changes with versions returned by project_config_version receivers """
+
+        version = {'value': 1}
+
+        def module_config_version(sender, **kwargs):
+            return version['value']
+
+        response = self._testApiCall('group-project-map-config', ['gruppo-1', 'qdjango', '1'])
+        etag = response['ETag']
+
+        project_config_version.connect(module_config_version)
+        try:
+            response = self._testApiCall('group-project-map-config', ['gruppo-1', 'qdjango', '1'])
+            self.assertNotEqual(response['ETag'], etag)
+            etag = response['ETag']
+
+            response = self._testApiCall('group-project-map-config', ['gruppo-1', 'qdjango', '1'])
+            self.assertEqual(response['ETag'], etag)
+
+            version['value'] = 2
+            response = self._testApiCall('group-project-map-config', ['gruppo-1', 'qdjango', '1'])
+            self.assertNotEqual(response['ETag'], etag)
+        finally:
+            project_config_version.disconnect(module_config_version)
 
     def testClientConfigApiThumbnailView(self):
         """ Test api project config for thumbnail param """
@@ -17,7 +17,7 @@ from core.api.serializers import GroupSerializer, Group
 from core.api.views import USERMEDIAHANDLER_CLASSES
 from core.models import GeneralSuiteData, ProjectMapUrlAlias
 from core.utils.general import get_adminlte_skin_by_user
-from usersmanage.utils import get_users_for_object, get_user_model
+from usersmanage.utils import get_project_permissions, get_user_model
 from usersmanage.configs import *
 from copy import deepcopy
 import json
@@ -61,11 +61,13 @@ class ClientView(TemplateView):
         except Project.DoesNotExist:
             raise Http404('Map not found')
 
-        grant_users = get_users_for_object(self.project, "view_project", with_group_users=True)
+        # Permissions of the user and of the anonymous user on the project, loaded once for the request
+        view_perm = f'{self.project._meta.app_label}.view_project'
+        can_view = get_project_permissions(request, self.project).has_perm(view_perm, self.project) or \
+            get_project_permissions(request, self.project, get_user_model().get_anonymous()).has_perm(
+                view_perm, self.project)
 
-        anonymous_user = get_user_model().get_anonymous()
-
-        if request.user not in grant_users and anonymous_user not in grant_users and not request.user.is_superuser:
+        if not can_view and not request.user.is_superuser:
 
             # redirect to login if Anonymous user
             if request.user.is_anonymous:
@@ -118,8 +120,8 @@ class ClientView(TemplateView):
         u = self.request.user
 
         # admin_url
-        change_grant_users = get_users_for_object(self.project, "change_project", with_group_users=True)
-        if u in change_grant_users or u.is_superuser:
+        if u.is_superuser or (not u.is_anonymous and get_project_permissions(self.request, self.project).has_perm(
+                f'{self.project._meta.app_label}.change_project', self.project)):
             admin_url = reverse('home')
         else:
             admin_url = None
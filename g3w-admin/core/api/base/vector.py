@@ -3,6 +3,12 @@ import deprecation
 
 from qgis.core import QgsWkbTypes
 
+from core.utils.qgisapi import server_fid
+from core.utils.vector import BaseUserMediaHandler
+
+# Serialization plans cache, by layer pk
+_SERIALIZATION_PLANS = {}
+
 class MetadataVectorLayer(object):
     """
     Object to manage metadata QGIS vector layer
@@ -35,3 +41,113 @@ class MetadataVectorLayer(object):
         """
 
         return self.qgis_layer.getFeature(int(pk))
+
+
+class VectorLayerSerializationPlan(object):
+    """
+    Data to serialize QGIS vector layer features as GeoJSON, computed once per layer:
+    field names, date widget formats, media fields and primary key attribute indexes.
+    Use `VectorLayerSerializationPlan.get()` to get the plan cached until the project reloads.
+    """
+
+    def __init__(self, layer, qgis_layer):
+        """Constructor
+
+        :param layer: the layer model instance
+        :type layer: qdjango.models.Layer
+        :param qgis_layer: the QGIS vector layer
+        :type qgis_layer: QgsVectorLayer
+        """
+
+        self.qgis_layer = qgis_layer
+        self.edittypes = layer.edittypes
+
+        fields = qgis_layer.fields()
+        self.field_names = fields.names()
+
+        # Date/datetime/time fields with a not ISO widget format: (field name, format)
+        self.date_formats = []
+        for field_idx, f in enumerate(fields):
+            if f.typeName() in ('date', 'datetime', 'time'):
+                options = qgis_layer.editorWidgetSetup(field_idx).config()
+                if 'field_iso_format' in options and not options['field_iso_format']:
+                    self.date_formats.append((f.name(), options.get('field_format')))
+
+        self.provider = qgis_layer.dataProvider()
+        self.pk_indexes = self.provider.pkAttributeIndexes()
+
+        # Media fields (ExternalResource widget)
+        edittypes = eval(layer.edittypes) if layer.edittypes else {}
+        self.media_fields = [field for field, data in list(edittypes.items())
+                             if data['widgetv2type'] == 'ExternalResource']
+
+        self.media_handler = None
+        if self.media_fields:
+            self.media_handler = BaseUserMediaHandler(layer=layer)
+            self.media_handler.set_layer_md5_source()
+
+    @classmethod
+    def get(cls, layer, qgis_layer):
+        """
+        Return the plan of the layer, it's rebuilt when the QGIS layer instance changes (project reload)
+        or the layer is updated
+        """
+
+        plan = _SERIALIZATION_PLANS.get(layer.pk)
+        if plan is None or plan.qgis_layer is not qgis_layer or plan.edittypes != layer.edittypes \
+                or plan.field_names != qgis_layer.fields().names():
+            plan = cls(layer, qgis_layer)
+            _SERIALIZATION_PLANS[layer.pk] = plan
+        return plan
+
+    def properties(self, feature, attributes=None):
+        """
+        Return feature attributes as dict
+
+        :param attributes: optional list of attribute indexes to return, default all
+        """
+
+        if attributes is None:
+            return dict(zip(self.field_names, feature.attributes()))
+
+        return {self.field_names[idx]: feature.attribute(idx) for idx in attributes}
+
+    def format_dates(self, jsonfeature, feature):
+        """
+        Format date/datetime/time properties of a GeoJSON feature dict by their widget format
+        """
+
+        for name, field_format in self.date_formats:
+            if name not in jsonfeature['properties']:
+                continue
+            try:
+                jsonfeature['properties'][name] = feature.attribute(name).toString(field_format)
+            except:
+                pass
+
+    def server_fid(self, feature):
+        """
+        Returns the server FID in the form <pk1>@@<pk2>..., see core.utils.qgisapi.server_fid()
+        """
+
+        return server_fid(feature, self.provider, self.pk_indexes)
+
+    def change_media(self, features, mime_types=None):
+        """
+        Change media fields values of GeoJSON features in {'value': <url>, 'mime_type': <mime type>}
+
+        :param features: list of GeoJSON feature dicts or feature properties dicts
+        :param mime_types: optional dict to memoize mime types by file path
+        """
+
+        if not self.media_fields:
+            return
+
+        if mime_types is None:
+            mime_types = {}
+
+        for feature in features:
+            properties = feature['properties'] if 'properties' in feature else feature
+            for field in self.media_fields:
+                if field in properties and properties[field]:
+                    properties[field] = self.media_handler.media_value(properties[field], mime_types)
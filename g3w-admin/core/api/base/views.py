@@ -1,24 +1,22 @@
 import json
+import math
 from collections import OrderedDict
 from copy import copy
 
 from django.conf import settings
 from django.contrib.gis.geos import GEOSGeometry
 from django.core.exceptions import PermissionDenied
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.utils import six
 from django.utils.translation import ugettext
 from django.utils.translation import ugettext_lazy as _
 from qgis.core import (
     QgsJsonExporter,
-    QgsCoordinateTransform,
-    QgsCoordinateReferenceSystem,
-    QgsCoordinateTransformContext,
     QgsFeatureRequest,
-    QgsWkbTypes,
-    QgsVectorLayer,
-    QgsJsonUtils,
     QgsFeature,
+    QgsCoordinateReferenceSystem,
+    QgsUnitTypes,
+    QgsWkbTypes,
 )
 
 from rest_framework import exceptions, status
@@ -28,14 +26,18 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from core.api.authentication import CsrfExemptSessionAuthentication
+from core.api.base.vector import VectorLayerSerializationPlan
 from core.api.filters import IntersectsBBoxFilter
 from core.signals import (before_return_vector_data_layer,
                           post_create_maplayerattributes,
                           post_serialize_maplayer)
 from core.utils.structure import (APIVectorLayerStructure, mapLayerAttributes,
                                   mapLayerAttributesFromQgisLayer)
-from core.utils.vector import BaseUserMediaHandler as UserMediaHandler
-from core.utils.qgisapi import get_qgis_features, count_qgis_features, server_fid
+from core.utils.qgisapi import (get_qgis_features, iter_qgis_features, count_qgis_features,
+                                feature_cursor, validate_cursor, get_coordinate_transform,
+                                transform_geojson_geometry, get_qgis_unique_values)
+from core.utils.cache import vector_cache_key, vector_cache_get, vector_cache_set
+from core.utils.response import not_modified_response, set_conditional_headers
 
 import logging
 
@@ -49,6 +51,10 @@ MODE_GPX = 'gpx'
 MODE_CSV = 'csv'
 MODE_GPKG = 'gpkg'
 MODE_FILTER_TOKEN = 'filtertoken'
+MODE_TILES = 'tiles' # Mapbox vector tiles
+
+# OGC standardized rendering pixel size, in meters
+OGC_PIXEL_SIZE = 0.00028
 MODE_GEOTIFF = 'geotiff' # For raster layers
 
 MIME_TYPES_MOD = {
@@ -308,13 +314,13 @@ class BaseVectorApiView(G3WAPIView):
 
         pass
 
-    def reproject_feature(self, feature, to_layer=False):
+    def get_reproject_transform(self, to_layer=False):
         """
-        Reproject single geometry feature
+        Return the coordinate transform between layer CRS and project CRS,
+        built once per request
 
-        :param feature: Feature object
         :param to_layer: Reprojecting versus
-        :return:
+        :return: QgsCoordinateTransform instance
         """
 
         if to_layer:
@@ -324,10 +330,24 @@ class BaseVectorApiView(G3WAPIView):
             from_srid = self.layer.srid
             to_srid = self.layer.project.group.srid.auth_srid
 
-        to_srid = QgsCoordinateReferenceSystem(f'EPSG:{to_srid}')
-        from_srid = QgsCoordinateReferenceSystem(f'EPSG:{from_srid}')
-        ct = QgsCoordinateTransform(
-            from_srid, to_srid, QgsCoordinateTransformContext())
+        if not hasattr(self, '_reproject_transforms'):
+            self._reproject_transforms = {}
+
+        if (from_srid, to_srid) not in self._reproject_transforms:
+            self._reproject_transforms[(from_srid, to_srid)] = get_coordinate_transform(from_srid, to_srid)
+
+        return self._reproject_transforms[(from_srid, to_srid)]
+
+    def reproject_feature(self, feature, to_layer=False):
+        """
+        Reproject single geometry feature
+
+        :param feature: Feature object
+        :param to_layer: Reprojecting versus
+        :return:
+        """
+
+        ct = self.get_reproject_transform(to_layer)
 
         # Use QGIS APi for QgsFeature instance
         if isinstance(feature, QgsFeature):
@@ -335,11 +355,85 @@ class BaseVectorApiView(G3WAPIView):
             geometry.transform(ct)
             feature.setGeometry(geometry)
         else:
-            qgis_feature = QgsJsonUtils.stringToFeatureList(json.dumps(feature))[
-                0]
-            geometry = qgis_feature.geometry()
-            geometry.transform(ct)
-            feature['geometry'] = json.loads(geometry.asJson())
+            feature['geometry'] = transform_geojson_geometry(feature['geometry'], ct)
+
+    def get_output_resolution(self, request):
+        """
+        Return the map resolution (project CRS units for pixel) requested by 'resolution'
+        or 'map_scale' (scale denominator) params, snapped down to its zoom band (power of 2)
+        to get the same output for near resolutions. Only for data mode.
+
+        :param request: DjangoREST API request object
+        :return: float or None if not requested
+        """
+
+        if self.mode_call != MODE_DATA:
+            return None
+
+        try:
+            if 'resolution' in request.query_params:
+                resolution = float(request.query_params.get('resolution'))
+            elif 'map_scale' in request.query_params:
+                map_units = QgsCoordinateReferenceSystem(
+                    f'EPSG:{self.layer.project.group.srid.auth_srid}').mapUnits()
+                resolution = float(request.query_params.get('map_scale')) * OGC_PIXEL_SIZE * \
+                    QgsUnitTypes.fromUnitToUnitFactor(QgsUnitTypes.DistanceMeters, map_units)
+            else:
+                return None
+        except ValueError as e:
+            raise APIException(e)
+
+        if not math.isfinite(resolution) or resolution <= 0:
+            raise APIException(_('Resolution must be a positive number'))
+
+        return 2 ** math.floor(math.log2(resolution))
+
+    @staticmethod
+    def coordinate_precision(resolution):
+        """
+        Return the number of decimals of coordinates needed for a map resolution
+        """
+
+        return max(0, int(math.ceil(-math.log10(resolution))))
+
+    @staticmethod
+    def simplify_feature(feature, tolerance):
+        """
+        Simplify the feature geometry with a tolerance, geometries collapsed by simplification
+        (i.e. polygons smaller than tolerance) are kept as they are
+
+        :param feature: QgsFeature instance
+        :param tolerance: simplification tolerance in geometry units
+        """
+
+        geometry = feature.geometry()
+        if geometry.isNull() or geometry.type() == QgsWkbTypes.PointGeometry:
+            return
+
+        simplified = geometry.simplify(tolerance)
+        if not simplified.isNull() and not simplified.isEmpty():
+            feature.setGeometry(simplified)
+
+    def set_request_destination_crs(self, qgis_feature_request):
+        """
+        Push the reprojection into the feature request, so QGIS transforms geometries while iterating.
+        It's not possible when request filters work with geometries in layer CRS
+        (filter rect or expression using geometry).
+
+        :param qgis_feature_request: QgsFeatureRequest instance already passed through filter backends
+        :return: True if the destination CRS has been set
+        """
+
+        if not qgis_feature_request.filterRect().isEmpty():
+            return False
+
+        if qgis_feature_request.filterType() == QgsFeatureRequest.FilterExpression and \
+                qgis_feature_request.filterExpression().needsGeometry():
+            return False
+
+        ct = self.get_reproject_transform()
+        qgis_feature_request.setDestinationCrs(ct.destinationCrs(), ct.context())
+        return True
 
     def reproject_featurecollection(self, featurecollection, to_layer=False):
         """
@@ -350,17 +444,20 @@ class BaseVectorApiView(G3WAPIView):
         for feature in featurecollection['features']:
             self.reproject_feature(feature, to_layer)
 
+    @property
+    def serialization_plan(self):
+        """
+        Serialization plan of the current metadata layer, cached until the project reloads
+        """
+
+        return VectorLayerSerializationPlan.get(self.layer, self.metadata_layer.qgis_layer)
+
     def change_media(self, featurecollection):
 
         if 'features' in featurecollection:
-
-            for feature in featurecollection['features']:
-                UserMediaHandler(layer=self.layer,
-                                 feature=feature).new_value(change=True)
+            self.serialization_plan.change_media(featurecollection['features'])
         else:
-            for feature in featurecollection:
-                UserMediaHandler(layer=self.layer,
-                                 feature=feature).new_value(change=True)
+            self.serialization_plan.change_media(featurecollection)
 
     def initial(self, request, *args, **kwargs):
         super(BaseVectorApiView, self).initial(request, *args, **kwargs)
@@ -430,6 +527,251 @@ class BaseVectorApiView(G3WAPIView):
 
         self.results.update(APIVectorLayerStructure(**vector_params).as_dict())
 
+    def _is_stream_request(self, request):
+        """
+        Check for stream query url param and if != 0, only for data mode call
+        :param request: DjangoREST API request object
+        :return: bool
+        """
+
+        if self.mode_call != MODE_DATA or 'unique' in request.query_params:
+            return False
+
+        stream = request.query_params.get('stream')
+        if not stream:
+            return False
+
+        return not (stream.isnumeric() and int(stream) == 0)
+
+    def _export_feature(self, ex, feature):
+        """
+        Build the GeoJSON dict of a single feature without QgsFormatter,
+        date/datetime/time fields values are formatted by their widget config.
+
+        :param ex: QgsJsonExporter instance with include attributes set to False
+        :param feature: QgsFeature instance
+        :return: GeoJSON feature dict
+        """
+
+        plan = self.serialization_plan
+        jsonfeature = json.loads(ex.exportFeature(feature, plan.properties(feature, self.output_attributes)))
+
+        # Update date and datetime fields value if widget is active
+        plan.format_dates(jsonfeature, feature)
+
+        return jsonfeature
+
+    def apply_filter_backends(self, request, qgis_feature_request):
+        """
+        Pass the QGIS feature request through the view filter backends,
+        note that backends can change the layer subset string.
+
+        :param request: DjangoREST API request object
+        :param qgis_feature_request: QgsFeatureRequest instance
+        """
+
+        if hasattr(self, 'filter_backends'):
+            try:
+                for backend in self.filter_backends:
+                    backend().apply_filter(request, self.metadata_layer, qgis_feature_request, self)
+            except Exception as e:
+                raise APIException(e)
+
+    def _vector_cache_key(self, prefix, qgis_feature_request, *parts):
+        """
+        Return the vector cache key for a result of the filtered request, keyed by layer,
+        layer subset string and effective filter expression (that includes user constraints)
+
+        :param prefix: str, kind of the cached value
+        :param qgis_feature_request: QgsFeatureRequest instance already passed through filter backends
+        :param parts: other values that identify the cached value
+        :return: str or None if the value can't be cached
+        """
+
+        # Expression context scopes (i.e. form data) are not part of the key: no cache
+        if qgis_feature_request is not None and qgis_feature_request.expressionContext().scopeCount() > 0:
+            return None
+
+        request_parts = []
+        if qgis_feature_request is not None:
+            filter_expression = qgis_feature_request.filterExpression()
+            filter_rect = qgis_feature_request.filterRect()
+            request_parts = [
+                qgis_feature_request.filterType(),
+                filter_expression.expression() if filter_expression else '',
+                filter_rect.asWktPolygon() if not filter_rect.isEmpty() else '',
+                sorted(qgis_feature_request.filterFids()),
+                qgis_feature_request.filterFid()
+            ]
+
+        return vector_cache_key(
+            prefix,
+            self.layer.datasource,
+            self.layer.pk,
+            self.metadata_layer.qgis_layer.subsetString(),
+            *(request_parts + list(parts))
+        )
+
+    def get_unique_values(self, field_name, qgis_feature_request=None, limit=-1, prefix=None):
+        """
+        Return the unique values of a field of the metadata layer, read from the vector cache when enabled.
+        See core.utils.qgisapi.get_qgis_unique_values()
+
+        :param field_name: field name
+        :param qgis_feature_request: QgsFeatureRequest instance already passed through filter backends
+        :param limit: max number of values, -1 for no limit
+        :param prefix: case insensitive prefix of values
+        :return: list
+        """
+
+        key = self._vector_cache_key('unique', qgis_feature_request, field_name, limit, prefix)
+        values = vector_cache_get(key)
+        if values is None:
+            values = get_qgis_unique_values(
+                self.metadata_layer.qgis_layer, field_name, qgis_feature_request, limit, prefix)
+            vector_cache_set(key, values)
+        return values
+
+    def count_features(self, request, qgis_feature_request, **kwargs):
+        """
+        Return the number of features matching the filtered request.
+        If `count=estimate` is passed and no filter is set, the provider count is returned,
+        otherwise the count is read from the vector cache (when enabled), keyed by layer,
+        effective filter expression (that includes user constraints) and layer subset string.
+
+        :param request: DjangoREST API request object
+        :param qgis_feature_request: QgsFeatureRequest instance already passed through filter backends
+        :return: int
+        """
+
+        qgis_layer = self.metadata_layer.qgis_layer
+
+        no_filters = qgis_feature_request.filterType() == QgsFeatureRequest.FilterNone and \
+            qgis_feature_request.filterRect().isEmpty()
+
+        if no_filters and request.query_params.get('count') == 'estimate':
+            count = qgis_layer.featureCount()
+            if count != -1:
+                return count
+
+        key = self._vector_cache_key('count', qgis_feature_request)
+        count = vector_cache_get(key)
+        if count is not None:
+            return count
+
+        count = count_qgis_features(qgis_layer, qgis_feature_request, **kwargs)
+        vector_cache_set(key, count)
+        return count
+
+    def _next_cursor(self, last_feature, count, qgis_feature_request, **kwargs):
+        """
+        Return the keyset pagination cursor for the next page
+        :param last_feature: last QgsFeature of the current page
+        :param count: number of features in the current page
+        :param qgis_feature_request: QgsFeatureRequest used for the current page
+        :return: str or None if the current page is the last one
+        """
+
+        if last_feature is None or count < int(kwargs['page_size']):
+            return None
+
+        return feature_cursor(last_feature, self.metadata_layer.qgis_layer, qgis_feature_request)
+
+    def response_data_stream(self, request, qgis_feature_request, export_features, filtered_subset_string,
+                             original_subset_string, **kwargs):
+        """
+        Return data as a streaming GeoJSON response: every feature is exported,
+        reprojected and patched (server FID and media) while the layer iterator yields it,
+        so the memory usage doesn't depend on the number of features.
+
+        :param request: DjangoREST API request object
+        :param qgis_feature_request: QgsFeatureRequest instance already passed through filter backends
+        :param export_features: Boolean, True for to use QgsJsonExporter formatters
+        :param filtered_subset_string: layer subset string set by filter backends
+        :param original_subset_string: layer subset string to restore at the end of the stream
+        :return: StreamingHttpResponse instance
+        """
+
+        qgis_layer = self.metadata_layer.qgis_layer
+        plan = self.serialization_plan
+        mime_types = {}
+
+        ex = QgsJsonExporter(qgis_layer)
+        ex.setTransformGeometries(False)
+        if self.output_attributes is not None:
+            ex.setAttributes(self.output_attributes)
+        if self.output_resolution:
+            ex.setPrecision(self.coordinate_precision(self.output_resolution))
+        if not export_features:
+            ex.setIncludeAttributes(False)
+
+        # Extra data from receivers are added before to start the stream
+        self.update_results_extra_data()
+
+        results = copy(self.results.results)
+        vector = APIVectorLayerStructure(**{
+            'geometryType': self.metadata_layer.geometry_type,
+        }).as_dict()
+        results['featurelocks'] = vector['featurelocks']
+
+        vector_head = vector['vector']
+        del(vector_head['data'])
+        del(vector_head['count'])
+
+        reproject = self.reproject and not qgis_feature_request.flags() & QgsFeatureRequest.NoGeometry and \
+            not qgis_feature_request.destinationCrs().isValid()
+
+        def stream():
+
+            # The stream is consumed after the view returns: set again the filtered subset string
+            qgis_layer.setSubsetString(filtered_subset_string)
+
+            try:
+                yield json.dumps({'vector': vector_head})[:-2] + \
+                    ', "data": {"type": "FeatureCollection", "features": ['
+
+                count = 0
+                feature = None
+                for feature in iter_qgis_features(qgis_layer, qgis_feature_request, **kwargs):
+
+                    # Reproject feature if layer CRS != Project CRS and request doesn't do it
+                    if reproject:
+                        self.reproject_feature(feature)
+
+                    if self.output_resolution:
+                        self.simplify_feature(feature, self.output_resolution)
+
+                    if export_features:
+                        jsonfeature = json.loads(ex.exportFeature(feature))
+                    else:
+                        jsonfeature = self._export_feature(ex, feature)
+
+                    # Change media
+                    plan.change_media([jsonfeature], mime_types)
+
+                    # Patch feature ID with server featureID
+                    jsonfeature['id'] = plan.server_fid(feature)
+
+                    yield (', ' if count else '') + json.dumps(jsonfeature)
+                    count += 1
+
+                tail = ']}'
+                if 'cursor' in kwargs:
+                    tail += ', "next_cursor": ' + json.dumps(
+                        self._next_cursor(feature, count, qgis_feature_request, **kwargs))
+
+                if 'page' in kwargs or 'cursor' in kwargs:
+                    count = self.count_features(request, qgis_feature_request, **kwargs)
+
+                yield tail + f', "count": {count}}}, ' + json.dumps(results)[1:]
+
+            finally:
+
+                # Restore the original subset string
+                qgis_layer.setSubsetString(original_subset_string)
+
+        return StreamingHttpResponse(stream(), content_type='application/json')
+
     def response_data_mode(self, request, export_features=False):
         """
         Query layer and return data
@@ -445,151 +787,165 @@ class BaseVectorApiView(G3WAPIView):
         # Prepare arguments for the get feature call
         kwargs = {}
 
+        # Zoom aware output: geometries simplified and coordinates quantized for the map resolution
+        self.output_resolution = self.get_output_resolution(request)
+
         # Apply filter backends, store original subset string
         original_subset_string = self.metadata_layer.qgis_layer.subsetString()
-        if hasattr(self, 'filter_backends'):
-            try:
-                for backend in self.filter_backends:
-                    backend().apply_filter(request, self.metadata_layer, qgis_feature_request, self)
-            except Exception as e:
-                raise APIException(e)
+        self.apply_filter_backends(request, qgis_feature_request)
 
         # Paging cannot be a backend filter
-        if 'page' in request.query_params:
+        # 'cursor' (keyset pagination, empty for the first page) has precedence over 'page'
+        if 'cursor' in request.query_params:
+            kwargs['cursor'] = request.query_params.get('cursor')
+            kwargs['page_size'] = request.query_params.get('page_size', 10)
+            try:
+                validate_cursor(self.metadata_layer.qgis_layer, qgis_feature_request, kwargs['cursor'])
+            except ValueError as e:
+                self.metadata_layer.qgis_layer.setSubsetString(original_subset_string)
+                raise APIException(e)
+        elif 'page' in request.query_params:
             kwargs['page'] = request.query_params.get('page')
             kwargs['page_size'] = request.query_params.get('page_size', 10)
 
+        # Attributes projection and geometry: 'fields' (comma separated field names)
+        # and 'geometry' (0 or false to exclude geometries) params
+        self.output_attributes = None
+        if 'fields' in request.query_params:
+            fields = self.metadata_layer.qgis_layer.fields()
+            attrs = [fields.lookupField(name) for name in request.query_params.get('fields').split(',')]
+            attrs = [idx for idx in attrs if idx >= 0]
+
+            # Intersect with attributes already restricted by filters (i.e. column ACL)
+            if qgis_feature_request.flags() & QgsFeatureRequest.SubsetOfAttributes:
+                attrs = [idx for idx in attrs if idx in qgis_feature_request.subsetOfAttributes()]
+
+            qgis_feature_request.setSubsetOfAttributes(attrs)
+            self.output_attributes = list(attrs)
+
+        if request.query_params.get('geometry', '').lower() in ('0', 'false'):
+            qgis_feature_request.setFlags(qgis_feature_request.flags() | QgsFeatureRequest.NoGeometry)
+
         # Make sure we have all attrs we need to build the server FID
-        provider = self.metadata_layer.qgis_layer.dataProvider()
         if qgis_feature_request.flags() & QgsFeatureRequest.SubsetOfAttributes:
             attrs = qgis_feature_request.subsetOfAttributes()
-            for attr_idx in provider.pkAttributeIndexes():
+            for attr_idx in self.serialization_plan.pk_indexes:
                 if attr_idx not in attrs:
                     attrs.append(attr_idx)
+                    if self.output_attributes is not None:
+                        self.output_attributes.append(attr_idx)
             qgis_feature_request.setSubsetOfAttributes(attrs)
 
-        self.features = get_qgis_features(
-            self.metadata_layer.qgis_layer, qgis_feature_request, **kwargs)
-
-        # Reproject feature if layer CRS != Project CRS
-        if self.reproject:
-            for f in self.features:
-                self.reproject_feature(f)
-
-        ex = QgsJsonExporter(self.metadata_layer.qgis_layer)
+        # check for formatter query url param and check if != 0
+        if 'formatter' in request.query_params:
+            formatter = request.query_params.get('formatter')
+            if formatter.isnumeric() and int(formatter) == 0:
+                export_features = False
+            else:
+                export_features = True
 
-        # If 'unique' request params is set,
-        # api return a list of unique
-        # field name sent with 'unique' param.
-        # --------------------------------------
-        # IDEA:     for big data it'll be iterate over features to get unique
-        #           c++ iteration is fast. Instead memory layer with too many features can be a problem.
+        # If 'unique' request params is set, api return a list of unique values
+        # of the field sent with 'unique' param: optional 'limit' and 'prefix' params.
         if 'unique' in request.query_params:
-
-            vl = QgsVectorLayer(QgsWkbTypes.displayString(self.metadata_layer.qgis_layer.wkbType()),
-                                "temporary_vector", "memory")
-            pr = vl.dataProvider()
-
-            # add fields
-            pr.addAttributes(self.metadata_layer.qgis_layer.fields())
-            vl.updateFields()  # tell the vector layer to fetch changes from the provider
-
-            res = pr.addFeatures(self.features)
-
-            uniques = vl.uniqueValues(
-                self.metadata_layer.qgis_layer.fields().indexOf(
-                    request.query_params.get('unique'))
-            )
-
-            values = []
-            for u in uniques:
-                try:
-                    if u:
-                        values.append(json.loads(QgsJsonUtils.encodeValue(u)))
-                except Exception as e:
-                    logger.error(f'Response vector widget unique: {e}')
-                    continue
+            try:
+                values = self.get_unique_values(
+                    request.query_params.get('unique'),
+                    qgis_feature_request,
+                    limit=int(request.query_params.get('limit', -1)),
+                    prefix=request.query_params.get('prefix'))
+            except ValueError as e:
+                raise APIException(e)
+            finally:
+                # Restore the original subset string
+                self.metadata_layer.qgis_layer.setSubsetString(original_subset_string)
 
             # sort values
+            values = [v for v in values if v]
             values.sort()
             self.results.update({
                 'data': values,
                 'count': len(values)
             })
+            return
 
-            del(vl)
-
-        else:
+        # Reproject feature if layer CRS != Project CRS: where possible QGIS does it while iterating
+        reproject = self.reproject and not qgis_feature_request.flags() & QgsFeatureRequest.NoGeometry and \
+            not self.set_request_destination_crs(qgis_feature_request)
 
-            ex.setTransformGeometries(False)
+        # Streaming mode: features are written to the response while they are fetched
+        if self._is_stream_request(request):
+            filtered_subset_string = self.metadata_layer.qgis_layer.subsetString()
+            self.metadata_layer.qgis_layer.setSubsetString(original_subset_string)
+            return self.response_data_stream(request, qgis_feature_request, export_features,
+                                             filtered_subset_string, original_subset_string, **kwargs)
 
-            # check for formatter query url param and check if != 0
-            if 'formatter' in request.query_params:
-                formatter = request.query_params.get('formatter')
-                if formatter.isnumeric() and int(formatter) == 0:
-                    export_features = False
-                else:
-                    export_features = True
+        self.features = get_qgis_features(
+            self.metadata_layer.qgis_layer, qgis_feature_request, **kwargs)
 
-            if export_features:
-                feature_collection = json.loads(
-                    ex.exportFeatures(self.features))
-            else:
+        if reproject:
+            for f in self.features:
+                self.reproject_feature(f)
 
-                # to exclude QgsFormater used into QgsJsonExporter is necessary build by hand single json feature
-                ex.setIncludeAttributes(False)
+        if self.output_resolution:
+            for f in self.features:
+                self.simplify_feature(f, self.output_resolution)
 
-                feature_collection = {
-                    'type': 'FeatureCollection',
-                    'features': []
-                }
+        ex = QgsJsonExporter(self.metadata_layer.qgis_layer)
+        ex.setTransformGeometries(False)
+        if self.output_attributes is not None:
+            ex.setAttributes(self.output_attributes)
+        if self.output_resolution:
+            ex.setPrecision(self.coordinate_precision(self.output_resolution))
+
+        if export_features:
+            feature_collection = json.loads(
+                ex.exportFeatures(self.features))
+        else:
 
-                for feature in self.features:
-                    fnames = []
-                    date_fields = []
-                    for f in feature.fields():
-                        fnames.append(f.name())
-                        if f.typeName() in ('date', 'datetime', 'time'):
-                            date_fields.append(f)
+            # to exclude QgsFormater used into QgsJsonExporter is necessary build by hand single json feature
+            ex.setIncludeAttributes(False)
 
-                    jsonfeature = json.loads(ex.exportFeature(feature, dict(zip(fnames, feature.attributes()))))
+            feature_collection = {
+                'type': 'FeatureCollection',
+                'features': []
+            }
 
-                    # Update date and datetime fields value if widget is active
-                    if len(date_fields) > 0:
-                        for f in date_fields:
-                            field_idx = self.metadata_layer.qgis_layer.fields().indexFromName(f.name())
-                            options = self.metadata_layer.qgis_layer.editorWidgetSetup(field_idx).config()
-                            if 'field_iso_format' in options and not options['field_iso_format']:
-                                try:
-                                    jsonfeature['properties'][f.name()] = feature.attribute(f.name())\
-                                        .toString(options['field_format'])
-                                except:
-                                    pass
+            for feature in self.features:
+                feature_collection['features'].append(self._export_feature(ex, feature))
 
+        # Change media
+        self.change_media(feature_collection)
 
-                    feature_collection['features'].append(jsonfeature)
+        # Patch feature IDs with server featureIDs
+        plan = self.serialization_plan
+        fids_map = {}
+        for f in self.features:
+            fids_map[f.id()] = plan.server_fid(f)
 
-            # Change media
-            self.change_media(feature_collection)
+        for i in range(len(feature_collection['features'])):
+            f = feature_collection['features'][i]
+            f['id'] = fids_map[f['id']]
 
-            # Patch feature IDs with server featureIDs
-            fids_map = {}
-            for f in self.features:
-                fids_map[f.id()] = server_fid(f, provider)
+        # Without pagination or limit the count is the number of features already fetched
+        if 'page' in kwargs or 'cursor' in kwargs or qgis_feature_request.limit() != -1:
+            count = self.count_features(request, qgis_feature_request, **kwargs)
+        else:
+            count = len(self.features)
 
-            for i in range(len(feature_collection['features'])):
-                f = feature_collection['features'][i]
-                f['id'] = fids_map[f['id']]
+        self.results.update(APIVectorLayerStructure(**{
+            'data': feature_collection,
+            'count': count,
+            'geometryType': self.metadata_layer.geometry_type,
+        }).as_dict())
 
-            self.results.update(APIVectorLayerStructure(**{
-                'data': feature_collection,
-                'count': count_qgis_features(self.metadata_layer.qgis_layer, qgis_feature_request, **kwargs),
-                'geometryType': self.metadata_layer.geometry_type,
-            }).as_dict())
+        # Keyset pagination: cursor for the next page, None if this is the last one
+        if 'cursor' in kwargs:
+            self.results.results['vector']['next_cursor'] = self._next_cursor(
+                self.features[-1] if self.features else None, len(self.features), qgis_feature_request, **kwargs)
 
-            # FIXME: add extra fields data by signals and receivers
-            # FIXME: featurecollection = post_serialize_maplayer.send(layer_serializer, layer=self.layer_name)
-            # FIXME: Not sure how to map this to the new QGIS API
+        # FIXME: add extra fields data by signals and receivers
+        # FIXME: featurecollection = post_serialize_maplayer.send(layer_serializer, layer=self.layer_name)
+        # FIXME: Not sure how to map this to the new QGIS API
 
         # Restore the original subset string
         self.metadata_layer.qgis_layer.setSubsetString(original_subset_string)
@@ -620,12 +976,49 @@ class BaseVectorApiView(G3WAPIView):
                 f'Mode {self.mode_call} are not in modes call available: {", ".join(self.modes_call_available)}',
                 code=500)
 
+    def update_results_extra_data(self):
+        """
+        Update results with extra data from before_return_vector_data_layer receivers
+        """
+
+        extra_data = before_return_vector_data_layer.send(self)
+        for ed in extra_data:
+            if ed[1] and ed[0].__name__ in ('add_constraints', 'add_atomic_capabilities'):
+                self.results.results.update(ed[1])
+
+    def get_etag(self, request):
+        """
+        Method to implement in child class to enable conditional GET requests:
+        return a quoted ETag identifying the response content or None.
+        It is called before any feature is fetched, so it has to be cheap.
+        :param request: DjangoREST API request object
+        :return: str or None
+        """
+
+        return None
+
+    def get_last_modified(self, request):
+        """
+        Method to implement in child class, return timestamp of last data modification or None
+        :param request: DjangoREST API request object
+        :return: float or None
+        """
+
+        return None
+
     def get_response(self, request, mode_call=None, project_type=None, layer_id=None, **kwargs):
 
         # set layer model object to work
         if not hasattr(self, 'layer'):
             self.layer = self.get_layer_by_name(layer_id)
 
+        # Conditional GET: client copy is still valid, no need to query data
+        etag = self.get_etag(request) if request.method in ('GET', 'HEAD') else None
+        if etag:
+            not_modified = not_modified_response(request, etag)
+            if not_modified is not None:
+                return not_modified
+
         # set reprojecting status
         self.set_reprojecting_status()
 
@@ -635,15 +1028,15 @@ class BaseVectorApiView(G3WAPIView):
         if response is None:
 
             # before to send response
-            extra_data = before_return_vector_data_layer.send(self)
-            for ed in extra_data:
-                if ed[1] and ed[0].__name__ in ('add_constraints', 'add_atomic_capabilities'):
-                    self.results.results.update(ed[1])
+            self.update_results_extra_data()
 
             # response a APIVectorLayer
-            return Response(self.results.results)
-        else:
-            return response
+            response = Response(self.results.results)
+
+        if etag and response.status_code == status.HTTP_200_OK:
+            set_conditional_headers(response, etag, self.get_last_modified(request))
+
+        return response
 
     def get(self, request, mode_call=None, project_type=None, layer_id=None, **kwargs):
 
@@ -23,6 +23,8 @@ from qgis.core import (
 from rest_framework.exceptions import ParseError
 from urllib.parse import unquote
 from qdjango.models import Layer
+from core.utils.subset import SubsetStringCompiler, apply_subset_string_or_expression
+from qdjango.utils.search_index import LayerSearchIndex
 
 class BaseFilterBackend():
     """Base class for QGIS request filters"""
@@ -83,13 +85,16 @@ class SearchFilter(BaseFilterBackend):
 
         if request.query_params.get('search'):
 
+            compiler = SubsetStringCompiler(qgis_layer)
             search_parts = []
+            sql_parts = []
 
             for search_term in request.query_params.get('search').split(','):
 
-                search_term = self._quote_value('%' + search_term + '%')
-                exp_template = '{field_name} ILIKE ' + search_term
+                pattern = '%' + search_term + '%'
+                exp_template = '{field_name} ILIKE ' + self._quote_value(pattern)
                 exp_parts = []
+                sql_conditions = []
 
                 for f in qgis_layer.fields():
 
@@ -97,14 +102,18 @@ class SearchFilter(BaseFilterBackend):
                         continue
                     exp_parts.append(exp_template.format(
                         field_name=self._quote_identifier(f.name())))
+                    sql_conditions.append(compiler.ilike(f.name(), pattern))
 
                 if exp_parts:
                     search_parts.append(' OR '.join(exp_parts))
+                    sql_parts.append(compiler.combine(sql_conditions, 'OR'))
 
             if search_parts:
 
                 search_expression = '(' + ' AND '.join(search_parts) + ')'
-                qgis_feature_request.combineFilterExpression(search_expression)
+                apply_subset_string_or_expression(qgis_layer, qgis_feature_request,
+                                                  compiler.combine(sql_parts, 'AND'), search_expression,
+                                                  'SearchFilter')
 
 
 class OrderingFilter(BaseFilterBackend):
@@ -227,12 +236,15 @@ class SuggestFilterBackend(BaseFilterBackend):
 
             if field_name and field_value:
 
+                pattern = '%' + field_value + '%'
                 search_expression = '{field_name} ILIKE {field_value}'.format(
                     field_name=self._quote_identifier(field_name),
-                    field_value=self._quote_value('%' + field_value + '%')
+                    field_value=self._quote_value(pattern)
                 )
 
-                qgis_feature_request.combineFilterExpression(search_expression)
+                apply_subset_string_or_expression(qgis_layer, qgis_feature_request,
+                                                  SubsetStringCompiler(qgis_layer).ilike(field_name, pattern),
+                                                  search_expression, 'SuggestFilterBackend')
 
 
 class FieldFilterBackend(BaseFilterBackend):
@@ -274,6 +286,13 @@ class FieldFilterBackend(BaseFilterBackend):
             nfields = len(fields)
             search_expression = ''
 
+            # Provider SQL: same conditions and logic operators of the expression
+            compiler = SubsetStringCompiler(qgis_layer)
+            sql = ''
+
+            # Conditions for the layer search index
+            conditions = []
+
             for field in fields:
                 try:
                     field_name, field_operator, field_value, field_logicop = field.split(
@@ -296,22 +315,37 @@ class FieldFilterBackend(BaseFilterBackend):
 
                     pre_post_operator = '%' if field_operator in (
                         'like', 'ilike') else ''
+                    value = f'{pre_post_operator}{unquote(field_value)}{pre_post_operator}'
                     single_search_expression = '{field_name} {field_operator} {field_value}'.format(
                         field_name=self._quote_identifier(field_name),
                         field_operator=self.COMPARATORS_MAP[field_operator],
-                        field_value=self._quote_value(
-                            f'{pre_post_operator}{unquote(field_value)}{pre_post_operator}')
+                        field_value=self._quote_value(value)
                     )
 
                     search_expression = f'{search_expression} {single_search_expression}'
+                    conditions.append((field_name, self.COMPARATORS_MAP[field_operator], value, field_logicop))
+
+                    if sql is not None:
+                        single_sql = compiler.compare(field_name, self.COMPARATORS_MAP[field_operator], value)
+                        sql = None if single_sql is None else f'{sql} ({single_sql})'
 
                     if count != nfields - 1:
                         search_expression = f'{search_expression} {field_logicop} '
+                        if sql is not None:
+                            sql = f'{sql} {field_logicop} ' if field_logicop in ('AND', 'OR') else None
 
                 count += 1
 
             if search_expression != '':
-                qgis_feature_request.combineFilterExpression(search_expression)
+
+                # Search index first: matching feature ids from the FTS sidecar file
+                if view is not None and getattr(view, 'layer', None) is not None and view.layer.search_index:
+                    index_sql = LayerSearchIndex(view.layer, qgis_layer).filter_sql(conditions)
+                    if index_sql is not None:
+                        sql = index_sql
+
+                apply_subset_string_or_expression(qgis_layer, qgis_feature_request, sql, search_expression,
+                                                  'FieldFilterBackend')
 
 
 class QgsExpressionFilterBackend(BaseFilterBackend):
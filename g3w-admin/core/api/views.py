@@ -27,6 +27,7 @@ from qgis.core import (
 
 from core.utils.qgisapi import (
     expression_eval,
+    expression_eval_many,
     ExpressionEvalError,
     ExpressionFormDataError,
     ExpressionParseError,
@@ -188,6 +189,55 @@ class QgsExpressionLayerContextEvalView(G3WAPIView):
         return Response(result)
 
 
+class QgsExpressionLayerContextBatchEvalView(G3WAPIView):
+    """This POST only API accepts a list of QgsExpressions, a qdjango project_id and optionally a
+        QGIS layer id and a GeoJSON feature data and returns the evaluated QgsExpressions
+        in the same feature form context, in one round trip.
+
+    Mandatory payload:
+
+    `expressions`: list of QgsExpression texts to be evaluated,
+
+    Optional JSON payload:
+
+    `form_data`: GeoJSON representation of the feature currently being edited.
+    `qgs_layer_id`: QGIS layer id
+
+    Response is a list with an item for each expression: `{"result": true, "data": <value>}`
+    or `{"result": false, "error": <error message>}`.
+    """
+
+    authentication_classes = (
+        CsrfExemptSessionAuthentication,
+    )
+
+    def post(self, request, project_id, format=None):
+
+        if request.content_type != 'application/json':
+            try:
+                data = json.loads(request.data.get('_content'))
+            except:
+                raise APIExpressionEmptyError()
+        else:
+            data = request.data
+
+        expression_texts = data.get('expressions')
+        if not expression_texts or not isinstance(expression_texts, list):
+            raise APIExpressionEmptyError()
+
+        try:
+            results = expression_eval_many(
+                expression_texts, project_id, data.get('qgs_layer_id'), data.get('form_data'),
+                int(data.get('formatter', '0')))
+        except ExpressionFormDataError as ex:
+            raise APIExpressionFormDataError(str(ex))
+        except ExpressionLayerError as ex:
+            raise APIExpressionLayerError(str(ex))
+
+        return Response([{'result': True, 'data': result} if error is None else {'result': False, 'error': str(error)}
+                         for result, error in results])
+
+
 class InterfaceOws(G3WAPIView):
     """
     API interface view for client. Retrieve information about ows (i.e. wms) service
@@ -6,6 +6,7 @@ from .api.views import \
     layer_vector_view, \
     G3WSUITEInfoAPIView, \
     QgsExpressionLayerContextEvalView, \
+    QgsExpressionLayerContextBatchEvalView, \
     layer_raster_view, \
     InterfaceOws
 from .views import GroupSetOrderView, MacroGroupSetOrderView
@@ -21,6 +22,11 @@ urlpatterns = [
         r'(?P<layer_name>[-_\w\d]+).(?P<ext>zip|xls|gpx|csv|gpkg)$',
         layer_vector_view, name='core-vector-api-ext'),
 
+    # Mapbox vector tiles
+    re_path(r'^' + settings.VECTOR_URL[1:] + r'(?P<mode_call>tiles)/(?P<project_type>[-_\w\d]+)/(?P<project_id>[0-9]+)/'
+        r'(?P<layer_name>[-_\w\d]+)/(?P<z>[0-9]+)/(?P<x>[0-9]+)/(?P<y>[0-9]+)\.pbf$',
+        layer_vector_view, name='core-vector-api-tiles'),
+
     re_path(r'^' + settings.VECTOR_URL[1:] + r'(?P<mode_call>widget)/(?P<widget_type>[-_\w\d]+)/data/'
         r'(?P<project_type>[-_\w\d]+)/(?P<project_id>[0-9]+)/'
         r'(?P<layer_name>[-_\w\d]+)/$',
@@ -40,6 +46,11 @@ urlpatterns = [
     path('api/expression_eval/<int:project_id>/', login_required(QgsExpressionLayerContextEvalView.as_view()),
          name='layer-expression-eval'),
 
+    # POST only method to evaluate many QGIS Expressions in the same Project/Layer/Form context
+    path('api/expression_eval/<int:project_id>/batch/',
+         login_required(QgsExpressionLayerContextBatchEvalView.as_view()),
+         name='layer-expression-eval-batch'),
+
     # General proxy view for Client external calls, i.e. for COORS.
     # =============================================================
     path('interface/proxy/', InterfaceProxy.as_view(), name="interface-proxy"),
@@ -37,6 +37,10 @@ post_serialize_project = django.dispatch.Signal(providing_args=["app_name", "req
 # send layer seralized original object and came back only dict data changed
 after_serialized_project_layer = django.dispatch.Signal(providing_args=["layer", "request"])
 
+# signal to get the versions of data added to /api/config/ by modules receivers (post_serialize_project,
+# after_serialized_project_layer), they are into the ETag of the project config
+project_config_version = django.dispatch.Signal(providing_args=["app_name", "project", "request"])
+
 # signals pre update project
 pre_update_project = django.dispatch.Signal(providing_args=["projectType", "project"])
 
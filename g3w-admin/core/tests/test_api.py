@@ -12,6 +12,9 @@ __copyright__ = 'Copyright 2019, Gis3w'
 
 import json
 import os
+import sqlite3
+from unittest import skipIf
+from unittest.mock import patch
 
 from django.conf import settings
 from django.contrib.auth.models import User
@@ -25,6 +28,7 @@ from rest_framework.test import APIClient, APITestCase
 
 from qdjango.apps import get_qgs_project
 from core.models import Group
+from core.utils.subset import apply_subset_string_or_expression
 from qdjango.models import Layer, Project
 from base.version import get_version
 from qdjango.utils.data import QgisProject
@@ -116,6 +120,147 @@ class CoreApiTest(CoreTestBase):
         self.assertIsNone(resp["featurelocks"])
         self.assertIsNotNone(resp["vector"]["count"])
 
+    def testCoreVectorApiDataStream(self):
+        """Test core-vector-api data in streaming mode"""
+
+        response = self._testApiCall(
+            'core-vector-api', ['data', 'qdjango', '1', 'spatialite_points20190604101052075'], {'stream': 1})
+        self.assertTrue(response.streaming)
+        resp = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(resp["vector"]["count"], 2)
+        self.assertEqual(resp["vector"]["format"], "GeoJSON")
+        self.assertIsNone(resp["vector"]["fields"])
+        self.assertEqual(resp["vector"]["geometrytype"], "Point")
+        self.assertEqual(resp["vector"]["data"]["type"], "FeatureCollection")
+        self.assertDictEqual(resp["vector"]["data"]["features"][0], {"id": '1', "type": "Feature", "geometry": {
+                             "type": "Point", "coordinates": [1.980089, 28.779772]}, "properties": {"name": "a point", "pkuid": 1}})
+        self.assertDictEqual(resp["vector"]["data"]["features"][1], {"id": '2', "type": "Feature", "geometry": {
+                             "type": "Point", "coordinates": [10.685247, 44.350968]}, "properties": {"name": "another point", "pkuid": 2}})
+        self.assertTrue(resp["result"])
+        self.assertIsNone(resp["featurelocks"])
+
+        # Paginated stream returns the total count
+        response = self._testApiCall(
+            'core-vector-api', ['data', 'qdjango', '1', 'spatialite_points20190604101052075'],
+            {'stream': 1, 'page': 1, 'page_size': 1})
+        resp = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(resp["vector"]["data"]["features"]), 1)
+        self.assertEqual(resp["vector"]["count"], 2)
+
+        # stream=0 returns a standard response
+        response = self._testApiCall(
+            'core-vector-api', ['data', 'qdjango', '1', 'spatialite_points20190604101052075'], {'stream': 0})
+        self.assertFalse(response.streaming)
+
+    def testCoreVectorApiDataResolution(self):
+        """Test core-vector-api data simplified and quantized by resolution param"""
+
+        world = Layer.objects.get(name='world')
+
+        def coordinates(geometry_coordinates):
+            if isinstance(geometry_coordinates[0], (int, float)):
+                return [geometry_coordinates]
+            return [c for gc in geometry_coordinates for c in coordinates(gc)]
+
+        full = json.loads(self._testApiCall('core-vector-api', ['data', 'qdjango', '1', world.qgs_layer_id], {
+            'in_bbox': '-5,-4,12,80',
+        }).content)
+
+        # 0.1 is snapped to 0.0625 zoom band: 2 decimals
+        simplified = json.loads(self._testApiCall('core-vector-api', ['data', 'qdjango', '1', world.qgs_layer_id], {
+            'in_bbox': '-5,-4,12,80',
+            'resolution': 0.1,
+        }).content)
+
+        self.assertEqual(simplified['vector']['count'], full['vector']['count'])
+
+        full_coordinates = [c for f in full['vector']['data']['features']
+                            for c in coordinates(f['geometry']['coordinates'])]
+        simplified_coordinates = [c for f in simplified['vector']['data']['features']
+                                  for c in coordinates(f['geometry']['coordinates'])]
+
+        self.assertTrue(len(simplified_coordinates) < len(full_coordinates))
+        for c in simplified_coordinates:
+            self.assertEqual(round(c[0], 2), c[0])
+            self.assertEqual(round(c[1], 2), c[1])
+
+        # Not valid resolution
+        self.assertTrue(self.client.login(
+            username=self.test_admin1.username, password=self.test_admin1.username))
+        response = self.client.get(self._getPath('core-vector-api', ['data', 'qdjango', '1', world.qgs_layer_id]),
+                                   {'resolution': -1})
+        self.assertEqual(response.status_code, 500)
+        self.client.logout()
+
+    def testCoreVectorApiDataFieldsGeometry(self):
+        """Test core-vector-api data with fields and geometry params"""
+
+        for formatter in (0, 1):
+            resp = json.loads(self._testApiCall(
+                'core-vector-api', ['data', 'qdjango', '1', 'spatialite_points20190604101052075'],
+                {'fields': 'name,not_a_field', 'geometry': 'false', 'formatter': formatter}).content)
+
+            self.assertEqual(resp["vector"]["count"], 2)
+            feature = resp["vector"]["data"]["features"][0]
+            self.assertIsNone(feature["geometry"])
+
+            # Primary key is always fetched to build the feature id
+            self.assertEqual(feature["id"], '1')
+            self.assertEqual(sorted(feature["properties"].keys()), ['name', 'pkuid'])
+            self.assertEqual(feature["properties"]["name"], 'a point')
+
+        # Streaming mode too
+        response = self._testApiCall(
+            'core-vector-api', ['data', 'qdjango', '1', 'spatialite_points20190604101052075'],
+            {'fields': 'name', 'geometry': 0, 'stream': 1})
+        resp = json.loads(b''.join(response.streaming_content))
+        self.assertIsNone(resp["vector"]["data"]["features"][1]["geometry"])
+        self.assertEqual(sorted(resp["vector"]["data"]["features"][1]["properties"].keys()), ['name', 'pkuid'])
+
+    def testCoreVectorApiConditionalGet(self):
+        """Test core-vector-api data and config ETag"""
+
+        layer = Layer.objects.get(project_id=1, qgs_layer_id='spatialite_points20190604101052075')
+        path = reverse('core-vector-api', args=['data', 'qdjango', '1', layer.qgs_layer_id])
+
+        self.assertTrue(self.client.login(
+            username=self.test_admin1.username, password=self.test_admin1.username))
+
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Different params, different ETag
+        response = self.client.get(path, {'page': 1, 'page_size': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Config mode has its own ETag
+        response = self.client.get(
+            reverse('core-vector-api', args=['config', 'qdjango', '1', layer.qgs_layer_id]),
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Data version bump, i.e. editing commit
+        Layer.bump_data_version([layer])
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Provider not enabled: no ETag
+        with self.settings(G3WADMIN_VECTOR_API_ETAG_PROVIDERS=()):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('ETag'))
+
+        self.client.logout()
+
     def testCoreVectorApiXls(self):
         """Test core-vector-api data XLS"""
 
@@ -335,6 +480,124 @@ class CoreApiTest(CoreTestBase):
                 10.685247, 44.350968]}, 'properties': {'name': 'another point', 'pkuid': 2}}
         ])
 
+    def testCoreVectorApiFilterPushdown(self):
+        """Test filters compiled into provider SQL subset strings"""
+
+        from core.utils.subset import SubsetStringCompiler
+
+        layer = Layer.objects.get(title='spatialite_points')
+        qgis_layer = layer.qgis_layer
+        original_subset_string = qgis_layer.subsetString()
+
+        compiler = SubsetStringCompiler(qgis_layer)
+        self.assertEqual(compiler.dialect, 'sqlite')
+        self.assertEqual(compiler.ilike('name', "%it's%"), "\"name\" LIKE '%it''s%'")
+        # Integer fields are cast to text, not ASCII patterns are filtered by QGIS expressions
+        self.assertEqual(compiler.ilike('pkuid', '%1%'), "CAST(\"pkuid\" AS TEXT) LIKE '%1%'")
+        self.assertIsNone(compiler.ilike('name', '%città%'))
+        self.assertEqual(compiler.compare('pkuid', '>', '1'), '"pkuid" > 1')
+        self.assertIsNone(compiler.compare('pkuid', '>', '1; DROP TABLE x'))
+        self.assertIsNone(compiler.compare('name', 'LIKE', '%point%'))
+        self.assertIsNone(compiler.ilike('not_a_field', '%point%'))
+        self.assertIsNone(compiler.combine(['"pkuid" > 1', None]))
+
+        params = [
+            {'search': 'another'},
+            {'suggest': 'name|poin'},
+            {'field': 'name|ilike|ANOTHER'},
+            {'field': 'pkuid|gt|1|or,name|eq|a point'},
+            {'field': 'name|like|point'},
+            {'field': 'pkuid|ilike|2'},
+            {'field': 'name|ilike|POÏNT'},
+        ]
+
+        for p in params:
+            with override_settings(G3WADMIN_VECTOR_API_FILTER_PUSHDOWN=False):
+                expected = json.loads(self._testApiCall(
+                    'core-vector-api', ['data', 'qdjango', '1', 'spatialite_points20190604101052075'],
+                    p).content)['vector']['data']['features']
+
+            response = self._testApiCall(
+                'core-vector-api', ['data', 'qdjango', '1', 'spatialite_points20190604101052075'], p)
+            self.assertEqual(json.loads(response.content)['vector']['data']['features'], expected, p)
+            self.assertEqual(qgis_layer.subsetString(), original_subset_string)
+
+        # Search on every field (integer pk included) is pushed down into the subset string
+        subset_strings = []
+
+        def apply_spy(qgis_layer, *args, **kwargs):
+            pushed_down = apply_subset_string_or_expression(qgis_layer, *args, **kwargs)
+            subset_strings.append((pushed_down, qgis_layer.subsetString()))
+            return pushed_down
+
+        with patch('core.api.filters.apply_subset_string_or_expression', side_effect=apply_spy):
+            self._testApiCall('core-vector-api', ['data', 'qdjango', '1', 'spatialite_points20190604101052075'],
+                              {'search': 'another'})
+
+        self.assertTrue(subset_strings)
+        for pushed_down, subset_string in subset_strings:
+            self.assertTrue(pushed_down)
+            self.assertIn('"name" LIKE \'%another%\'', subset_string)
+            self.assertIn('CAST("pkuid" AS TEXT) LIKE \'%another%\'', subset_string)
+        self.assertEqual(qgis_layer.subsetString(), original_subset_string)
+
+    @skipIf(sqlite3.sqlite_version_info < (3, 34), 'FTS5 trigram tokenizer requires SQLite >= 3.34')
+    def testCoreVectorApiSearchIndex(self):
+        """Test field filter answered by the layer search index"""
+
+        from qdjango.models import Widget
+        from qdjango.utils.search_index import _FRESH_INDEXES, LayerSearchIndex
+
+        layer = Layer.objects.get(title='spatialite_points')
+        qgis_layer = layer.qgis_layer
+        original_subset_string = qgis_layer.subsetString()
+
+        tmp_dir = QTemporaryDir()
+        with override_settings(QDJANGO_SEARCH_INDEX_PATH=tmp_dir.path()):
+
+            widget = Widget.objects.create(
+                name='search points', widget_type='search', datasource=layer.datasource,
+                body=json.dumps({'title': 'points', 'results': [], 'dozoomtoextent': True,
+                                 'fields': [{'name': 'name', 'label': 'name', 'filterop': 'ILIKE',
+                                             'blanktext': '', 'input': {'type': 'textfield', 'options': {}}}]}))
+            widget.layers.add(layer)
+
+            # Index is built by the huey task (immediate in tests) when the flag is set
+            layer.search_index = True
+            layer.save()
+
+            index = LayerSearchIndex(layer, qgis_layer)
+            self.assertEqual(index.fields, ['name'])
+            self.assertTrue(index.is_fresh())
+            self.assertEqual(index.filter_sql([('name', 'ILIKE', '%ANOT%', 'AND')]), '"pkuid" IN (2)')
+            self.assertEqual(index.filter_sql([('name', 'ILIKE', '%nothing%', 'AND')]), '"pkuid" IS NULL')
+            self.assertIsNone(index.filter_sql([('name', 'LIKE', '%anot%', 'AND')]))
+            # SQLite LIKE doesn't fold case of non-ASCII characters
+            self.assertIsNone(index.filter_sql([('name', 'ILIKE', '%ÀNOT%', 'AND')]))
+
+            # Freshness is cached in process with the layer data version
+            self.assertEqual(_FRESH_INDEXES[layer.pk], layer.data_version)
+            with patch.object(LayerSearchIndex, '_indexed_version') as indexed_version:
+                self.assertTrue(LayerSearchIndex(layer, qgis_layer).is_fresh())
+                indexed_version.assert_not_called()
+
+            response = self._testApiCall(
+                'core-vector-api', ['data', 'qdjango', '1', 'spatialite_points20190604101052075'],
+                {'field': 'name|ilike|anot'})
+            features = json.loads(response.content)['vector']['data']['features']
+            self.assertEqual([f['id'] for f in features], ['2'])
+            self.assertEqual(qgis_layer.subsetString(), original_subset_string)
+
+            # Data changes rebuild the index
+            Layer.bump_data_version([layer], same_datasource=False)
+            layer.refresh_from_db()
+            self.assertTrue(LayerSearchIndex(layer, qgis_layer).is_fresh())
+
+            layer.search_index = False
+            layer.save()
+            self.assertFalse(os.path.exists(index.path))
+            self.assertNotIn(layer.pk, _FRESH_INDEXES)
+
     def testCoreVectorApiCombined(self):
         """Test that multiple filters get ANDed"""
 
@@ -422,6 +685,86 @@ class CoreApiTest(CoreTestBase):
         self.assertEqual(len(resp['vector']['data']['features']), 0)
         self.assertEqual(resp['vector']['count'], 36)
 
+        # Keyset pagination: same features of the page based pagination
+        paged_ids = []
+        for page in range(1, 6):
+            resp = json.loads(self._testApiCall('core-vector-api', ['data', 'qdjango', '1', world.qgs_layer_id], {
+                'in_bbox': '-5,-4,12,80',
+                'page': page,
+                'page_size': 8,
+                'ordering': 'name',
+            }).content)
+            paged_ids += [f['id'] for f in resp['vector']['data']['features']]
+
+        cursor_ids = []
+        cursor = ''
+        for __ in range(5):
+            resp = json.loads(self._testApiCall('core-vector-api', ['data', 'qdjango', '1', world.qgs_layer_id], {
+                'in_bbox': '-5,-4,12,80',
+                'cursor': cursor,
+                'page_size': 8,
+                'ordering': 'name',
+            }).content)
+            self.assertEqual(resp['vector']['count'], 36)
+            cursor_ids += [f['id'] for f in resp['vector']['data']['features']]
+            cursor = resp['vector']['next_cursor']
+
+        self.assertIsNone(cursor)
+        self.assertEqual(len(cursor_ids), 36)
+        self.assertEqual(cursor_ids, paged_ids)
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'default',
+        },
+        'vector': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'vector',
+        }
+    }, G3WADMIN_VECTOR_CACHE='vector')
+    def testPaginationCountCache(self):
+        """Test features count cache and estimate count for paginated requests"""
+
+        from core.utils.cache import get_datasource_version, invalidate_layers
+
+        world = Layer.objects.get(name='world')
+        qgis_project = get_qgs_project(world.project.qgis_file.path)
+        qgis_layer = qgis_project.mapLayer(world.qgs_layer_id)
+
+        version = get_datasource_version(world.datasource)
+        self.assertIsNotNone(version)
+
+        # Second call reads the count from cache
+        for __ in range(2):
+            resp = json.loads(self._testApiCall('core-vector-api', ['data', 'qdjango', '1', world.qgs_layer_id], {
+                'in_bbox': '-5,-4,12,80',
+                'page': 2,
+                'page_size': 8,
+            }).content)
+            self.assertEqual(len(resp['vector']['data']['features']), 8)
+            self.assertEqual(resp['vector']['count'], 36)
+
+        # Different filter, different count
+        resp = json.loads(self._testApiCall('core-vector-api', ['data', 'qdjango', '1', world.qgs_layer_id], {
+            'in_bbox': '10.60,44.34,10.70,44.36',
+            'page': 1,
+            'page_size': 8,
+        }).content)
+        self.assertEqual(resp['vector']['count'], 1)
+
+        # Estimate count without filters is the provider count
+        resp = json.loads(self._testApiCall('core-vector-api', ['data', 'qdjango', '1', world.qgs_layer_id], {
+            'page': 1,
+            'page_size': 8,
+            'count': 'estimate'
+        }).content)
+        self.assertEqual(resp['vector']['count'], qgis_layer.featureCount())
+
+        # Invalidation renews the datasource version
+        invalidate_layers([world])
+        self.assertNotEqual(get_datasource_version(world.datasource), version)
+
     def testQGISApplication(self):
         """Test global QgsApplication instance was initialized"""
 
@@ -21,21 +21,30 @@ from qdjango.models import Project
 from django.core.cache import caches
 from qdjango.models import Layer
 from .base import CoreTestBase
+from core.api.base.vector import VectorLayerSerializationPlan
 
 
 from core.utils.qgisapi import (
     get_qgis_layer,
     get_qgis_features,
     expression_eval,
+    expression_eval_many,
+    get_prepared_expression,
     ExpressionEvalError,
     ExpressionForbiddenError,
     ExpressionFormDataError,
     ExpressionLayerError,
     ExpressionProjectError,
     ExpressionParseError,
-
+    get_coordinate_transform,
+    transform_geojson_geometry,
+    server_fid,
+    ServerFidResolver,
+    get_server_fid_resolver,
 )
-from qgis.core import QgsRectangle, QgsJsonExporter
+from qgis.core import QgsRectangle, QgsJsonExporter, QgsGeometry, QgsVectorLayer, QgsFeature
+from qgis.PyQt.QtCore import QTemporaryDir
+from osgeo import ogr
 
 # Re-use test data from qdjango module
 DATASOURCE_PATH = os.path.join(os.getcwd(), 'qdjango', 'tests', 'data')
@@ -317,6 +326,98 @@ class CoreQgisApiTest(APITestCase):
         self.assertEqual(len(features), 1)
         self.assertEqual(features[0]['name'], 'another point')
 
+    def testTransformGeojsonGeometry(self):
+        """Test cached coordinate transforms and GeoJSON geometry transformation"""
+
+        ct = get_coordinate_transform(4326, 3857)
+        self.assertEqual(ct.sourceCrs().authid(), 'EPSG:4326')
+        self.assertEqual(ct.destinationCrs().authid(), 'EPSG:3857')
+
+        geometry = QgsGeometry.fromWkt('MULTIPOLYGON(((10 44, 11 44, 11 45, 10 44)))')
+        geojson = json.loads(geometry.asJson())
+        geojson['crs'] = 'EPSG:4326'
+
+        transformed = transform_geojson_geometry(geojson, ct)
+        self.assertNotIn('crs', transformed)
+        self.assertEqual(transformed['type'], 'MultiPolygon')
+
+        geometry.transform(ct)
+        for vertex, coordinates in zip(geometry.vertices(), transformed['coordinates'][0][0]):
+            self.assertAlmostEqual(vertex.x(), coordinates[0], 4)
+            self.assertAlmostEqual(vertex.y(), coordinates[1], 4)
+
+        self.assertIsNone(transform_geojson_geometry(None, ct))
+
+    def testVectorLayerSerializationPlan(self):
+        """Test per layer serialization plan"""
+
+        qgis_layer = get_qgis_layer(self.layer)
+        plan = VectorLayerSerializationPlan.get(self.layer, qgis_layer)
+        self.assertEqual(plan.field_names, qgis_layer.fields().names())
+
+        # Cached until the QGIS layer changes
+        self.assertIs(VectorLayerSerializationPlan.get(self.layer, qgis_layer), plan)
+        self.assertIsNot(VectorLayerSerializationPlan.get(self.layer, qgis_layer.clone()), plan)
+
+        for feature in get_qgis_features(qgis_layer):
+            self.assertEqual(plan.server_fid(feature), server_fid(feature, qgis_layer.dataProvider()))
+            self.assertEqual(plan.properties(feature)['name'], feature['name'])
+
+    def testServerFidResolver(self):
+        """Test batched server FIDs resolution"""
+
+        qgis_layer = get_qgis_layer(self.layer)
+        features = get_qgis_features(qgis_layer)
+        server_fids = [str(server_fid(f, qgis_layer.dataProvider())) for f in features]
+
+        resolver = ServerFidResolver(qgis_layer)
+        self.assertEqual(resolver.fids(server_fids + ['999999']), [f.id() for f in features])
+        self.assertEqual(resolver.fids(list(reversed(server_fids))), [f.id() for f in reversed(features)])
+        self.assertEqual(resolver.resolve(['999999']), {})
+
+        # One IN condition for single primary key layers
+        self.assertIn(' IN (', resolver.expression(server_fids))
+        self.assertIn(' IN (', resolver.subset_string(server_fids))
+        qgis_layer_clone = qgis_layer.clone()
+        self.assertTrue(qgis_layer_clone.setSubsetString(resolver.subset_string(server_fids[:1])))
+        self.assertEqual(qgis_layer_clone.featureCount(), 1)
+
+        # Memoized on the request
+        request = type('Request', (object, ), {})()
+        resolver = get_server_fid_resolver(qgis_layer, request)
+        self.assertIs(get_server_fid_resolver(qgis_layer, request), resolver)
+        self.assertIsNot(get_server_fid_resolver(qgis_layer_clone, request), resolver)
+
+    def testServerFidResolverFalsyPks(self):
+        """Test server FIDs resolution of features with falsy primary key values (i.e. pk 0)"""
+
+        # Composite primary key values: falsy ones are in the key
+        memory_layer = QgsVectorLayer('None?field=code:string&field=n:integer', 'pks', 'memory')
+        feature = QgsFeature(memory_layer.fields())
+        feature.setAttributes(['a', 0])
+        self.assertEqual(ServerFidResolver._server_fid_key(feature, [0, 1]), 'a@@0')
+        self.assertEqual(ServerFidResolver._server_fid_key(feature, [1]), '0')
+
+        # Single primary key layer with a pk 0 feature
+        tmp_dir = QTemporaryDir()
+        path = os.path.join(tmp_dir.path(), 'pks.gpkg')
+        ds = ogr.GetDriverByName('GPKG').CreateDataSource(path)
+        ogr_layer = ds.CreateLayer('pks', geom_type=ogr.wkbNone)
+        ogr_layer.CreateField(ogr.FieldDefn('name', ogr.OFTString))
+        for fid in (0, 1):
+            ogr_feature = ogr.Feature(ogr_layer.GetLayerDefn())
+            ogr_feature.SetFID(fid)
+            ogr_feature.SetField('name', f'feature {fid}')
+            ogr_layer.CreateFeature(ogr_feature)
+        ds = None
+
+        qgis_layer = QgsVectorLayer(f'{path}|layername=pks', 'pks', 'ogr')
+        self.assertTrue(qgis_layer.isValid())
+        resolved = ServerFidResolver(qgis_layer).resolve(['0', '1'])
+        self.assertEqual(sorted(resolved), ['0', '1'])
+        for server_fid_value, fid in resolved.items():
+            self.assertEqual(qgis_layer.getFeature(fid)['name'], f'feature {server_fid_value}')
+
     def test_expression_eval(self):
 
         self.assertEqual(expression_eval('1'), 1)
@@ -365,6 +466,29 @@ class CoreQgisApiTest(APITestCase):
         self.assertEqual(expression_eval('APPROX = 99999', project_id=layer.project_id,
                                          qgs_layer_id=layer.qgs_layer_id, form_data=json.loads(form_data)), False)
 
+        # Parsed expressions and base contexts are cached by project, layer and expression
+        expression, context = get_prepared_expression('"APPROX" * 2', layer.project, layer)
+        self.assertIs(get_prepared_expression('"APPROX" * 2', layer.project, layer)[0], expression)
+        self.assertIsNot(get_prepared_expression('"APPROX" * 2', layer.project)[0], expression)
+        self.assertEqual(context.variable('layer_id'), layer.qgs_layer_id)
+
+        # Cached expressions are evaluated with new form data
+        self.assertEqual(expression_eval('"APPROX" * 2', project_id=layer.project_id,
+                                         qgs_layer_id=layer.qgs_layer_id, form_data=json.loads(form_data)), 19410000)
+        form_data = json.loads(form_data)
+        form_data['properties']['APPROX'] = 10
+        self.assertEqual(expression_eval('"APPROX" * 2', project_id=layer.project_id,
+                                         qgs_layer_id=layer.qgs_layer_id, form_data=form_data), 20)
+
+        # Batch evaluation
+        results = expression_eval_many(['"APPROX"', 'dsa hdshk == t', 'not_valid=2', '@layer_id'],
+                                       project_id=layer.project_id, qgs_layer_id=layer.qgs_layer_id,
+                                       form_data=form_data)
+        self.assertEqual(results[0], (10, None))
+        self.assertIsInstance(results[1][1], ExpressionParseError)
+        self.assertIsInstance(results[2][1], ExpressionEvalError)
+        self.assertEqual(results[3], (layer.qgs_layer_id, None))
+
 
 @override_settings(MEDIA_ROOT=DATASOURCE_PATH)
 @override_settings(DATASOURCE_PATH=DATASOURCE_PATH)
@@ -434,3 +558,16 @@ class LayerExpressionEval(CoreTestBase):
 
         self._expression_evaluate(
             url, 'current_value(\'CAPITAL\')', "GUATEMALA", form_data, world.qgs_layer_id)
+
+        # Batch evaluation
+        response = self.client.post(
+            reverse('layer-expression-eval-batch', args=[project.pk]), {
+                'expressions': ['current_value(\'CAPITAL\')', '"APPROX" + 1', 'dsa hdshk == t'],
+                'form_data': form_data,
+                'qgs_layer_id': world.qgs_layer_id,
+            }, format='json', content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        jcontent = json.loads(response.content)
+        self.assertEqual(jcontent[0], {'result': True, 'data': 'GUATEMALA'})
+        self.assertEqual(jcontent[1], {'result': True, 'data': 9705001})
+        self.assertFalse(jcontent[2]['result'])
@@ -0,0 +1,135 @@
+# coding=utf-8
+"""Django cache utilities for vector layer API results.
+
+Cached values are stored with a key containing a *version token* of the layer datasource:
+every time the datasource data change (editing commits, project reloads) the token is renewed
+and all the cached values of the datasource become unreachable (and expire by timeout).
+
+.. note:: This program is free software; you can redistribute it and/or modify
+    it under the terms of the Mozilla Public License 2.0.
+
+"""
+
+import hashlib
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+DATASOURCE_VERSION_CACHE_KEY = 'g3w_vector_ds_version_{}'
+
+
+def get_vector_cache():
+    """
+    Return the Django cache instance set by G3WADMIN_VECTOR_CACHE setting
+    :return: Django cache instance or None if vector cache is disabled
+    """
+
+    cache_name = getattr(settings, 'G3WADMIN_VECTOR_CACHE', None)
+    if not cache_name or cache_name not in settings.CACHES:
+        return None
+    return caches[cache_name]
+
+
+def hash_parts(*parts):
+    """
+    Return md5 hexdigest of parts, used for cache keys and ETags
+    :param parts: values converted to str
+    :return: hexdigest str
+    """
+
+    h = hashlib.md5()
+    for p in parts:
+        h.update(str(p).encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def get_datasource_version(datasource):
+    """
+    Return the current version token of a layer datasource, a new one is created if not exists
+    :param datasource: layer datasource string
+    :return: str or None if vector cache is disabled
+    """
+
+    cache = get_vector_cache()
+    if cache is None:
+        return None
+
+    key = DATASOURCE_VERSION_CACHE_KEY.format(hash_parts(datasource))
+    version = cache.get(key)
+    if version is None:
+
+        # A new random token: old values cached before a key eviction never match again
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_datasource(datasource):
+    """
+    Renew the version token of a layer datasource, all values cached for it are invalidated
+    :param datasource: layer datasource string
+    :return: None
+    """
+
+    cache = get_vector_cache()
+    if cache is None:
+        return
+
+    cache.set(DATASOURCE_VERSION_CACHE_KEY.format(hash_parts(datasource)), uuid.uuid4().hex, None)
+
+
+def invalidate_layers(layers):
+    """
+    Invalidate cached values for a iterable of Layer model instances
+    :param layers: iterable of instances with a `datasource` property, i.e. qdjango Layer instances
+    :return: None
+    """
+
+    if get_vector_cache() is None:
+        return
+
+    for datasource in set([l.datasource for l in layers]):
+        invalidate_datasource(datasource)
+
+
+def vector_cache_key(prefix, datasource, *parts):
+    """
+    Build a cache key for a value related to a layer datasource
+    :param prefix: str, kind of the cached value, i.e. 'count'
+    :param datasource: layer datasource string
+    :param parts: values that identify the cached value
+    :return: str or None if vector cache is disabled
+    """
+
+    version = get_datasource_version(datasource)
+    if version is None:
+        return None
+
+    return f'g3w_vector_{prefix}_{version}_{hash_parts(*parts)}'
+
+
+def vector_cache_get(key):
+    """
+    Return cached value, None if not found or vector cache is disabled
+    """
+
+    cache = get_vector_cache()
+    if cache is None or key is None:
+        return None
+    return cache.get(key)
+
+
+def vector_cache_set(key, value):
+    """
+    Store a value into vector cache for G3WADMIN_VECTOR_CACHE_TIMEOUT seconds
+    """
+
+    cache = get_vector_cache()
+    if cache is None or key is None:
+        return
+    cache.set(key, value, getattr(settings, 'G3WADMIN_VECTOR_CACHE_TIMEOUT', 3600))
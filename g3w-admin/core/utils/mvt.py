@@ -0,0 +1,333 @@
+# coding=utf-8
+"""Mapbox Vector Tile (specification 2.1) encoder for QGIS geometries.
+
+Protobuf messages are written by hand: the MVT schema is small and this avoids
+a protobuf runtime dependency.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+    it under the terms of the Mozilla Public License 2.0.
+
+"""
+
+import json
+import struct
+
+from qgis.core import QgsGeometry, QgsRectangle, QgsWkbTypes
+
+# Default tile extent and buffer, in tile units
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+
+MVT_CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+# Half size of EPSG:3857 world extent
+WEB_MERCATOR_HALF_SIZE = 20037508.342789244
+
+# Latitude limit of EPSG:3857
+WEB_MERCATOR_MAX_LATITUDE = 85.0511287798066
+
+# Geometry types
+MVT_GEOM_POINT = 1
+MVT_GEOM_LINESTRING = 2
+MVT_GEOM_POLYGON = 3
+
+# Geometry commands
+MVT_CMD_MOVE_TO = 1
+MVT_CMD_LINE_TO = 2
+MVT_CMD_CLOSE_PATH = 7
+
+
+def tile_bounds(z, x, y):
+    """Returns the EPSG:3857 extent of a XYZ tile
+
+    :param z: zoom level
+    :type z: int
+    :param x: tile column
+    :type x: int
+    :param y: tile row (from north)
+    :type y: int
+    :return: tile extent
+    :rtype: QgsRectangle
+    """
+
+    size = 2 * WEB_MERCATOR_HALF_SIZE / (2 ** z)
+    xmin = -WEB_MERCATOR_HALF_SIZE + x * size
+    ymax = WEB_MERCATOR_HALF_SIZE - y * size
+    return QgsRectangle(xmin, ymax - size, xmin + size, ymax)
+
+
+def _varint(value):
+    """Protobuf base 128 varint of a not negative integer"""
+
+    out = bytearray()
+    while True:
+        bits = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _zigzag(value):
+    """Protobuf zigzag encoding of a signed integer"""
+
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _varint_field(field, value):
+    return _key(field, 0) + _varint(value)
+
+
+def _bytes_field(field, data):
+    return _key(field, 2) + _varint(len(data)) + data
+
+
+def _packed_field(field, values):
+    return _bytes_field(field, b''.join(_varint(v) for v in values))
+
+
+def _command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+
+def _encode_value(value):
+    """Returns the Value message of a JSON serializable value"""
+
+    if isinstance(value, bool):
+        return _varint_field(7, int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _varint_field(5, value)
+        return _varint_field(6, _zigzag(value))
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack('<d', value)
+    if not isinstance(value, str):
+        value = json.dumps(value)
+    return _bytes_field(1, value.encode('utf-8'))
+
+
+class MVTLayerEncoder(object):
+    """
+    Encode features of a single layer of a vector tile.
+    Geometries must be in EPSG:3857, they are simplified at the tile resolution,
+    clipped to the buffered tile extent and snapped to the tile grid.
+    """
+
+    def __init__(self, name, tile_rect, extent=MVT_EXTENT, buffer=MVT_BUFFER):
+        """Constructor
+
+        :param name: layer name into the tile
+        :type name: str
+        :param tile_rect: tile extent in EPSG:3857, see tile_bounds()
+        :type tile_rect: QgsRectangle
+        :param extent: tile extent in tile units, defaults to 4096
+        :type extent: int, optional
+        :param buffer: buffer around the tile in tile units, defaults to 64
+        :type buffer: int, optional
+        """
+
+        self.name = name
+        self.tile_rect = tile_rect
+        self.extent = extent
+
+        # Map units for a tile unit
+        self.resolution = tile_rect.width() / extent
+
+        buffer_size = buffer * self.resolution
+        self.buffered_rect = QgsRectangle(
+            tile_rect.xMinimum() - buffer_size, tile_rect.yMinimum() - buffer_size,
+            tile_rect.xMaximum() + buffer_size, tile_rect.yMaximum() + buffer_size)
+
+        self.features = []
+        self.keys = {}
+        self.values = {}
+
+    def _to_tile(self, point):
+        return (int(round((point.x() - self.tile_rect.xMinimum()) / self.resolution)),
+                int(round((self.tile_rect.yMaximum() - point.y()) / self.resolution)))
+
+    def _to_tile_path(self, points):
+        """Tile coordinates of a points sequence, without consecutive duplicates"""
+
+        path = []
+        for p in points:
+            tp = self._to_tile(p)
+            if not path or path[-1] != tp:
+                path.append(tp)
+        return path
+
+    @staticmethod
+    def _ring_area(ring):
+        """Surveyor's formula (doubled) in tile coordinates, positive for exterior rings"""
+
+        area = 0
+        for i in range(len(ring)):
+            x1, y1 = ring[i]
+            x2, y2 = ring[(i + 1) % len(ring)]
+            area += x1 * y2 - x2 * y1
+        return area
+
+    def _tag(self, key, value):
+        """Returns the key and value indexes of a property"""
+
+        if key not in self.keys:
+            self.keys[key] = len(self.keys)
+
+        encoded = _encode_value(value)
+        if encoded not in self.values:
+            self.values[encoded] = len(self.values)
+
+        return self.keys[key], self.values[encoded]
+
+    def _encode_paths(self, paths, close=False):
+        """Geometry commands for a list of lines or rings"""
+
+        commands = []
+        cx = cy = 0
+        for path in paths:
+            commands.append(_command(MVT_CMD_MOVE_TO, 1))
+            commands.extend([_zigzag(path[0][0] - cx), _zigzag(path[0][1] - cy)])
+            cx, cy = path[0]
+            commands.append(_command(MVT_CMD_LINE_TO, len(path) - 1))
+            for x, y in path[1:]:
+                commands.extend([_zigzag(x - cx), _zigzag(y - cy)])
+                cx, cy = x, y
+            if close:
+                commands.append(_command(MVT_CMD_CLOSE_PATH, 1))
+        return commands
+
+    def _encode_geometry(self, geometry):
+        """Returns (geometry type, geometry commands) or None if geometry is empty into the tile"""
+
+        geometry_type = geometry.type()
+        is_multi = QgsWkbTypes.isMultiType(geometry.wkbType())
+
+        if geometry_type == QgsWkbTypes.PointGeometry:
+            points = geometry.asMultiPoint() if is_multi else [geometry.asPoint()]
+            points = [p for p in points if self.buffered_rect.contains(p)]
+            if not points:
+                return None
+
+            commands = [_command(MVT_CMD_MOVE_TO, len(points))]
+            cx = cy = 0
+            for p in points:
+                x, y = self._to_tile(p)
+                commands.extend([_zigzag(x - cx), _zigzag(y - cy)])
+                cx, cy = x, y
+            return MVT_GEOM_POINT, commands
+
+        if QgsWkbTypes.isCurvedType(geometry.wkbType()):
+            geometry.convertToStraightSegment()
+
+        geometry = geometry.simplify(self.resolution).clipped(self.buffered_rect)
+        if geometry.isEmpty():
+            return None
+        is_multi = QgsWkbTypes.isMultiType(geometry.wkbType())
+
+        if geometry_type == QgsWkbTypes.LineGeometry:
+            lines = geometry.asMultiPolyline() if is_multi else [geometry.asPolyline()]
+            paths = [path for path in [self._to_tile_path(l) for l in lines] if len(path) > 1]
+            if not paths:
+                return None
+            return MVT_GEOM_LINESTRING, self._encode_paths(paths)
+
+        if geometry_type == QgsWkbTypes.PolygonGeometry:
+            polygons = geometry.asMultiPolygon() if is_multi else [geometry.asPolygon()]
+            rings = []
+            for polygon in polygons:
+                for ring_idx, ring in enumerate(polygon):
+                    path = self._to_tile_path(ring)
+
+                    # Last point is implicit (ClosePath)
+                    if len(path) > 1 and path[0] == path[-1]:
+                        path = path[:-1]
+
+                    area = self._ring_area(path) if len(path) > 2 else 0
+                    if area == 0:
+                        # A degenerated exterior ring drops the whole polygon
+                        if ring_idx == 0:
+                            break
+                        continue
+
+                    # Exterior rings clockwise (positive area), interior rings counterclockwise
+                    if (ring_idx == 0) != (area > 0):
+                        path.reverse()
+                    rings.append(path)
+
+            if not rings:
+                return None
+            return MVT_GEOM_POLYGON, self._encode_paths(rings, close=True)
+
+        return None
+
+    def add_feature(self, geometry, properties, fid=None):
+        """Add a feature to the layer
+
+        :param geometry: feature geometry in EPSG:3857
+        :type geometry: QgsGeometry
+        :param properties: JSON serializable properties, None values are skipped
+        :type properties: dict
+        :param fid: feature id, only not negative integers are encoded
+        :type fid: int, optional
+        :return: True if the feature has been added, False if it's outside the tile
+        :rtype: bool
+        """
+
+        if geometry is None or geometry.isNull():
+            return False
+
+        encoded_geometry = self._encode_geometry(QgsGeometry(geometry))
+        if encoded_geometry is None:
+            return False
+        geometry_type, commands = encoded_geometry
+
+        tags = []
+        for key, value in properties.items():
+            if value is not None:
+                tags.extend(self._tag(key, value))
+
+        feature = b''
+        try:
+            if fid is not None and int(fid) >= 0:
+                feature += _varint_field(1, int(fid))
+        except ValueError:
+            pass
+
+        if tags:
+            feature += _packed_field(2, tags)
+        feature += _varint_field(3, geometry_type)
+        feature += _packed_field(4, commands)
+
+        self.features.append(feature)
+        return True
+
+    def encode(self):
+        """Returns the Layer protobuf message
+
+        :rtype: bytes
+        """
+
+        layer = _varint_field(15, 2) + _bytes_field(1, self.name.encode('utf-8'))
+        for feature in self.features:
+            layer += _bytes_field(2, feature)
+        for key in sorted(self.keys, key=self.keys.get):
+            layer += _bytes_field(3, key.encode('utf-8'))
+        for value in sorted(self.values, key=self.values.get):
+            layer += _bytes_field(4, value)
+        layer += _varint_field(5, self.extent)
+        return layer
+
+
+def encode_tile(layers):
+    """Returns the Tile protobuf message of a list of MVTLayerEncoder instances, empty layers are skipped
+
+    :rtype: bytes
+    """
+
+    return b''.join(_bytes_field(3, l.encode()) for l in layers if l.features)
@@ -14,6 +14,11 @@ __copyright__ = 'Copyright 2020, Gis3W'
 
 import logging
 import json
+import os
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
 
 from qgis.core import QgsFeatureRequest, QgsRectangle, QgsVectorLayer
 
@@ -27,11 +32,19 @@ from qgis.core import (
     QgsExpressionContext,
     QgsFeature,
     QgsJsonUtils,
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransform,
+    QgsCoordinateTransformContext,
+    QgsPointXY,
+    QgsDataSourceUri,
+    QgsProviderRegistry,
 )
+from qgis.PyQt.QtCore import QVariant
 
 from django.utils.translation import ugettext_lazy as _
 from qdjango.apps import get_qgs_project
 from qdjango.models import Layer, Project
+from core.utils.subset import NUMBER_RE, SubsetStringCompiler
 
 logger = logging.getLogger(__file__)
 
@@ -53,9 +66,36 @@ FORBIDDEN_VARIABLES = (
 )
 
 
+# Providers where a LIKE condition can be added to the subset string (SQL WHERE)
+LIKE_PUSHDOWN_PROVIDERS = {
+    'postgres': 'ILIKE',
+    'spatialite': 'LIKE',
+    'ogr': 'LIKE',
+}
+
+# Providers with stable feature ids, deep pages are fetched by fids after a light
+# (no geometry, primary keys only) scan of the previous pages
+OFFSET_PUSHDOWN_PROVIDERS = (
+    'postgres',
+    'spatialite',
+    'ogr',
+)
+
+# Server FIDs resolved by a single feature request
+SERVER_FIDS_BATCH_SIZE = 1000
+
+
+def _server_fid_literal(field, value):
+    """Returns the expression literal of a server FID part for a primary key field"""
+
+    if field.isNumeric() and NUMBER_RE.match(value):
+        return value
+    return QgsExpression.quotedString(value)
+
 
 def expression_from_server_fids(server_fids, provider) -> str:
     """Returns a string expression from a list of server FIDs in the form <pk1>@@<pk2>...
+    Layers with a single primary key get a `"pk" IN (...)` expression, compiled by SQL providers in one query.
 
     :param server_fids: list of  server FIDs in the form <pk1>@@<pk2>...
     :type server_fids: list
@@ -65,27 +105,31 @@ def expression_from_server_fids(server_fids, provider) -> str:
     """
 
     str_exps = []
-    pk_attrs = []
-    names = provider.fields().names()
-
-    for pkidx in provider.pkAttributeIndexes():
-        pk_attrs.append(names[pkidx])
+    fields = provider.fields()
+    pk_fields = [fields.at(pkidx) for pkidx in provider.pkAttributeIndexes()]
 
     # Provider does not support pks
-    if not pk_attrs:
-        return "$id IN (%s)" % ','.join(server_fids)
+    if not pk_fields:
+        return "$id IN (%s)" % ','.join(str(f) for f in server_fids)
+
+    if len(pk_fields) == 1:
+        return '{attr_name} IN ({attr_vals})'.format(
+            attr_name=QgsExpression.quotedColumnRef(pk_fields[0].name()),
+            attr_vals=','.join(_server_fid_literal(pk_fields[0], str(f)) for f in server_fids))
 
     for server_fid in server_fids:
-        vals = server_fid.split('@@')
-        assert len(vals) == len(pk_attrs)
+        vals = str(server_fid).split('@@')
+        assert len(vals) == len(pk_fields)
         bits = []
-        for i in range(len(pk_attrs)):
-            bits.append('"{attr_name}" = \'{attr_val}\''.format(attr_name=pk_attrs[i], attr_val=vals[i]))
+        for i in range(len(pk_fields)):
+            bits.append('{attr_name} = {attr_val}'.format(
+                attr_name=QgsExpression.quotedColumnRef(pk_fields[i].name()),
+                attr_val=_server_fid_literal(pk_fields[i], vals[i])))
         str_exps.append(' ( ' + ' AND '.join(bits) + ' ) ')
 
     return ' OR '.join(str_exps)
 
-def server_fid(feature, provider) -> str:
+def server_fid(feature, provider, pk_indexes=None) -> str:
     """Returns a server FID in the form <pk1>@@<pk2>... from a feature, note that
     the feature attributes that are part of the FID needs to be evalutated and they
     need to be present in the fetched attributes
@@ -94,12 +138,18 @@ def server_fid(feature, provider) -> str:
     :type QgsFeature
     :param provider data provider
     :type QgsDataProvider
+    :param pk_indexes: primary key attribute indexes of the provider, precomputed by callers
+                       serializing many features, default to provider.pkAttributeIndexes()
+    :type pk_indexes: list
     :return a string server FID in the form <pk1>@@<pk2>...
     """
 
-    assert len(provider.pkAttributeIndexes()) <= len(feature.attributes())
+    if pk_indexes is None:
+        pk_indexes = provider.pkAttributeIndexes()
+
+    assert len(pk_indexes) <= len(feature.attributes())
     bits = []
-    for pkidx in provider.pkAttributeIndexes():
+    for pkidx in pk_indexes:
         if feature.attribute(pkidx):
             bits.append(str(feature.attribute(pkidx)))
 
@@ -110,6 +160,146 @@ def server_fid(feature, provider) -> str:
     return '@@'.join(bits)
 
 
+class ServerFidResolver(object):
+    """
+    Map server FIDs (<pk1>@@<pk2>...) of a layer to QGIS feature ids.
+    Server FIDs are resolved in batches, one feature request each, and memoized:
+    use get_server_fid_resolver() to share the resolver during a request.
+    """
+
+    def __init__(self, qgis_layer):
+        """
+        :param qgis_layer: QgsVectorLayer instance
+        """
+
+        self.qgis_layer = qgis_layer
+        self.provider = qgis_layer.dataProvider()
+        fields = self.provider.fields()
+        self.pk_fields = [fields.at(pkidx) for pkidx in self.provider.pkAttributeIndexes()]
+
+        # Server FID -> QGIS fid, None for not existing features
+        self._fids = {}
+
+    def expression(self, server_fids):
+        """
+        QGIS expression selecting features by server FIDs, see expression_from_server_fids()
+        """
+
+        return expression_from_server_fids(server_fids, self.provider)
+
+    def subset_string(self, server_fids):
+        """
+        Provider SQL selecting features by server FIDs, for layers with a single primary key
+        :return: SQL str or None if it can't be pushed down to the provider
+        """
+
+        compiler = SubsetStringCompiler(self.qgis_layer)
+        if not compiler.supported or len(self.pk_fields) != 1:
+            return None
+
+        field = self.pk_fields[0]
+        values = []
+        for server_fid in server_fids:
+            server_fid = str(server_fid)
+            if field.isNumeric():
+                if not NUMBER_RE.match(server_fid):
+                    return None
+                values.append(server_fid)
+            else:
+                value = compiler.quote_value(server_fid)
+                if value is None:
+                    return None
+                values.append(value)
+
+        if not values:
+            return None
+        return f'{compiler.quote_identifier(field.name())} IN ({",".join(values)})'
+
+    @staticmethod
+    def _server_fid_key(feature, pk_indexes):
+        """
+        Server FID of a feature as requested by expression(): every primary key value, falsy ones included
+        (server_fid() skips them, i.e. pk 0)
+        """
+
+        bits = []
+        for pkidx in pk_indexes:
+            value = feature.attribute(pkidx)
+            if value is None or (isinstance(value, QVariant) and value.isNull()):
+                continue
+            bits.append(str(value))
+        return '@@'.join(bits)
+
+    def resolve(self, server_fids):
+        """
+        Resolve server FIDs not yet memoized, SERVER_FIDS_BATCH_SIZE FIDs each feature request
+        :param server_fids: list of server FIDs
+        :return: dict, server FIDs as keys and QGIS fids as values, not existing features are missing
+        """
+
+        server_fids = [str(f) for f in server_fids]
+        missing = [f for f in dict.fromkeys(server_fids) if f not in self._fids]
+
+        for i in range(0, len(missing), SERVER_FIDS_BATCH_SIZE):
+            batch = missing[i:i + SERVER_FIDS_BATCH_SIZE]
+            for f in batch:
+                self._fids[f] = None
+
+            qgis_feature_request = QgsFeatureRequest()
+            qgis_feature_request.setFlags(QgsFeatureRequest.NoGeometry)
+
+            # Provider does not support pks: server FIDs are QGIS fids
+            if not self.pk_fields:
+                try:
+                    qgis_feature_request.setFilterFids([int(f) for f in batch])
+                except ValueError:
+                    continue
+                qgis_feature_request.setNoAttributes()
+                for feature in self.qgis_layer.getFeatures(qgis_feature_request):
+                    self._fids[str(feature.id())] = feature.id()
+                continue
+
+            pk_indexes = self.provider.pkAttributeIndexes()
+            qgis_feature_request.setFilterExpression(self.expression(batch))
+            qgis_feature_request.setSubsetOfAttributes(pk_indexes)
+            for feature in self.qgis_layer.getFeatures(qgis_feature_request):
+                self._fids[self._server_fid_key(feature, pk_indexes)] = feature.id()
+
+        return {f: self._fids[f] for f in server_fids if self._fids.get(f) is not None}
+
+    def fids(self, server_fids):
+        """
+        :param server_fids: list of server FIDs
+        :return: list of QGIS fids of existing features, in server FIDs order
+        """
+
+        resolved = self.resolve(server_fids)
+        return [resolved[f] for f in dict.fromkeys(str(f) for f in server_fids) if f in resolved]
+
+
+def get_server_fid_resolver(qgis_layer, request=None):
+    """
+    Return the server FIDs resolver of a layer, memoized on the request
+    :param qgis_layer: QgsVectorLayer instance
+    :param request: Django or DRF request, None for a new resolver
+    :rtype: ServerFidResolver
+    """
+
+    if request is None:
+        return ServerFidResolver(qgis_layer)
+
+    resolvers = getattr(request, '_server_fid_resolvers', None)
+    if resolvers is None:
+        resolvers = {}
+        request._server_fid_resolvers = resolvers
+
+    resolver = resolvers.get(qgis_layer.id())
+    if resolver is None or resolver.qgis_layer is not qgis_layer:
+        resolver = ServerFidResolver(qgis_layer)
+        resolvers[qgis_layer.id()] = resolver
+    return resolver
+
+
 def get_layer_fids_from_server_fids(server_fids, layer):
     """From a list of server_fids for a QGIS vector layer return layer fids
 
@@ -119,12 +309,8 @@ def get_layer_fids_from_server_fids(server_fids, layer):
     :rtype: list
     """
 
-    qgis_feature_request = QgsFeatureRequest()
-    exp = expression_from_server_fids(server_fids, layer.dataProvider())
-    qgis_feature_request.combineFilterExpression(exp)
-    features = get_qgis_features(layer, qgis_feature_request)
+    return ServerFidResolver(layer).fids(server_fids)
 
-    return [f.id() for f in features]
 
 def get_qgis_layer(layer_info):
     """Returns a QGIS vector layer from a layer information record.
@@ -148,19 +334,309 @@ def get_qgis_layer(layer_info):
         return QgsVectorLayer(datasource, name, provider_name)
 
 
-def __get_qgis_features(qgis_layer,
-                        qgis_feature_request=None,
-                        bbox_filter=None,
-                        attribute_filters=None,
-                        search_filter=None,
-                        with_geometry=True,
-                        page=None,
-                        page_size=None,
-                        ordering=None,
-                        exclude_fields=None,
-                        extra_expression=None,
-                        extra_subset_string=None):
-    """Private implementation for count and get"""
+def get_layer_data_file_mtime(qgis_layer):
+    """Returns the last modification time of the file storing the layer data.
+
+    For GeoPackage/SQLite files the write-ahead log file is also checked.
+
+    :param qgis_layer: QGIS layer
+    :type qgis_layer: QgsMapLayer
+    :return: modification timestamp, None if the layer is not file based
+    :rtype: float
+    """
+
+    return get_data_file_mtime(qgis_layer.providerType(), qgis_layer.source())
+
+
+def get_data_file_mtime(provider, source):
+    """Returns the last modification time of the file storing the data of a layer datasource,
+    see get_layer_data_file_mtime(). The layer is not needed, i.e. for qdjango Layer model instances.
+
+    :param provider: QGIS data provider key, i.e. 'ogr'
+    :type provider: str
+    :param source: layer datasource
+    :type source: str
+    :return: modification timestamp, None if the datasource is not file based
+    :rtype: float
+    """
+
+    try:
+        if provider == 'spatialite':
+            path = QgsDataSourceUri(source).database()
+        else:
+            path = QgsProviderRegistry.instance().decodeUri(provider, source).get('path')
+    except Exception as e:
+        logger.debug(f'Cannot decode datasource {source}: {e}')
+        return None
+
+    if not path or not os.path.isfile(path):
+        return None
+
+    mtimes = [os.path.getmtime(f) for f in (path, path + '-wal') if os.path.isfile(f)]
+    return max(mtimes)
+
+
+@lru_cache(maxsize=64)
+def _coordinate_transform(from_srid, to_srid):
+    """Process cached transform, it must not be used directly: see get_coordinate_transform()"""
+
+    return QgsCoordinateTransform(
+        QgsCoordinateReferenceSystem(f'EPSG:{from_srid}'),
+        QgsCoordinateReferenceSystem(f'EPSG:{to_srid}'),
+        QgsCoordinateTransformContext())
+
+
+def get_coordinate_transform(from_srid, to_srid):
+    """Returns a coordinate transform between two EPSG SRIDs.
+
+    Transforms are built once per process for every (source, destination) pair,
+    a copy is returned (the copy is cheap: data are implicitly shared).
+
+    :param from_srid: source EPSG code
+    :type from_srid: int
+    :param to_srid: destination EPSG code
+    :type to_srid: int
+    :return: the coordinate transform
+    :rtype: QgsCoordinateTransform
+    """
+
+    return QgsCoordinateTransform(_coordinate_transform(int(from_srid), int(to_srid)))
+
+
+def _transform_coordinates(coordinates, ct):
+    """Recursively transform GeoJSON coordinates arrays, extra dimensions are kept"""
+
+    if len(coordinates) > 0 and isinstance(coordinates[0], (int, float)):
+        point = ct.transform(QgsPointXY(coordinates[0], coordinates[1]))
+        return [point.x(), point.y()] + list(coordinates[2:])
+
+    return [_transform_coordinates(c, ct) for c in coordinates]
+
+
+def transform_geojson_geometry(geometry, ct):
+    """Returns a new GeoJSON geometry dictionary transformed by a coordinate transform,
+    without any JSON serialization round trip.
+
+    :param geometry: GeoJSON geometry
+    :type geometry: dict
+    :param ct: coordinate transform
+    :type ct: QgsCoordinateTransform
+    :return: transformed GeoJSON geometry (without 'crs' member), None if geometry is None
+    :rtype: dict
+    """
+
+    if not geometry:
+        return geometry
+
+    if geometry['type'] == 'GeometryCollection':
+        return {
+            'type': geometry['type'],
+            'geometries': [transform_geojson_geometry(g, ct) for g in geometry['geometries']]
+        }
+
+    return {
+        'type': geometry['type'],
+        'coordinates': _transform_coordinates(geometry['coordinates'], ct)
+    }
+
+
+def _iter_page_by_fids(qgis_layer, qgis_feature_request, offset, page_size):
+    """Fetches a page of features skipping the first `offset` features
+    with a light request (no geometry and primary key attributes only),
+    then the full features of the page are fetched by their fids.
+
+    :param qgis_layer: the QGIS vector layer instance
+    :type qgis_layer: QgsVectorLayer
+    :param qgis_feature_request: the QGIS feature request with limit already set
+    :type qgis_feature_request: QgsFeatureRequest
+    :param offset: number of features to skip
+    :type offset: int
+    :param page_size: number of features in the page
+    :type page_size: int
+    :return: generator of the page features, in the requested order
+    :rtype: QgsFeature generator
+    """
+
+    fids_request = QgsFeatureRequest(qgis_feature_request)
+    fids_request.setFlags(fids_request.flags() | QgsFeatureRequest.NoGeometry)
+    fids_request.setSubsetOfAttributes(qgis_layer.primaryKeyAttributes())
+
+    fids = [f.id() for f in islice(qgis_layer.getFeatures(fids_request), offset, offset + page_size)]
+    if not fids:
+        return
+
+    page_request = QgsFeatureRequest(qgis_feature_request)
+    page_request.setFilterFids(fids)
+    page_request.setOrderBy(QgsFeatureRequest.OrderBy())
+    page_request.setLimit(-1)
+
+    features = {f.id(): f for f in qgis_layer.getFeatures(page_request)}
+    for fid in fids:
+        if fid in features:
+            yield features[fid]
+
+
+def _keyset_fields(qgis_layer, qgis_feature_request):
+    """Returns the fields used by the keyset pagination: the ordering
+    field (first order by clause of the request, if it is a layer field)
+    and the first primary key field.
+
+    :param qgis_layer: the QGIS vector layer instance
+    :type qgis_layer: QgsVectorLayer
+    :param qgis_feature_request: the QGIS feature request
+    :type qgis_feature_request: QgsFeatureRequest
+    :raises ValueError: if the layer has no primary key
+    :return: ordering field name (None if ordering by pk), pk field name and ascending flag
+    :rtype: tuple
+    """
+
+    pk_attrs = qgis_layer.primaryKeyAttributes()
+    if not pk_attrs:
+        raise ValueError(_('Cursor pagination requires a layer with a primary key'))
+    pk_field = qgis_layer.fields().at(pk_attrs[0]).name()
+
+    order_field = None
+    ascending = True
+    order_by = list(qgis_feature_request.orderBy())
+    if order_by:
+        clause = order_by[0]
+        expression = clause.expression()
+        if expression.isField():
+            ascending = clause.ascending()
+            field_name = expression.rootNode().name()
+            if qgis_layer.fields().lookupField(field_name) >= 0 and field_name != pk_field:
+                order_field = field_name
+
+    return order_field, pk_field, ascending
+
+
+def _decode_cursor(cursor):
+    """Returns the ordering and primary key values from a cursor
+
+    :raises ValueError: if the cursor is not valid
+    :rtype: tuple
+    """
+
+    try:
+        order_value, pk_value = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise ValueError(_('Invalid cursor: {}').format(cursor))
+
+    return order_value, pk_value
+
+
+def validate_cursor(qgis_layer, qgis_feature_request, cursor):
+    """Checks if keyset pagination can be used for the layer and the cursor is valid
+
+    :param qgis_layer: the QGIS vector layer instance
+    :type qgis_layer: QgsVectorLayer
+    :param qgis_feature_request: the QGIS feature request
+    :type qgis_feature_request: QgsFeatureRequest
+    :param cursor: cursor returned by feature_cursor, empty for the first page
+    :type cursor: str
+    :raises ValueError: if the layer has no primary key or the cursor is not valid
+    """
+
+    _keyset_fields(qgis_layer, qgis_feature_request)
+    if cursor:
+        _decode_cursor(cursor)
+
+
+def _set_keyset_pagination(qgis_layer, qgis_feature_request, cursor):
+    """Sets ordering and filter of the QGIS feature request for the keyset
+    pagination: the filter is a comparison on indexed columns that providers
+    compile into SQL, so that every page costs the same as the first one.
+
+    :param qgis_layer: the QGIS vector layer instance
+    :type qgis_layer: QgsVectorLayer
+    :param qgis_feature_request: the QGIS feature request
+    :type qgis_feature_request: QgsFeatureRequest
+    :param cursor: cursor returned by feature_cursor, empty for the first page
+    :type cursor: str
+    """
+
+    order_field, pk_field, ascending = _keyset_fields(qgis_layer, qgis_feature_request)
+
+    # Nulls are always last
+    clauses = []
+    if order_field:
+        clauses.append(QgsFeatureRequest.OrderByClause(QgsExpression.quotedColumnRef(order_field), ascending, False))
+    clauses.append(QgsFeatureRequest.OrderByClause(QgsExpression.quotedColumnRef(pk_field), ascending, False))
+    qgis_feature_request.setOrderBy(QgsFeatureRequest.OrderBy(clauses))
+
+    if qgis_feature_request.flags() & QgsFeatureRequest.SubsetOfAttributes:
+        attrs = qgis_feature_request.subsetOfAttributes()
+        for name in (order_field, pk_field):
+            if name:
+                idx = qgis_layer.fields().lookupField(name)
+                if idx not in attrs:
+                    attrs.append(idx)
+        qgis_feature_request.setSubsetOfAttributes(attrs)
+
+    if not cursor:
+        return
+
+    order_value, pk_value = _decode_cursor(cursor)
+
+    op = '>' if ascending else '<'
+    pk_ref = QgsExpression.quotedColumnRef(pk_field)
+    pk_literal = QgsExpression.quotedValue(pk_value)
+
+    if not order_field:
+        expression = f'{pk_ref} {op} {pk_literal}'
+    else:
+        order_ref = QgsExpression.quotedColumnRef(order_field)
+        if order_value is None:
+            expression = f'{order_ref} IS NULL AND {pk_ref} {op} {pk_literal}'
+        else:
+            order_literal = QgsExpression.quotedValue(order_value)
+            expression = f'({order_ref} {op} {order_literal}) OR ' \
+                         f'({order_ref} = {order_literal} AND {pk_ref} {op} {pk_literal}) OR ' \
+                         f'({order_ref} IS NULL)'
+
+    qgis_feature_request.combineFilterExpression(expression)
+
+
+def feature_cursor(feature, qgis_layer, qgis_feature_request=None):
+    """Returns the keyset pagination cursor pointing after the feature,
+    to be passed as `cursor` to get_qgis_features for the next page.
+
+    :param feature: last feature of the current page
+    :type feature: QgsFeature
+    :param qgis_layer: the QGIS vector layer instance
+    :type qgis_layer: QgsVectorLayer
+    :param qgis_feature_request: the QGIS feature request used for the current page
+    :type qgis_feature_request: QgsFeatureRequest, optional
+    :return: an opaque url safe cursor string
+    :rtype: str
+    """
+
+    if qgis_feature_request is None:
+        qgis_feature_request = QgsFeatureRequest()
+
+    order_field, pk_field, __ = _keyset_fields(qgis_layer, qgis_feature_request)
+
+    values = []
+    for name in (order_field, pk_field):
+        values.append(json.loads(QgsJsonUtils.encodeValue(feature.attribute(name))) if name else None)
+
+    return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def __iter_qgis_features(qgis_layer,
+                         qgis_feature_request=None,
+                         bbox_filter=None,
+                         attribute_filters=None,
+                         search_filter=None,
+                         with_geometry=True,
+                         page=None,
+                         page_size=None,
+                         ordering=None,
+                         exclude_fields=None,
+                         extra_expression=None,
+                         extra_subset_string=None,
+                         cursor=None):
+    """Private generator implementation for iter, count and get"""
 
     if qgis_feature_request is None:
         qgis_feature_request = QgsFeatureRequest()
@@ -210,7 +686,14 @@ def __get_qgis_features(qgis_layer,
     offset = 0
     feature_count = qgis_layer.featureCount()
 
-    if page is not None and page_size is not None:
+    if cursor is not None:
+        # Keyset pagination: the filter and the ordering are set on a copy
+        # to leave the request untouched for the following count call
+        page_size = int(page_size) if page_size is not None else 10
+        qgis_feature_request = QgsFeatureRequest(qgis_feature_request)
+        _set_keyset_pagination(qgis_layer, qgis_feature_request, cursor)
+        qgis_feature_request.setLimit(page_size)
+    elif page is not None and page_size is not None:
         page_size = int(page_size)
         page = int(page)
         offset = page_size * (page - 1)
@@ -231,8 +714,6 @@ def __get_qgis_features(qgis_layer,
         bbox=qgis_feature_request.filterRect()
     ))
 
-    features = []
-
     original_subset_string = qgis_layer.subsetString()
     if extra_subset_string is not None:
         subset_string = original_subset_string
@@ -241,24 +722,23 @@ def __get_qgis_features(qgis_layer,
         else:
             qgis_layer.setSubsetString(extra_subset_string)
 
-    iterator = qgis_layer.getFeatures(qgis_feature_request)
-
     try:
-        for _ in range(offset):
-            next(iterator)
-        if page_size is not None:
-            for __ in range(page_size):
-                features.append(next(iterator))
+        if offset > 0 and qgis_layer.providerType() in OFFSET_PUSHDOWN_PROVIDERS:
+            yield from _iter_page_by_fids(qgis_layer, qgis_feature_request, offset, page_size)
         else:
-            while True:
-                features.append(next(iterator))
-    except StopIteration:
-        pass
+            iterator = qgis_layer.getFeatures(qgis_feature_request)
+            stop = offset + page_size if page_size is not None else None
+            for feature in islice(iterator, offset, stop):
+                yield feature
+    finally:
+        if extra_subset_string is not None:
+            qgis_layer.setSubsetString(original_subset_string)
 
-    if extra_subset_string is not None:
-        qgis_layer.setSubsetString(original_subset_string)
 
-    return features
+def __get_qgis_features(*args):
+    """Private implementation for count and get"""
+
+    return list(__iter_qgis_features(*args))
 
 
 def get_qgis_features(qgis_layer,
@@ -272,7 +752,8 @@ def get_qgis_features(qgis_layer,
                       ordering=None,
                       exclude_fields=None,
                       extra_expression=None,
-                      extra_subset_string=None):
+                      extra_subset_string=None,
+                      cursor=None):
     """Returns a list of QgsFeatures from the QGIS vector layer,
     with optional filter options.
 
@@ -306,6 +787,9 @@ def get_qgis_features(qgis_layer,
     :type: extra_expression: str, optional
     :param: extra_subset_string: extra subset string (provider side WHERE condition) for filtering features
     :type: extra_subset_string: str, optional
+    :param: cursor: keyset pagination cursor (see feature_cursor), empty string for the first page,
+        page_size features are returned ordered by the request ordering field and the primary key
+    :type: cursor: str, optional
     :return: list of features
     :rtype: QgsFeature list
     """
@@ -321,7 +805,54 @@ def get_qgis_features(qgis_layer,
                       ordering,
                       exclude_fields,
                       extra_expression,
-                      extra_subset_string)
+                      extra_subset_string,
+                      cursor)
+
+
+def iter_qgis_features(qgis_layer,
+                       qgis_feature_request=None,
+                       bbox_filter=None,
+                       attribute_filters=None,
+                       search_filter=None,
+                       with_geometry=True,
+                       page=None,
+                       page_size=None,
+                       ordering=None,
+                       exclude_fields=None,
+                       extra_expression=None,
+                       extra_subset_string=None,
+                       cursor=None):
+    """Returns a generator of QgsFeatures from the QGIS vector layer,
+    features are fetched from the provider while the generator is consumed
+    so that the memory usage does not depend on the number of features.
+
+    Accepts the same arguments of get_qgis_features.
+
+    Note: the optional extra_subset_string is set on the layer while the
+    generator is consumed and restored when it is exhausted or closed.
+
+    :param qgis_layer: the QGIS vector layer instance
+    :type qgis_layer: QgsVectorLayer
+    :param qgis_feature_request: the QGIS feature request
+    :type qgis_feature_request: QgsFeatureRequest, optional
+    :return: generator of features
+    :rtype: QgsFeature generator
+    """
+
+    return __iter_qgis_features(qgis_layer,
+                      qgis_feature_request,
+                      bbox_filter,
+                      attribute_filters,
+                      search_filter,
+                      with_geometry,
+                      page,
+                      page_size,
+                      ordering,
+                      exclude_fields,
+                      extra_expression,
+                      extra_subset_string,
+                      cursor)
+
 
 def count_qgis_features(qgis_layer,
                       qgis_feature_request=None,
@@ -389,7 +920,8 @@ def count_qgis_features(qgis_layer,
         qgis_feature_request = QgsFeatureRequest(qgis_feature_request)
         qgis_feature_request.setLimit(-1)
 
-    return len(__get_qgis_features(qgis_layer,
+    # Count while iterating, features are not kept in memory
+    return sum(1 for _ in __iter_qgis_features(qgis_layer,
                       qgis_feature_request,
                       bbox_filter,
                       attribute_filters,
@@ -403,6 +935,91 @@ def count_qgis_features(qgis_layer,
                       extra_subset_string))
 
 
+def get_qgis_unique_values(qgis_layer, field_name, qgis_feature_request=None, limit=-1, prefix=None):
+    """Returns the unique values of a layer field as JSON serializable values.
+
+    Without request filters the DISTINCT is done by the provider (SQL for postgres, spatialite
+    and ogr providers) and respects the layer subset string; a prefix on text fields is pushed down
+    as a LIKE condition of the subset string. Otherwise features are iterated fetching
+    only the field, without geometry.
+
+    :param qgis_layer: the QGIS vector layer instance
+    :type qgis_layer: QgsVectorLayer
+    :param field_name: field name
+    :type field_name: str
+    :param qgis_feature_request: the QGIS feature request with filters, defaults to None
+    :type qgis_feature_request: QgsFeatureRequest, optional
+    :param limit: max number of values, defaults to -1 (no limit)
+    :type limit: int, optional
+    :param prefix: case insensitive prefix of values, defaults to None
+    :type prefix: str, optional
+    :return: list of unique values, empty if field doesn't exist
+    :rtype: list
+    """
+
+    field_idx = qgis_layer.fields().indexOf(field_name)
+    if field_idx < 0:
+        return []
+
+    def to_json(value):
+        return json.loads(QgsJsonUtils.encodeValue(value))
+
+    no_filters = qgis_feature_request is None or (
+        qgis_feature_request.filterType() == QgsFeatureRequest.FilterNone and
+        qgis_feature_request.filterRect().isEmpty())
+
+    provider_type = qgis_layer.dataProvider().name()
+    like_pushdown = prefix and provider_type in LIKE_PUSHDOWN_PROVIDERS and \
+        qgis_layer.fields()[field_idx].type() == QVariant.String and \
+        '%' not in prefix and '_' not in prefix
+
+    if no_filters and (not prefix or like_pushdown):
+
+        original_subset_string = qgis_layer.subsetString()
+        try:
+            if prefix:
+                condition = '{} {} {}'.format(
+                    QgsExpression.quotedColumnRef(field_name),
+                    LIKE_PUSHDOWN_PROVIDERS[provider_type],
+                    QgsExpression.quotedValue(prefix + '%'))
+                qgis_layer.setSubsetString(
+                    f'({original_subset_string}) AND ({condition})' if original_subset_string else condition)
+
+            return [to_json(v) for v in qgis_layer.uniqueValues(field_idx, limit)]
+        finally:
+            if prefix:
+                qgis_layer.setSubsetString(original_subset_string)
+
+    # Fetch the field values only, without geometry
+    req = QgsFeatureRequest(qgis_feature_request) if qgis_feature_request else QgsFeatureRequest()
+    req.setOrderBy(QgsFeatureRequest.OrderBy())
+    req.setLimit(-1)
+    req.setSubsetOfAttributes([field_idx])
+    if not (req.filterType() == QgsFeatureRequest.FilterExpression and req.filterExpression().needsGeometry()):
+        req.setFlags(req.flags() | QgsFeatureRequest.NoGeometry)
+
+    if prefix:
+        prefix = prefix.lower()
+
+    values = []
+    seen = set()
+    for feature in qgis_layer.getFeatures(req):
+        encoded = QgsJsonUtils.encodeValue(feature.attribute(field_idx))
+        if encoded in seen:
+            continue
+        seen.add(encoded)
+
+        value = json.loads(encoded)
+        if prefix and (value is None or not str(value).lower().startswith(prefix)):
+            continue
+
+        values.append(value)
+        if 0 <= limit <= len(values):
+            break
+
+    return values
+
+
 class ExpressionEvalError(Exception):
     """Raised when there was an evaluation error"""
     pass
@@ -432,103 +1049,209 @@ class ExpressionForbiddenError(Exception):
     pass
 
 
-def expression_eval(expression_text, project_id=None, qgs_layer_id=None, form_data=None, formatter=0):
-    """Evaluates a QgsExpression and returns the result
+# Process cache of parsed expressions and base expression contexts, see get_prepared_expression()
+_EXPRESSIONS = OrderedDict()
+EXPRESSIONS_CACHE_SIZE = 256
+
+
+def get_prepared_expression(expression_text, project=None, layer=None):
+    """Returns the parsed QgsExpression and the base expression context (global, project and layer scopes)
+    of an expression, from the process cache if the project has not been changed or reloaded.
 
     :param expression_text: The QgsExpression text
     :type expression_text: str
-    :param project_id: ID of the qdjango project, defaults to None
-    :type project_id: int, optional
-    :param qgs_layer_id: ID of the QGIS Layer, defaults to None
-    :type qgslayer_id: str, optional
-    :param form_data: A dictionary that maps to a GeoJSON representation of the feature currently edited in the form
-    :type form_data: dict, optional
-    :param formatter: Indicate if form_data values contains formatter values or original features value.
-    :type formatter: int, optional
+    :param project: qdjango project, defaults to None
+    :type project: Project, optional
+    :param layer: qdjango layer of the project, defaults to None
+    :type layer: Layer, optional
+    :raises ExpressionForbiddenError: for forbidden functions and variables
+    :raises ExpressionParseError: for expression parse errors
+    :return: (QgsExpression, QgsExpressionContext), the context must be copied before adding scopes
+    :rtype: tuple
     """
 
-    expression = QgsExpression(expression_text)
-    expression_context = QgsExpressionContext()
+    qgis_layer = layer.qgis_layer if layer is not None else None
+    key = (project.pk if project is not None else None,
+           layer.qgs_layer_id if layer is not None else None,
+           expression_text)
+    stamp = project.modified if project is not None else None
 
-    layer = None
+    cached = _EXPRESSIONS.get(key)
+    if cached is not None and cached[0] == stamp and cached[1] is qgis_layer:
+        _EXPRESSIONS.move_to_end(key)
+        expression, expression_context = cached[2:]
+    else:
+        expression = QgsExpression(expression_text)
 
-    for func_name in expression.referencedFunctions():
-        if func_name in FORBIDDEN_FUNCTIONS:
-            raise ExpressionForbiddenError(
-                _('Function "{}" is not allowed for security reasons!').format(func_name))
+        for func_name in expression.referencedFunctions():
+            if func_name in FORBIDDEN_FUNCTIONS:
+                raise ExpressionForbiddenError(
+                    _('Function "{}" is not allowed for security reasons!').format(func_name))
 
-    for var_name in expression.referencedVariables():
-        if var_name in FORBIDDEN_VARIABLES:
-            raise ExpressionForbiddenError(
-                _('Variable "{}" is not allowed for security reasons!').format(var_name))
+        for var_name in expression.referencedVariables():
+            if var_name in FORBIDDEN_VARIABLES:
+                raise ExpressionForbiddenError(
+                    _('Variable "{}" is not allowed for security reasons!').format(var_name))
 
-    if project_id is not None:
+        if qgis_layer is not None:
+            expression_context = QgsExpressionContext(
+                QgsExpressionContextUtils.globalProjectLayerScopes(qgis_layer))
+        else:
+            expression_context = QgsExpressionContext()
+            expression_context.appendScope(QgsExpressionContextUtils.globalScope())
+            if project is not None:
+                expression_context.appendScope(
+                    QgsExpressionContextUtils.projectScope(project.qgis_project))
 
-        try:
-            project = Project.objects.get(pk=project_id)
+        _EXPRESSIONS[key] = (stamp, qgis_layer, expression, expression_context)
+        while len(_EXPRESSIONS) > EXPRESSIONS_CACHE_SIZE:
+            _EXPRESSIONS.popitem(last=False)
 
-            if qgs_layer_id is not None:
-                try:
-                    layer = project.layer_set.get(qgs_layer_id=qgs_layer_id)
-                except Layer.DoesNotExist:
-                    raise ExpressionLayerError(
-                        _('QGIS layer with id "{}" could not be found!').format(qgs_layer_id))
+    if expression.hasParserError():
+        raise ExpressionParseError(expression.parserErrorString())
 
-                expression_contex = QgsExpressionContextUtils.globalProjectLayerScopes(
-                    layer.qgis_layer)
+    return expression, expression_context
 
-            else:
-                expression_contex = QgsExpressionContextUtils.globalScope()
-                expression_context.appendScope(
-                    QgsExpressionContextUtils.projectScope(project.qgis_project))
 
-        except Project.DoesNotExist:
-            raise ExpressionProjectError(
-                _('QDjango project with id "{}" could not be found!').format(project_id))
+def _expression_project_layer(project_id=None, qgs_layer_id=None):
+    """Returns the qdjango project and layer of the expression evaluation context
 
+    :return: (Project or None, Layer or None)
+    :rtype: tuple
+    """
 
-    else:
-        expression_contex = QgsExpressionContextUtils.globalScope()
+    if project_id is None:
+        return None, None
 
-    if form_data is not None:
+    try:
+        project = Project.objects.get(pk=project_id)
+    except Project.DoesNotExist:
+        raise ExpressionProjectError(
+            _('QDjango project with id "{}" could not be found!').format(project_id))
 
-        if layer is None:
+    layer = None
+    if qgs_layer_id is not None:
+        try:
+            layer = project.layer_set.get(qgs_layer_id=qgs_layer_id)
+        except Layer.DoesNotExist:
             raise ExpressionLayerError(
-                _('A valid QGIS layer is required to process form data!'))
+                _('QGIS layer with id "{}" could not be found!').format(qgs_layer_id))
+
+    return project, layer
+
+
+def _expression_form_feature(layer, form_data, formatter=0):
+    """Returns the QgsFeature of the form data
+
+    :param layer: qdjango layer
+    :param form_data: A dictionary that maps to a GeoJSON representation of the feature currently edited in the form
+    :param formatter: Indicate if form_data values contains formatter values or original features value.
+    :rtype: QgsFeature
+    """
+
+    if layer is None:
+        raise ExpressionLayerError(
+            _('A valid QGIS layer is required to process form data!'))
+
+    try:
+        # Case by formatter
+        # formatter == 1 : get featureid from layer, usually must be used with formatter form_data
+        # formatter == 0 : default behavior
+        if formatter == 0:
+            fields = layer.qgis_layer.fields()
+            form_feature = QgsJsonUtils.stringToFeatureList(
+                json.dumps(form_data), fields, None)[0]
+
+            # Set attributes manually because QgsJsonUtils does not respect order
+            for k, v in form_data['properties'].items():
+                form_feature.setAttribute(k, v)
+        else:
+            qgis_feature_request = QgsFeatureRequest()
+            exp = expression_from_server_fids([form_data['id']], layer.qgis_layer.dataProvider())
+            qgis_feature_request.combineFilterExpression(exp)
+            form_feature = get_qgis_features(layer.qgis_layer, qgis_feature_request)[0]
+    except:
+        raise ExpressionFormDataError()
+
+    return form_feature
 
-        try:
-            # Case by formatter
-            # formatter == 1 : get featureid from layer, usually must be used with formatter form_data
-            # formatter == 0 : default behavior
-            if formatter == 0:
-                fields = layer.qgis_layer.fields()
-                form_feature = QgsJsonUtils.stringToFeatureList(
-                    json.dumps(form_data), fields, None)[0]
-
-                # Set attributes manually because QgsJsonUtils does not respect order
-                for k, v in form_data['properties'].items():
-                    form_feature.setAttribute(k, v)
-            else:
-                qgis_feature_request = QgsFeatureRequest()
-                exp = expression_from_server_fids([form_data['id']], layer.qgis_layer.dataProvider())
-                qgis_feature_request.combineFilterExpression(exp)
-                form_feature = get_qgis_features(layer.qgis_layer, qgis_feature_request)[0]
 
-            expression_context.appendScope(
-                QgsExpressionContextUtils.formScope(form_feature))
-            expression_context.setFeature(form_feature)
-        except:
-            raise ExpressionFormDataError()
+def _evaluate_prepared_expression(expression, base_context, form_feature=None):
+    """Evaluates a parsed expression on a copy of the base context with the form feature
 
-    valid, errors = expression.checkExpression(
-        expression_text, expression_context)
+    :raises ExpressionEvalError: for evaluation errors
+    """
 
-    if not valid:
-        raise ExpressionParseError(errors)
+    expression_context = QgsExpressionContext(base_context)
+    if form_feature is not None:
+        expression_context.appendScope(
+            QgsExpressionContextUtils.formScope(form_feature))
+        expression_context.setFeature(form_feature)
 
+    expression.prepare(expression_context)
     result = expression.evaluate(expression_context)
 
     if expression.hasEvalError():
         raise ExpressionEvalError(expression.evalErrorString())
 
     return result
+
+
+def expression_eval(expression_text, project_id=None, qgs_layer_id=None, form_data=None, formatter=0):
+    """Evaluates a QgsExpression and returns the result
+
+    :param expression_text: The QgsExpression text
+    :type expression_text: str
+    :param project_id: ID of the qdjango project, defaults to None
+    :type project_id: int, optional
+    :param qgs_layer_id: ID of the QGIS Layer, defaults to None
+    :type qgslayer_id: str, optional
+    :param form_data: A dictionary that maps to a GeoJSON representation of the feature currently edited in the form
+    :type form_data: dict, optional
+    :param formatter: Indicate if form_data values contains formatter values or original features value.
+    :type formatter: int, optional
+    """
+
+    project, layer = _expression_project_layer(project_id, qgs_layer_id)
+    expression, base_context = get_prepared_expression(expression_text, project, layer)
+
+    form_feature = None
+    if form_data is not None:
+        form_feature = _expression_form_feature(layer, form_data, formatter)
+
+    return _evaluate_prepared_expression(expression, base_context, form_feature)
+
+
+def expression_eval_many(expression_texts, project_id=None, qgs_layer_id=None, form_data=None, formatter=0):
+    """Evaluates many QgsExpressions in the same context: project, layer and form data are loaded once.
+    Errors of single expressions don't stop the evaluation of the others.
+
+    :param expression_texts: The QgsExpression texts
+    :type expression_texts: list
+    :param project_id: ID of the qdjango project, defaults to None
+    :type project_id: int, optional
+    :param qgs_layer_id: ID of the QGIS Layer, defaults to None
+    :type qgslayer_id: str, optional
+    :param form_data: A dictionary that maps to a GeoJSON representation of the feature currently edited in the form
+    :type form_data: dict, optional
+    :param formatter: Indicate if form_data values contains formatter values or original features value.
+    :type formatter: int, optional
+    :return: list of (result, exception or None) tuples, in the order of expression_texts
+    :rtype: list
+    """
+
+    project, layer = _expression_project_layer(project_id, qgs_layer_id)
+
+    form_feature = None
+    if form_data is not None:
+        form_feature = _expression_form_feature(layer, form_data, formatter)
+
+    results = []
+    for expression_text in expression_texts:
+        try:
+            expression, base_context = get_prepared_expression(expression_text, project, layer)
+            results.append((_evaluate_prepared_expression(expression, base_context, form_feature), None))
+        except (ExpressionForbiddenError, ExpressionParseError, ExpressionEvalError) as ex:
+            results.append((None, ex))
+
+    return results
@@ -3,9 +3,13 @@ from django.http.response import HttpResponse
 from django.http import FileResponse
 from django.core.files import File
 from django.core.exceptions import PermissionDenied
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django_file_form.uploader import FileFormUploadBackend
 import os
 
+from core.utils.cache import hash_parts
+
 def send_file(output_filename, content_type, file, attachment=True):
     """
     Send a Django HttpRensponse with attached file
@@ -17,6 +21,52 @@ def send_file(output_filename, content_type, file, attachment=True):
     return FileResponse(open(file, 'rb'), filename=output_filename, as_attachment=attachment)
 
 
+def build_etag(*parts):
+    """
+    Build a strong ETag value from parts
+    :param parts: values identifying the response content, i.e. data version, request params, user.
+    :return: quoted ETag string
+    """
+
+    return quote_etag(hash_parts(*parts))
+
+
+def not_modified_response(request, etag):
+    """
+    Check If-None-Match request header against ETag
+    :param request: Django or DjangoREST request instance.
+    :param etag: quoted ETag of the current response content.
+    :return: a 304 HttpResponseNotModified if the client copy is fresh, otherwise None.
+    """
+
+    if request.method not in ('GET', 'HEAD'):
+        return None
+
+    # Only If-None-Match is checked: ACL changes are in the ETag but not in the Last-Modified date
+    if 'HTTP_IF_NONE_MATCH' not in request.META:
+        return None
+
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        set_conditional_headers(response, etag)
+    return response
+
+
+def set_conditional_headers(response, etag, last_modified=None):
+    """
+    Set ETag, Last-Modified and Cache-Control headers: clients and proxies have to revalidate every time.
+    :param response: Django HttpResponse instance.
+    :param etag: quoted ETag string.
+    :param last_modified: timestamp of last content modification, optional.
+    :return: the response
+    """
+
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 class G3WFileFormUploadBackend(FileFormUploadBackend):
     """ Extend default upload backend class of django-file-form module """
 
@@ -0,0 +1,261 @@
+# coding=utf-8
+"""Compiler of vector API filters into provider native SQL subset strings.
+
+Filters compiled into SQL are added to the layer subset string (the WHERE clause sent to the data source)
+so the database can use its indexes, filters that can't be translated are applied as QGIS expressions.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+    it under the terms of the Mozilla Public License 2.0.
+
+"""
+
+import logging
+import re
+
+from django.conf import settings
+from qgis.core import QgsFields
+from qgis.PyQt.QtCore import QVariant
+
+logger = logging.getLogger(__name__)
+
+# SQL dialects: postgres and SQLite (spatialite provider, GeoPackage and SQLite files of ogr provider)
+DIALECT_POSTGRES = 'postgres'
+DIALECT_SQLITE = 'sqlite'
+
+# OGR drivers with a SQLite native SQL dialect for attribute filters
+SQLITE_OGR_DRIVERS = ('GPKG', 'SQLite')
+
+# Comparison operators of FieldFilterBackend
+SQL_COMPARATORS = ('=', '>', '<', '<>', '>=', '<=', 'LIKE', 'ILIKE')
+
+# Field types with the same text form in SQL and in QGIS expressions
+INTEGER_TYPES = (QVariant.Int, QVariant.UInt, QVariant.LongLong, QVariant.ULongLong)
+
+NUMBER_RE = re.compile(r'^-?\d+(\.\d+)?([eE][-+]?\d+)?$')
+
+
+class SubsetStringCompiler(object):
+    """
+    Translate filter conditions into a SQL WHERE clause for the data provider of a layer.
+    Every method returns None when the condition can't be pushed down to the provider
+    with the same result of the QGIS expression.
+    """
+
+    def __init__(self, qgis_layer):
+        """
+        :param qgis_layer: QgsVectorLayer instance
+        """
+
+        self.qgis_layer = qgis_layer
+        self.dialect = self._get_dialect()
+
+    def _get_dialect(self):
+        """
+        Return SQL dialect of the layer provider, None if filters can't be pushed down
+        """
+
+        if not getattr(settings, 'G3WADMIN_VECTOR_API_FILTER_PUSHDOWN', True):
+            return None
+
+        provider = self.qgis_layer.dataProvider()
+        if provider is None or not self.qgis_layer.isValid():
+            return None
+
+        provider_type = self.qgis_layer.providerType()
+        if provider_type == 'postgres':
+            return DIALECT_POSTGRES
+        if provider_type == 'spatialite':
+            return DIALECT_SQLITE
+        if provider_type == 'ogr' and provider.storageType() in SQLITE_OGR_DRIVERS:
+            return DIALECT_SQLITE
+
+        return None
+
+    @property
+    def supported(self):
+        """True if filters can be pushed down to the layer provider"""
+
+        return self.dialect is not None
+
+    def quote_identifier(self, identifier):
+        """Returns a SQL identifier enclosed by double quotes"""
+
+        return '"%s"' % identifier.replace('"', '""')
+
+    def quote_value(self, value):
+        """
+        Returns a SQL string literal enclosed by single quotes.
+        Postgres literals with backslashes are not pushed down: their meaning depends on
+        `standard_conforming_strings` server setting.
+        """
+
+        if self.dialect == DIALECT_POSTGRES and '\\' in value:
+            return None
+        return "'%s'" % value.replace("'", "''")
+
+    def _field(self, field_name):
+        """
+        Return the provider field of the layer, None for joined, virtual or not existing fields
+        """
+
+        fields = self.qgis_layer.fields()
+        idx = fields.lookupField(field_name)
+        if idx < 0 or fields.fieldOrigin(idx) != QgsFields.OriginProvider:
+            return None
+        return fields.field(idx)
+
+    def _like_field(self, field_name):
+        """
+        Return the SQL of a provider field for LIKE conditions, None if its text form can be different
+        from the QGIS one: QGIS expressions compare not string fields with LIKE by their QGIS string
+        representation, it is the same of the SQL cast to text only for integer fields (not for dates and floats).
+        """
+
+        field = self._field(field_name)
+        if field is None:
+            return None
+
+        identifier = self.quote_identifier(field.name())
+        if field.type() == QVariant.String:
+            return identifier
+        if field.type() in INTEGER_TYPES:
+            if self.dialect == DIALECT_POSTGRES:
+                return f'{identifier}::text'
+            return f'CAST({identifier} AS TEXT)'
+        return None
+
+    def ilike(self, field_name, pattern):
+        """
+        Case insensitive LIKE condition
+        :param field_name: layer field name
+        :param pattern: LIKE pattern, i.e. '%value%'
+        :return: SQL str or None
+        """
+
+        if not self.supported:
+            return None
+
+        field_sql = self._like_field(field_name)
+        value = self.quote_value(pattern)
+        if field_sql is None or value is None:
+            return None
+
+        # SQLite LIKE is case insensitive only for ASCII characters
+        if self.dialect == DIALECT_SQLITE and not pattern.isascii():
+            return None
+
+        operator = 'ILIKE' if self.dialect == DIALECT_POSTGRES else 'LIKE'
+        return f'{field_sql} {operator} {value}'
+
+    def compare(self, field_name, operator, value):
+        """
+        Comparison condition
+        :param field_name: layer field name
+        :param operator: one of SQL_COMPARATORS
+        :param value: str value, patterns for LIKE and ILIKE
+        :return: SQL str or None
+        """
+
+        if not self.supported or operator not in SQL_COMPARATORS:
+            return None
+
+        if operator == 'ILIKE':
+            return self.ilike(field_name, value)
+
+        if operator == 'LIKE':
+
+            # SQLite LIKE is case insensitive, QGIS LIKE is not
+            field_sql = self._like_field(field_name)
+            if self.dialect == DIALECT_SQLITE or field_sql is None:
+                return None
+            sql_value = self.quote_value(value)
+            return None if sql_value is None else f'{field_sql} LIKE {sql_value}'
+
+        field = self._field(field_name)
+        if field is None:
+            return None
+
+        if field.isNumeric():
+            if not NUMBER_RE.match(value.strip()):
+                return None
+            sql_value = value.strip()
+        else:
+            sql_value = self.quote_value(value)
+            if sql_value is None:
+                return None
+
+        return f'{self.quote_identifier(field.name())} {operator} {sql_value}'
+
+    def combine(self, conditions, operator='AND'):
+        """
+        Combine conditions, return None if one of them is None
+        :param conditions: list of SQL str or None
+        :param operator: 'AND' or 'OR'
+        """
+
+        if operator not in ('AND', 'OR') or not conditions or None in conditions:
+            return None
+        return f' {operator} '.join(f'({c})' for c in conditions)
+
+
+def fid_subset_string(qgis_layer, fids, exclude=False):
+    """
+    Provider SQL selecting (or excluding) features by QGIS feature id
+
+    :param qgis_layer: QgsVectorLayer instance
+    :param fids: iterable of QGIS feature ids
+    :param exclude: select features not in fids
+    :return: SQL str, '' if no filter is needed, None if the provider has not a usable feature id column
+    """
+
+    provider = qgis_layer.dataProvider()
+    if provider is None or qgis_layer.providerType() not in ('postgres', 'spatialite', 'ogr'):
+        return None
+
+    pks = provider.pkAttributeIndexes()
+    compiler = SubsetStringCompiler(qgis_layer)
+
+    # Feature ids are the values of a single integer primary key
+    if len(pks) == 1 and qgis_layer.fields().at(pks[0]).type() in (QVariant.Int, QVariant.LongLong):
+        column = compiler.quote_identifier(qgis_layer.fields().at(pks[0]).name())
+    elif qgis_layer.providerType() == 'ogr' and provider.storageType() not in SQLITE_OGR_DRIVERS:
+        # OGR SQL special field
+        column = 'FID'
+    else:
+        return None
+
+    fids = sorted(set(int(fid) for fid in fids))
+    if not fids:
+        return '' if exclude else f'{column} IS NULL'
+    return f'{column} {"NOT IN" if exclude else "IN"} ({",".join(str(fid) for fid in fids)})'
+
+
+def apply_subset_string_or_expression(qgis_layer, qgis_feature_request, sql, expression, filter_name=''):
+    """
+    Add the SQL to the layer subset string, if it's None or the provider refuses it
+    the QGIS expression is added to the feature request.
+    The caller view must restore the original layer subset string.
+
+    :param qgis_layer: QgsVectorLayer instance
+    :param qgis_feature_request: QgsFeatureRequest instance
+    :param sql: provider SQL WHERE clause or None
+    :param expression: QGIS expression with the same filter
+    :param filter_name: filter name for logging
+    :return: True if the filter has been pushed down to the provider
+    """
+
+    if sql:
+        original_subset_string = qgis_layer.subsetString()
+        subset_string = f'({original_subset_string}) AND ({sql})' if original_subset_string else sql
+        if qgis_layer.setSubsetString(subset_string):
+            logger.debug(f'[FILTER PUSHDOWN] {filter_name} on layer {qgis_layer.id()}: subset string {sql}')
+            return True
+
+        qgis_layer.setSubsetString(original_subset_string)
+        logger.debug(f'[FILTER PUSHDOWN] {filter_name} on layer {qgis_layer.id()}: subset string refused by '
+                     f'provider, expression fallback')
+    else:
+        logger.debug(f'[FILTER PUSHDOWN] {filter_name} on layer {qgis_layer.id()}: expression fallback')
+
+    qgis_feature_request.combineFilterExpression(expression)
+    return False
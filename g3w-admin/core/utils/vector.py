@@ -89,6 +89,30 @@ class BaseUserMediaHandler(object):
         else:
             return '{}://{}'.format(schema, self.request.get_host())
 
+    def media_value(self, value, mime_types=None):
+        """
+        Build the client value of a media field
+        :param value: media url of the field
+        :param mime_types: optional dict to memoize mime types by file path
+        :return: dict {'value': <url>, 'mime_type': <mime type>}
+        """
+
+        file_name = self.get_file_name(value)
+        if file_name:
+            file_name = urllib.parse.unquote(file_name)
+
+        if mime_types is None:
+            mime_types = {}
+
+        path_file = '{}/{}'.format(self.get_path_to_save(), file_name)
+        if path_file not in mime_types:
+            mime_types[path_file] = file_path_mime(path_file) if os.path.exists(path_file) else None
+
+        return {
+            'value': value,
+            'mime_type': mime_types[path_file]
+        }
+
     def new_value(self, change=False):
         """ Build and save media value from client """
 
@@ -109,11 +133,7 @@ class BaseUserMediaHandler(object):
 
                 if change:
                     if self.feature_properties[field]:
-                        self.feature_properties[field] = {
-                            'value': self.feature_properties[field],
-                            'mime_type': file_path_mime(path_file_to_save) if os.path.exists(path_file_to_save)
-                            else None
-                        }
+                        self.feature_properties[field] = self.media_value(self.feature_properties[field])
 
                 else:
 
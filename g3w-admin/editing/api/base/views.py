@@ -21,7 +21,8 @@ from core.api.base.vector import MetadataVectorLayer
 from core.api.base.views import BaseVectorApiView
 from core.signals import (post_save_maplayer, pre_delete_maplayer,
                           pre_save_maplayer)
-from core.utils.qgisapi import server_fid, get_layer_fids_from_server_fids
+from core.utils.qgisapi import server_fid, get_server_fid_resolver
+from core.utils.cache import invalidate_layers
 from editing.models import (EDITING_POST_DATA_ADDED, EDITING_POST_DATA_DELETED,
                             EDITING_POST_DATA_UPDATED)
 from editing.utils import LayerLock
@@ -29,7 +30,9 @@ from editing.utils.data import clear_session_for_uploaded_files
 from qdjango.apps import get_qgs_project
 from qdjango.models import Layer
 from qdjango.utils.data import QGIS_LAYER_TYPE_NO_GEOM
+from qdjango.utils.ows_cache import invalidate_ows_cache
 from qdjango.utils.validators import feature_validator
+from usersmanage.utils import get_project_permissions
 
 from qgis.PyQt.QtCore import QDateTime, QDate, QTime
 
@@ -141,17 +144,20 @@ class BaseEditingVectorOnModelApiView(BaseVectorApiView):
         # try to get layer model object from metatada_layer
         layer = getattr(metadata_layer, 'layer', self.layer)
 
+        # Permissions of the user on all project layers, loaded once for the request
+        perms = get_project_permissions(self.request, self.layer.project)
+
         if EDITING_POST_DATA_ADDED in post_layer_data and len(post_layer_data[EDITING_POST_DATA_ADDED]) > 0:
-            if not self.request.user.has_perm('qdjango.add_feature', layer):
+            if not perms.has_perm('qdjango.add_feature', layer):
                 raise ValidationError(_('Sorry but your user doesn\'t has \'Add Feature\' capability'))
 
         if EDITING_POST_DATA_DELETED in post_layer_data and len(post_layer_data[EDITING_POST_DATA_DELETED]) > 0:
-            if not self.request.user.has_perm('qdjango.delete_feature', layer):
+            if not perms.has_perm('qdjango.delete_feature', layer):
                 raise ValidationError(_('Sorry but your user doesn\'t has \'Delete Feature\' capability'))
 
         if EDITING_POST_DATA_UPDATED in post_layer_data and len(post_layer_data[EDITING_POST_DATA_UPDATED]) > 0:
-            if not self.request.user.has_perm('qdjango.change_feature', layer) and \
-                    not self.request.user.has_perm('qdjango.change_attr_feature', layer):
+            if not perms.has_perm('qdjango.change_feature', layer) and \
+                    not perms.has_perm('qdjango.change_attr_feature', layer):
                 raise ValidationError(
                     _('Sorry but your user doesn\'t has \'Change or Change Attributes Features\' capability'))
 
@@ -175,6 +181,12 @@ class BaseEditingVectorOnModelApiView(BaseVectorApiView):
         # Get the layer
         qgis_layer = metadata_layer.qgis_layer
 
+        # Resolve server fids of updated and deleted features in batch
+        fid_resolver = get_server_fid_resolver(qgis_layer, self.request)
+        fid_resolver.resolve(
+            [str(f['id']) for f in post_layer_data.get(EDITING_POST_DATA_UPDATED, [])] +
+            [str(id) for id in post_layer_data.get(EDITING_POST_DATA_DELETED, [])])
+
         for mode_editing in (EDITING_POST_DATA_ADDED, EDITING_POST_DATA_UPDATED):
 
             if mode_editing in post_layer_data:
@@ -226,7 +238,7 @@ class BaseEditingVectorOnModelApiView(BaseVectorApiView):
 
                             # add patch for shapefile type, geojson_feature['id'] id int() instead of str()
                             # path to fix into QGIS api
-                            geojson_feature['id'] = get_layer_fids_from_server_fids([str(geojson_feature['id'])], qgis_layer)[0]
+                            geojson_feature['id'] = fid_resolver.fids([str(geojson_feature['id'])])[0]
                             feature.setId(geojson_feature['id'])
 
                             # Get feature from data provider before update
@@ -426,7 +438,7 @@ class BaseEditingVectorOnModelApiView(BaseVectorApiView):
             fids = post_layer_data[EDITING_POST_DATA_DELETED]
 
             # get feature fids from server fids from client.
-            fids = get_layer_fids_from_server_fids([str(id) for id in fids], qgis_layer)
+            fids = fid_resolver.fids([str(id) for id in fids])
 
             for feature_id in fids:
 
@@ -573,6 +585,13 @@ class BaseEditingVectorOnModelApiView(BaseVectorApiView):
                 'errors': str(e)
             })
 
+        # Data can be changed also on errors (without transactions every layer is committed by itself):
+        # invalidate cached vector results (i.e. features count) of the layer and its relations
+        committed_layers = [self.layer] + [mr.layer for mr in self.metadata_relations.values()]
+        invalidate_layers(committed_layers)
+        Layer.bump_data_version(committed_layers)
+        invalidate_ows_cache(set(l.project_id for l in committed_layers))
+
         try:
             self.results.update({
                 'response': {
@@ -11,7 +11,7 @@ from django.conf import settings
 from django.dispatch import receiver
 from django.contrib.auth.signals import user_logged_out
 from django.template import loader
-from django.db.models.signals import pre_delete
+from django.db.models.signals import pre_delete, post_save, post_delete
 from core.signals import load_layer_actions, initconfig_plugin_start, after_serialized_project_layer, \
     pre_save_maplayer, post_save_maplayer, pre_delete_maplayer, load_js_modules, before_return_vector_data_layer
 from core.utils.qgisapi import get_qgis_layer
@@ -19,6 +19,7 @@ from qdjango.api.projects.serializers import QGIS_LAYER_TYPE_NO_GEOM
 from qdjango.vector import LayerVectorView, MODE_CONFIG
 from qdjango.models import GeoConstraintRule
 from qdjango.utils.structure import datasource2dict
+from usersmanage.utils import get_project_permissions
 from .models import G3WEditingFeatureLock, \
     G3WEditingLayer, \
     G3WEditingLog, \
@@ -85,7 +86,9 @@ def set_initconfig_value(sender, **kwargs):
     Set base editing data for initconfig
     """
     Project = apps.get_app_config(kwargs['projectType']).get_model('project')
-    project_layers = {pl.pk: pl for pl in Project.objects.get(pk=kwargs['project']).layer_set.all()}
+    project = Project.objects.get(pk=kwargs['project'])
+    perms = get_project_permissions(sender.request, project)
+    project_layers = {pl.pk: pl for pl in perms.layers}
 
     # get every layer editable for the project, il list == 0 return
     layers_to_edit = G3WEditingLayer.objects.filter(app_name=kwargs['projectType'])
@@ -94,7 +97,7 @@ def set_initconfig_value(sender, **kwargs):
     for el in layers_to_edit:
 
         # check for permissions
-        if el.layer_id in project_layers and sender.request.user.has_perm('change_layer', project_layers[el.layer_id]):
+        if el.layer_id in project_layers and perms.has_perm('change_layer', project_layers[el.layer_id]):
             editable_layers_id.append(el.layer_id)
 
             # check if layers has constraints
@@ -157,7 +160,7 @@ def add_editable_capability(sender, **kwargs):
         G3WEditingLayer.objects.get(app_name=layer._meta.app_label, layer_id=layer.pk)
 
         # check permission
-        if kwargs['request'].user.has_perm('qdjango.change_layer', layer):
+        if get_project_permissions(kwargs['request'], layer.project).has_perm('qdjango.change_layer', layer):
             data['values']['capabilities'] = sender.data['capabilities'] | settings.EDITABLE
         else:
             logger.info(f"Layer {layer.qgs_layer_id} is not editable for user {kwargs['request'].user}")
@@ -180,6 +183,18 @@ def pre_delete_layer(sender, **kwargs):
                 pass
 
 
+@receiver(post_save, sender=G3WEditingLayer)
+@receiver(post_delete, sender=G3WEditingLayer)
+def update_editing_layer_data_version(sender, **kwargs):
+    """
+    Editing layer settings are into vector API config response: bump layer data version (new ETag)
+    """
+
+    instance = kwargs['instance']
+    if instance.app_name == 'qdjango':
+        Layer.bump_data_version(Layer.objects.filter(pk=instance.layer_id), same_datasource=False)
+
+
 @receiver(post_save_maplayer)
 @receiver(pre_delete_maplayer)
 def log_editing_layer(sender, **kwargs):
@@ -316,8 +331,9 @@ def add_atomic_capabilities(**kwargs):
     }
 
     try:
+        perms = get_project_permissions(kwargs['sender'].request, layer.project)
         for ap in EDITING_ATOMIC_PERMISSIONS:
-            if kwargs['sender'].request.user.has_perm(ap, layer):
+            if perms.has_perm(ap, layer):
                 toret['capabilities'].append(ap)
         return toret
     except:
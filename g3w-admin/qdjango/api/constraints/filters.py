@@ -10,6 +10,8 @@ __author__ = 'elpaso@itopen.it'
 __date__ = '2020-04-21'
 __copyright__ = 'Copyright 2020, Gis3W'
 
+from django.conf import settings
+
 from core.api.filters import BaseFilterBackend
 from qdjango.models import ConstraintSubsetStringRule, ConstraintExpressionRule, GeoConstraintRule
 
@@ -67,6 +69,7 @@ class GeoConstraintsFilter(BaseFilterBackend):
         qgis_layer = metadata_layer.qgis_layer
 
         rule_parts = []
+        bbox = None
 
         rules = GeoConstraintRule.get_active_constraints_for_user(request.user, view.layer,
                                                                   context=getattr(view, 'context', 'v'))
@@ -75,8 +78,18 @@ class GeoConstraintsFilter(BaseFilterBackend):
             expression = rule.get_qgis_expression()
             if expression:
                 rule_parts.append(expression)
+                rule_bbox = rule.get_constraint_bbox()
+                bbox = rule_bbox if bbox is None else bbox.intersect(rule_bbox)
 
         if rule_parts:
             expression = ' AND '.join(rule_parts)
 
             qgis_feature_request.combineFilterExpression(expression)
+
+            # Bounding box prefilter (spatial index), features outside it can't satisfy the predicate
+            if getattr(settings, 'EDITING_CONSTRAINT_SPATIAL_PREDICATE', 'contains') != 'disjoint' \
+                    and bbox is not None and not bbox.isEmpty():
+                if not qgis_feature_request.filterRect().isNull():
+                    bbox = bbox.intersect(qgis_feature_request.filterRect())
+                if not bbox.isEmpty():
+                    qgis_feature_request.setFilterRect(bbox)
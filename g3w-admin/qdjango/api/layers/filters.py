@@ -14,7 +14,8 @@ __copyright__ = 'Copyright 2015 - 2020, Gis3w'
 import logging
 
 from core.api.filters import BaseFilterBackend
-from core.utils.qgisapi import get_qgs_project, expression_from_server_fids
+from core.utils.qgisapi import get_qgs_project, expression_from_server_fids, get_server_fid_resolver
+from core.utils.subset import apply_subset_string_or_expression
 from django.conf import settings
 from qdjango.models import SessionTokenFilter, Layer
 
@@ -118,12 +119,13 @@ class FidFilter(BaseFilterBackend):
             logger.error('FidFilter: %s' % (e,))
             return
 
-        if multiple:
-            exp = expression_from_server_fids(fids, qgis_layer.dataProvider())
-        else:
-            exp = expression_from_server_fids([fid], qgis_layer.dataProvider())
+        if not multiple:
+            fids = [fid]
 
-        qgis_feature_request.combineFilterExpression(exp)
+        # Many fids: one `IN (...)` condition, sent to the provider if possible
+        resolver = get_server_fid_resolver(qgis_layer, request)
+        apply_subset_string_or_expression(qgis_layer, qgis_feature_request, resolver.subset_string(fids),
+                                          resolver.expression(fids), 'FidFilter')
 
 
 class SingleLayerSessionTokenFilter(BaseFilterBackend):
@@ -148,15 +150,17 @@ class SingleLayerSessionTokenFilter(BaseFilterBackend):
             return
 
         try:
-            expression_text = SessionTokenFilter.get_expr_for_token(
+            session_filter = SessionTokenFilter.get_filter_for_token(
                 filtertoken, view.layer)
         except Exception:
             return
 
-        if not expression_text:
+        if session_filter is None or session_filter.is_empty:
             return
 
-        qgis_feature_request.combineFilterExpression(expression_text)
+        # Feature ids are sent to the provider if possible
+        apply_subset_string_or_expression(qgis_layer, qgis_feature_request, session_filter.subset_string(qgis_layer),
+                                          session_filter.expression, 'SingleLayerSessionTokenFilter')
 
 
 class ColumnAclFilter(BaseFilterBackend):
@@ -3,7 +3,7 @@ from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 from rest_framework.fields import empty
-from guardian.shortcuts import get_objects_for_user, get_anonymous_user
+from guardian.shortcuts import get_anonymous_user
 from owslib.wms import WebMapService
 from qdjango.models import Project, Layer, Widget, SessionTokenFilter
 from qdjango.utils.data import QGIS_LAYER_TYPE_NO_GEOM
@@ -19,6 +19,7 @@ from core.api.serializers import update_serializer_data
 from core.utils.structure import RELATIONS_ONE_TO_MANY
 from core.utils.qgisapi import get_qgis_layer, count_qgis_features
 from core.utils.general import clean_for_json
+from usersmanage.utils import get_project_permissions
 
 from qgis.core import (
     QgsJsonUtils,
@@ -299,11 +300,11 @@ class ProjectSerializer(G3WRequestSerializer, serializers.ModelSerializer):
         # Get layer which request.user can view:
         if self.request:
             view_layer_ids = list(
-                set([l.qgs_layer_id for l in get_objects_for_user(self.request.user, 'qdjango.view_layer', Layer).
-                     filter(project=instance)]).union(set(
-                         [l.qgs_layer_id for l in get_objects_for_user(get_anonymous_user(), 'qdjango.view_layer', Layer).
-                          filter(project=instance)]
-                     ))
+                set([l.qgs_layer_id for l in get_project_permissions(self.request, instance).
+                    layers_with_perm('qdjango.view_layer')]).union(set(
+                        [l.qgs_layer_id for l in get_project_permissions(self.request, instance, get_anonymous_user()).
+                            layers_with_perm('qdjango.view_layer')]
+                    ))
             )
 
         # add layers data, widgets
@@ -16,10 +16,11 @@ from django.urls import reverse
 from django.core.files.storage import default_storage
 from core.api.authentication import CsrfExemptSessionAuthentication
 from core.utils.response import send_file
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from guardian.shortcuts import get_anonymous_user
 from core.api.base.views import G3WAPIView
-from qdjango.apps import get_qgs_project
+from qdjango.apps import get_qgs_project, get_project_cache_stats
 from qdjango.models import Project
 from qdjango.signals import reading_layer_model
 
@@ -290,3 +291,19 @@ class QdjangoPrjThemeAPIview(G3WAPIView):
             self.results.result = False
 
         return Response(self.results.results)
+
+
+class QdjangoProjectCacheStatsAPIView(G3WAPIView):
+    """
+    API return the statistics of the QGIS Server projects cache of the process serving the request
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, **kwargs):
+
+        self.results.results.update({
+            'stats': get_project_cache_stats()
+        })
+
+        return Response(self.results.results)
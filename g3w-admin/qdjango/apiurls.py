@@ -35,7 +35,8 @@ from .api.geoconstraints.views import (
 from .api.projects.views import (
     QdjangoWebServicesAPIview,
     QdjangoAsGeoTiffAPIview,
-    QdjangoPrjThemeAPIview
+    QdjangoPrjThemeAPIview,
+    QdjangoProjectCacheStatsAPIView
 )
 
 
@@ -199,6 +200,10 @@ urlpatterns = [
     re_path(r'^api/prjtheme/(?P<project_id>\d+)/(?P<theme_name>[-_\w\d\s]+)/$',
         QdjangoPrjThemeAPIview.as_view(), name='qdjango-prjtheme-api'),
 
+    # QGIS Server projects cache statistics of the current process
+    path('api/projectcache/stats/', login_required(QdjangoProjectCacheStatsAPIView.as_view()),
+         name='qdjango-project-cache-stats-api'),
+
     # Order
     # ============================================================
     path('jx/project/<int:project_id>/setorder/', login_required(ProjectSetOrderView.as_view()),
@@ -1,13 +1,20 @@
 import logging
 import os
 import glob
+import hashlib
 import importlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
 
 from core.utils.general import getAuthPermissionContentType
 from django.apps import AppConfig, apps
 from django.dispatch import receiver
 from django.conf import settings
+from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import request_finished, request_started
 from django.db.models.signals import post_migrate
 from qgis.core import QgsApplication, QgsProject, QgsPathResolver
 from qgis.server import QgsServer, QgsServerSettings, QgsConfigCache
@@ -87,12 +94,120 @@ def init_qgis():
     QGS_SERVER = QgsServer()
 
 
+# Projects loaded into the QGIS Server cache of this process, path as key, least recently used first
+_CACHED_PROJECTS = OrderedDict()
+
+# Statistics of the QGIS Server projects cache of this process
+PROJECT_CACHE_STATS = {
+    'hits': 0,
+    'misses': 0,
+    'load_time': 0.0,
+    'max_load_time': 0.0,
+    'evictions': 0,
+}
+
+
+def get_project_cache_stats():
+    """Returns the statistics of the QGIS Server projects cache of this process
+
+    :return: dict with hits, misses, load times (seconds), evictions and cached projects paths
+    :rtype: dict
+    """
+
+    stats = dict(PROJECT_CACHE_STATS)
+    stats.update({
+        'pid': os.getpid(),
+        'avg_load_time': stats['load_time'] / stats['misses'] if stats['misses'] else 0.0,
+        'rss': _get_process_rss(),
+        'projects': list(_CACHED_PROJECTS.keys()),
+    })
+    return stats
+
+
+def _get_process_rss():
+    """Returns the resident memory of this process in MB, None if it's not available"""
+
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+# Projects resolved by the current request, path as key
+_REQUEST_PROJECTS = threading.local()
+
+
+def begin_request_projects():
+    """Starts the memo of projects resolved by a request: get_qgs_project() checks
+    and validates a project only the first time it's called by the request"""
+
+    _REQUEST_PROJECTS.projects = {}
+
+
+def end_request_projects():
+    """Ends the memo of projects resolved by a request"""
+
+    _REQUEST_PROJECTS.projects = None
+
+
+def _get_request_projects():
+    """Returns the projects resolved by the current request, None outside requests"""
+
+    return getattr(_REQUEST_PROJECTS, 'projects', None)
+
+
+@receiver(request_started)
+def _request_started(sender, **kwargs):
+    begin_request_projects()
+
+
+@receiver(request_finished)
+def _request_finished(sender, **kwargs):
+    end_request_projects()
+
+
+def _evict_projects(current_path):
+    """Removes the least recently used projects from the cache when QDJANGO_PROJECT_CACHE_SIZE projects
+    or QDJANGO_PROJECT_CACHE_MAX_RSS process memory (MB) are exceeded. The current project is never removed.
+
+    :param current_path: path of the project of the current request
+    :type current_path: str
+    """
+
+    # Projects used by the current request are not removed
+    memo = _get_request_projects()
+    candidates = [p for p in _CACHED_PROJECTS if p != current_path and (memo is None or p not in memo)]
+
+    max_projects = getattr(settings, 'QDJANGO_PROJECT_CACHE_SIZE', None)
+    while max_projects and candidates and len(_CACHED_PROJECTS) > max(max_projects, 1):
+        path = candidates.pop(0)
+        logger.info('QGIS Server projects cache size exceeded, removing: %s' % path)
+        remove_project_from_cache(path)
+        PROJECT_CACHE_STATS['evictions'] += 1
+
+    # Memory is not released at once: one project per call
+    max_rss = getattr(settings, 'QDJANGO_PROJECT_CACHE_MAX_RSS', None)
+    if max_rss and candidates:
+        rss = _get_process_rss()
+        if rss is not None and rss > max_rss:
+            path = candidates[0]
+            logger.info('QGIS Server process memory %.0f MB exceeded, removing: %s' % (rss, path))
+            remove_project_from_cache(path)
+            PROJECT_CACHE_STATS['evictions'] += 1
+
+
 def remove_project_from_cache(path):
     """Removes a project from server's cache
 
     :param path: project path
     :type path: str
     """
+    _CACHED_PROJECTS.pop(path, None)
+    memo = _get_request_projects()
+    if memo is not None:
+        memo.pop(path, None)
     QgsConfigCache.instance().removeEntry(path)
     QGS_SERVER.serverInterface().capabilitiesCache().removeCapabilitiesDocument(path)
     logger.warning(
@@ -109,13 +224,24 @@ class ProjectCacheInvalidator():
 
     WARNING: this logic may introduce a significant slowdown on each server
              request due to the time which is necessary to check the project file
-             timestamp.
+             timestamp: set G3WADMIN_CACHE_INVALIDATOR_STAT_INTERVAL to check
+             every project file at most once in the interval, or use project
+             change events (QDJANGO_PROJECT_EVENTS_CACHE).
     """
 
     __CACHED_PROJECTS = {}
+    __LAST_CHECKS = {}
 
     @classmethod
     def check_cache(cls, path):
+
+        interval = getattr(settings, 'G3WADMIN_CACHE_INVALIDATOR_STAT_INTERVAL', 0)
+        if interval:
+            now = time.monotonic()
+            if path in cls.__LAST_CHECKS and now - cls.__LAST_CHECKS[path] < interval:
+                return
+            cls.__LAST_CHECKS[path] = now
+
         try:
             stat_info = os.stat(path)
         except FileNotFoundError:
@@ -138,11 +264,132 @@ class ProjectCacheInvalidator():
             cls.__CACHED_PROJECTS[path] = mtime
 
 
-def get_qgs_project(path):
-    """Reads and returns a project from the cache, trying to load it
-    if it's not there.
+class ProjectChangeEvents():
+    """Project change events shared between processes through the Django cache
+    set by QDJANGO_PROJECT_EVENTS_CACHE setting (i.e. Redis or Memcached).
 
-    A None is returned if the project could not be loaded.
+    Every project change renews a version token of the project file and increments
+    a global events counter: processes read the counter at most once every
+    QDJANGO_PROJECT_EVENTS_INTERVAL seconds and, only when it's changed, the
+    version tokens of their cached projects. Changed projects are removed from cache.
+    """
+
+    EVENTS_CACHE_KEY = 'qdjango_project_events'
+    VERSION_CACHE_KEY = 'qdjango_project_file_version_{}'
+
+    # Last events counter read by this process and time of the read
+    _events = None
+    _last_check = None
+
+    # Version tokens of cached projects, path as key
+    _versions = {}
+
+    @staticmethod
+    def get_cache():
+        """Returns the Django cache instance set by QDJANGO_PROJECT_EVENTS_CACHE setting, None if not set"""
+
+        cache_name = getattr(settings, 'QDJANGO_PROJECT_EVENTS_CACHE', None)
+        if not cache_name or cache_name not in settings.CACHES:
+            return None
+        return caches[cache_name]
+
+    @classmethod
+    def _version_key(cls, path):
+        return cls.VERSION_CACHE_KEY.format(hashlib.md5(path.encode('utf-8')).hexdigest())
+
+    @classmethod
+    def broadcast(cls, path):
+        """Notifies to every process the change of a project file, the project is removed
+        at once from the cache of the current process
+
+        :param path: project path
+        :type path: str
+        """
+
+        if path in _CACHED_PROJECTS:
+            remove_project_from_cache(path)
+
+        cache = cls.get_cache()
+        if cache is None:
+            return
+
+        cache.set(cls._version_key(path), uuid.uuid4().hex, None)
+        cache.add(cls.EVENTS_CACHE_KEY, 0, None)
+        try:
+            cache.incr(cls.EVENTS_CACHE_KEY)
+        except ValueError:
+            cache.set(cls.EVENTS_CACHE_KEY, 1, None)
+
+    @classmethod
+    def remember(cls, path):
+        """Stores the current version token of a project file, before loading it
+
+        :param path: project path
+        :type path: str
+        """
+
+        cache = cls.get_cache()
+        if cache is not None:
+            cls._versions[path] = cache.get(cls._version_key(path))
+
+    @classmethod
+    def check(cls):
+        """Removes from the cache the projects changed by other processes, throttled by
+        QDJANGO_PROJECT_EVENTS_INTERVAL setting
+        """
+
+        cache = cls.get_cache()
+        if cache is None:
+            return
+
+        now = time.monotonic()
+        if cls._last_check is not None and \
+                now - cls._last_check < getattr(settings, 'QDJANGO_PROJECT_EVENTS_INTERVAL', 1):
+            return
+        cls._last_check = now
+
+        events = cache.get(cls.EVENTS_CACHE_KEY)
+        if events == cls._events:
+            return
+        cls._events = events
+
+        paths = [p for p in _CACHED_PROJECTS.keys() if p in cls._versions]
+        versions = cache.get_many([cls._version_key(p) for p in paths])
+        for path in paths:
+            if versions.get(cls._version_key(path)) != cls._versions[path]:
+                logger.debug('pid: %s QGIS Server project changed by another process: %s' % (os.getpid(), path))
+                remove_project_from_cache(path)
+                del(cls._versions[path])
+
+
+def _validate_project(project, path):
+    """Checks the layers of a project just loaded, the project is read again
+    if it has invalid virtual layers
+
+    :param project: the QgsProject instance, it must be the current instance
+    :type project: QgsProject
+    :param path: the filesystem path to the project
+    :type path: str
+    """
+
+    # Workaround for virtual layers bug  https://github.com/qgis/QGIS/pull/38488#issuecomment-692190106
+    needs_reload = False
+    for l in list(project.mapLayers().values()):
+        if not l.isValid():
+            logger.warning('Invalid layer %s found in project %s' % (
+                l.id(), project.fileName()))
+            if l.dataProvider().name() == 'virtual':
+                needs_reload = True
+                logger.warning('Invalid virtual layer found in project %s: %s' % (
+                    project.fileName(), l.publicSource()))
+    if needs_reload:
+        logger.warning('Reload project %s' % project.fileName())
+        QgsProject.instance().read(path)
+
+
+def _load_qgs_project(path):
+    """Reads a project from the cache, it's loaded and validated if it's not there
+    or it has been changed
 
     :param path: the filesystem path to the project
     :type path: str
@@ -150,45 +397,94 @@ def get_qgs_project(path):
     :rtype: QgsProject or None
     """
 
-    try:
+    # Call process events in case the project has been updated and the cache
+    # needs rebuilt. This triggers the QGIS server internal cache manager that
+    # invalidates the cache if the file has changed. QGIS internal implementation
+    # does not work reliably with project that are stored on network mounted
+    # volumes, in that case we need to use our own cache manager, enable it with
+    # G3WADMIN_USE_CUSTOM_CACHE_INVALIDATOR=True
 
-        # Call process events in case the project has been updated and the cache
-        # needs rebuilt. This triggers the QGIS server internal cache manager that
-        # invalidates the cache if the file has changed. QGIS internal implementation
-        # does not work reliably with project that are stored on network mounted
-        # volumes, in that case we need to use our own cache manager, enable it with
-        # G3WADMIN_USE_CUSTOM_CACHE_INVALIDATOR=True
+    QgsApplication.instance().processEvents()
 
-        QgsApplication.instance().processEvents()
+    # Projects changed by other processes
+    ProjectChangeEvents.check()
 
-        if USE_CUSTOM_CACHE_INVALIDATOR:
-            ProjectCacheInvalidator.check_cache(path)
+    if USE_CUSTOM_CACHE_INVALIDATOR:
+        ProjectCacheInvalidator.check_cache(path)
 
-        project = QgsConfigCache.instance().project(path, QGS_SERVER_SETTINGS)
+    if path not in _CACHED_PROJECTS:
+        ProjectChangeEvents.remember(path)
 
-        # This is required after QGIS 3.10.11, see https://github.com/qgis/QGIS/pull/38488#issuecomment-692190106
-        if project is not None and project != QgsProject.instance():
+    start = time.time()
+    project = QgsConfigCache.instance().project(path, QGS_SERVER_SETTINGS)
+    if project is None:
+        return None
+
+    # Loaded or reloaded by QGIS Server (i.e. project file changed)
+    loaded = _CACHED_PROJECTS.get(path) is not project
+    if loaded:
+        load_time = time.time() - start
+        PROJECT_CACHE_STATS['misses'] += 1
+        PROJECT_CACHE_STATS['load_time'] += load_time
+        PROJECT_CACHE_STATS['max_load_time'] = max(PROJECT_CACHE_STATS['max_load_time'], load_time)
+        logger.debug('QGIS Server project loaded in %.2f seconds: %s' % (load_time, path))
+    else:
+        PROJECT_CACHE_STATS['hits'] += 1
+
+    _CACHED_PROJECTS[path] = project
+    _CACHED_PROJECTS.move_to_end(path)
+
+    # This is required after QGIS 3.10.11, see https://github.com/qgis/QGIS/pull/38488#issuecomment-692190106
+    if project != QgsProject.instance():
+
+        try:
+            QgsProject.setInstance(project)
+
+            # Layers are checked only once, after loading
+            if loaded:
+                _validate_project(project, path)
+        except AttributeError:  # Temporary workaround for 3.10.10
+            logger.warning(
+                'Project reloaded because QgsProject.setInstance() is not available in this QGIS version: %s' % path)
+            QgsProject.instance().read(path)
+
+    _evict_projects(path)
+
+    return QgsProject.instance()
+
+
+def get_qgs_project(path):
+    """Reads and returns a project from the cache, trying to load it
+    if it's not there.
+
+    During a request the project is checked (file changes, layers validity) only at the
+    first call, next calls return it from the request memo.
+
+    A None is returned if the project could not be loaded.
 
+    :param path: the filesystem path to the project
+    :type path: str
+    :return: the QgsProject instance or None
+    :rtype: QgsProject or None
+    """
+
+    try:
+
+        memo = _get_request_projects()
+        if memo is not None and path in memo:
+            project = memo[path]
+            if project == QgsProject.instance():
+                return project
             try:
-                # Workaround for virtual layers bug  https://github.com/qgis/QGIS/pull/38488#issuecomment-692190106
                 QgsProject.setInstance(project)
-                needs_reload = False
-                for l in list(project.mapLayers().values()):
-                    if not l.isValid():
-                        logger.warning('Invalid layer %s found in project %s' % (
-                            l.id(), project.fileName()))
-                        if l.dataProvider().name() == 'virtual':
-                            needs_reload = True
-                            logger.warning('Invalid virtual layer found in project %s: %s' % (
-                                project.fileName(), l.publicSource()))
-                if needs_reload:
-                    logger.warning('Reload project %s' % project.fileName())
-                    QgsProject.instance().read(path)
+                return project
             except AttributeError:  # Temporary workaround for 3.10.10
-                logger.warning(
-                    'Project reloaded because QgsProject.setInstance() is not available in this QGIS version: %s' % path)
-                QgsProject.instance().read(path)
-        return QgsProject.instance()
+                pass
+
+        project = _load_qgs_project(path)
+        if memo is not None and project is not None:
+            memo[path] = project
+        return project
     except Exception as ex:
         logger.warning('There was an error loading the project from path: %s, this is normally due to unavailable layers. If this is unexpected, please turn on and check server debug logs for further details.\n%s.' % (path, ex))
         return None
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from qdjango.models import Project
+from qdjango.utils.layer_indexes import INDEX_PROVIDERS, LayerIndexManager
+
+
+class Command(BaseCommand):
+    """
+    This command reports missing spatial and attribute indexes of file based layers (OGR, SpatiaLite)
+    of projects and optionally builds them.
+    """
+
+    help = 'Report missing spatial and attribute indexes of file based layers, build them with --repair'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', dest='projects', type=int, nargs='*', help='Project ids, default all')
+        parser.add_argument('--repair', action='store_true', help='Build missing indexes')
+        parser.add_argument('--unknown', action='store_true',
+                            help='With --repair build also attribute indexes with unknown status (i.e. Shapefile)')
+
+    def handle(self, *args, **options):
+
+        projects = Project.objects.all()
+        if options['projects']:
+            projects = projects.filter(pk__in=options['projects'])
+
+        missing = 0
+        for project in projects:
+            for layer in project.layer_set.filter(layer_type__in=INDEX_PROVIDERS, parent_project__isnull=True):
+
+                manager = LayerIndexManager(layer)
+                try:
+                    report = manager.report()
+                except Exception as e:
+                    self.stderr.write(self.style.ERROR(f'{project.title} / {layer.name}: {e}'))
+                    continue
+
+                if not (report['spatial'] or report['attributes'] or report['unknown']):
+                    continue
+
+                missing += 1
+                self.stdout.write(
+                    f'{project.title} / {layer.name}: spatial index {"missing" if report["spatial"] else "ok"}, '
+                    f'missing attribute indexes {report["attributes"]}, unknown {report["unknown"]}')
+
+                if options['repair']:
+                    created = manager.repair(unknown=options['unknown'])
+                    self.stdout.write(self.style.SUCCESS(
+                        f'  spatial index {"created" if created["spatial"] else "unchanged"}, '
+                        f'attribute indexes created {created["attributes"]}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Layers with missing indexes: {missing}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from qdjango.utils.render_workers import RenderWorker
+
+
+class Command(BaseCommand):
+    """
+    This command starts a QGIS Server render worker, listening for OWS requests forwarded by Django processes.
+    Workers addresses must be listed into QDJANGO_RENDER_WORKERS setting.
+    """
+
+    help = 'Start a QGIS Server render worker listening on a unix socket path or host:port address'
+
+    def add_arguments(self, parser):
+        parser.add_argument('address', help='Unix socket path or host:port, one of QDJANGO_RENDER_WORKERS')
+
+    def handle(self, *args, **options):
+
+        self.stdout.write(self.style.SUCCESS(f'Render worker listening on {options["address"]}'))
+        RenderWorker(options['address']).serve_forever()
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.27 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qdjango', '0100_auto_20220504_0756'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='layer',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Data version'),
+        ),
+        migrations.AddField(
+            model_name='layer',
+            name='data_modified',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Data last modified'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.27 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qdjango', '0101_layer_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='layer',
+            name='search_index',
+            field=models.BooleanField(blank=True, default=False, help_text='Build a text index on fields of layer search widgets', verbose_name='Search index'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.27 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qdjango', '0102_layer_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessiontokenfilterlayer',
+            name='fids',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sessiontokenfilterlayer',
+            name='fids_exclude',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='sessiontokenfilterlayer',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='sessiontokenfilterlayer',
+            name='qgs_expr',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
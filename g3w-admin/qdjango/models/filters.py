@@ -16,14 +16,149 @@ from django.utils.http import int_to_base36
 from django.utils.crypto import salted_hmac
 from usersmanage.models import User
 from .projects import Layer
+from array import array
+from collections import OrderedDict
 from datetime import datetime
 import time
 import six
+import zlib
 import logging
 
 
 logger = logging.getLogger(__name__)
 
+# Process cache of compiled session filters by SessionTokenFilterLayer.filter_cache_key
+_SESSION_FILTERS = OrderedDict()
+SESSION_FILTERS_CACHE_SIZE = 64
+
+
+def pack_fids(fids):
+    """Returns a compact binary representation of a set of feature ids:
+    zlib compressed deltas of the sorted ids
+
+    :param fids: iterable of int
+    :rtype: bytes
+    """
+
+    deltas = array('q')
+    previous = 0
+    for fid in sorted(set(fids)):
+        deltas.append(fid - previous)
+        previous = fid
+    return zlib.compress(deltas.tobytes())
+
+
+def unpack_fids(data):
+    """Returns the sorted feature ids packed by pack_fids()
+
+    :param data: bytes
+    :rtype: list
+    """
+
+    deltas = array('q')
+    deltas.frombytes(zlib.decompress(bytes(data)))
+    fids = []
+    current = 0
+    for delta in deltas:
+        current += delta
+        fids.append(current)
+    return fids
+
+
+def parse_fids(fids):
+    """Returns a list of feature ids from a comma separated string
+
+    :param fids: str, i.e. '1,2,3'
+    :raises ValueError: if an id is not an integer
+    :rtype: list
+    """
+
+    return [int(fid) for fid in str(fids).split(',') if fid.strip() != '']
+
+
+class SessionLayerFilter(object):
+    """
+    Compiled session filter of a layer: a set of feature ids to select (or to exclude)
+    or, for filters saved as QGIS expressions, the expression
+    """
+
+    def __init__(self, key, fids=None, exclude=False, expression=''):
+        """
+        :param key: SessionTokenFilterLayer.filter_cache_key
+        :param fids: feature ids, None for expression filters
+        :param exclude: True if features ids are excluded
+        :param expression: QGIS expression of expression filters
+        """
+
+        self.key = key
+        self.fids = frozenset(fids) if fids is not None else None
+        self.exclude = exclude
+        self._expression = expression
+        self._subset_strings = {}
+
+    @property
+    def is_empty(self):
+        """True if the filter doesn't filter any feature"""
+
+        if self.fids is None:
+            return not self._expression
+        return self.exclude and not self.fids
+
+    @property
+    def expression(self):
+        """QGIS expression of the filter, feature ids are checked by g3w_session_fids() custom function"""
+
+        if self.fids is None:
+            return self._expression
+        return f"g3w_session_fids('{self.key}')"
+
+    def contains(self, fid):
+        """True if the feature id passes the filter"""
+
+        return (fid in self.fids) != self.exclude
+
+    def subset_string(self, qgis_layer):
+        """Provider SQL of the filter, None if it can't be pushed down to the layer provider
+
+        :param qgis_layer: QgsVectorLayer instance
+        :rtype: str
+        """
+
+        from core.utils.subset import SubsetStringCompiler, fid_subset_string
+
+        if self.fids is None:
+            return None
+
+        layer_id = qgis_layer.id()
+        if layer_id not in self._subset_strings:
+
+            # Long ids lists only for SQL databases, OGR SQL evaluates them feature by feature
+            sql = None
+            if SubsetStringCompiler(qgis_layer).supported:
+                sql = fid_subset_string(qgis_layer, self.fids, self.exclude)
+            self._subset_strings[layer_id] = sql
+
+        return self._subset_strings[layer_id]
+
+    @classmethod
+    def get(cls, key):
+        """Returns a compiled filter by cache key, loaded from DB if it's not into the process cache
+
+        :param key: SessionTokenFilterLayer.filter_cache_key
+        :rtype: SessionLayerFilter or None if the filter doesn't exist anymore
+        """
+
+        session_filter = _SESSION_FILTERS.get(key)
+        if session_filter is not None:
+            return session_filter
+
+        try:
+            pk, version = [int(p) for p in key.split(':')]
+            stf_layer = SessionTokenFilterLayer.objects.get(pk=pk, version=version)
+        except (ValueError, SessionTokenFilterLayer.DoesNotExist):
+            return None
+        return stf_layer.get_filter()
+
 
 class SessionTokenFilter(models.Model):
     """
@@ -64,21 +199,36 @@ class SessionTokenFilter(models.Model):
                                                    force_update=force_update, using=using, update_fields=update_fields)
 
     @classmethod
-    def get_expr_for_token(cls, token, layer):
-        """Fetch qgis expression by filter token"""
+    def get_filter_for_token(cls, token, layer):
+        """Fetch the compiled session filter by filter token
 
-        stf_layers = SessionTokenFilterLayer.objects.filter(session_token_filter__token=token, layer=layer)
+        :param token: filter token
+        :param layer: qdjango Layer instance or pk
+        :rtype: SessionLayerFilter or None
+        """
+
+        # Packed ids are loaded only if the compiled filter is not cached
+        stf_layers = SessionTokenFilterLayer.objects.filter(
+            session_token_filter__token=token, layer_id=getattr(layer, 'pk', layer)).defer('fids')
         c = len(stf_layers)
         if c == 0:
             logger.error(
                 f"A qgis expression with this filtertoken '{token}' doesn't exists: skipping filtering!")
-            return ""
+            return None
         elif c > 1:
             logger.error(
-                f"More than one token or more expressions for this layer '{layer.qgs_layer_id}' exist: skipping filtering!")
-            return ""
+                f"More than one token or more expressions for this layer '{getattr(layer, 'qgs_layer_id', layer)}' exist: "
+                f"skipping filtering!")
+            return None
         else:
-            return stf_layers[0].qgs_expr
+            return stf_layers[0].get_filter()
+
+    @classmethod
+    def get_expr_for_token(cls, token, layer):
+        """Fetch qgis expression by filter token"""
+
+        session_filter = cls.get_filter_for_token(token, layer)
+        return session_filter.expression if session_filter is not None else ""
 
     class Meta:
         app_label = 'qdjango'
@@ -91,7 +241,83 @@ class SessionTokenFilterLayer(models.Model):
 
     session_token_filter = models.ForeignKey(SessionTokenFilter, on_delete=models.CASCADE, related_name='stf_layers')
     layer = models.ForeignKey(Layer, on_delete=models.CASCADE)
-    qgs_expr = models.TextField()
+    qgs_expr = models.TextField(blank=True, default='')
+
+    # Feature ids filter: packed feature ids (see pack_fids()) to select or, if fids_exclude, to exclude
+    fids = models.BinaryField(null=True, blank=True)
+    fids_exclude = models.BooleanField(default=False)
+
+    # Incremented on every update, part of the compiled filter cache key
+    version = models.PositiveIntegerField(default=0)
+
+    @property
+    def filter_cache_key(self):
+        """Key of the compiled filter into the process cache"""
+
+        return f'{self.pk}:{self.version}'
+
+    def update_fids(self, fidsin=None, fidsout=None):
+        """Restrict the filter to fidsin or exclude fidsout from it.
+        Filters saved as QGIS expressions are updated appending `$id IN (...)` or `$id NOT IN (...)`.
+
+        :param fidsin: list of feature ids to keep
+        :param fidsout: list of feature ids to exclude
+        """
+
+        if self.qgs_expr:
+            expr = f'$id IN ({",".join(str(f) for f in fidsin)})' if fidsin \
+                else f'$id NOT IN ({",".join(str(f) for f in fidsout)})'
+            self.qgs_expr = f'{self.qgs_expr} AND {expr}'
+        else:
+            current = set(unpack_fids(self.fids)) if self.fids is not None else None
+            if fidsin:
+                fidsin = set(fidsin)
+                if current is None:
+                    fids = fidsin
+                elif self.fids_exclude:
+                    fids = fidsin - current
+                else:
+                    fids = current & fidsin
+                self.fids_exclude = False
+            else:
+                fidsout = set(fidsout)
+                if current is None:
+                    fids = fidsout
+                    self.fids_exclude = True
+                elif self.fids_exclude:
+                    fids = current | fidsout
+                else:
+                    fids = current - fidsout
+            self.fids = pack_fids(fids)
+
+        self.version += 1
+
+    def get_filter(self):
+        """Returns the compiled filter, feature ids filters from the process cache if available
+
+        :rtype: SessionLayerFilter
+        """
+
+        key = self.filter_cache_key
+
+        # Filters saved as QGIS expressions
+        if self.qgs_expr:
+            return SessionLayerFilter(key, expression=self.qgs_expr)
+
+        if key in _SESSION_FILTERS:
+            _SESSION_FILTERS.move_to_end(key)
+            return _SESSION_FILTERS[key]
+
+        if self.fids is not None:
+            session_filter = SessionLayerFilter(key, fids=unpack_fids(self.fids), exclude=self.fids_exclude)
+        else:
+            session_filter = SessionLayerFilter(key, fids=[], exclude=True)
+
+        _SESSION_FILTERS[key] = session_filter
+        while len(_SESSION_FILTERS) > SESSION_FILTERS_CACHE_SIZE:
+            _SESSION_FILTERS.popitem(last=False)
+
+        return session_filter
 
     class Meta:
         app_label = 'qdjango'
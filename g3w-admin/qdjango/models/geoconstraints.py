@@ -10,12 +10,14 @@ __date__ = '2019-07-19'
 __copyright__ = 'Copyright 2019, Gis3w'
 
 
+import hashlib
 import logging
+from collections import OrderedDict
 
 from django.conf import settings
 from django.contrib.auth.models import Group as AuthGroup, User
 from django.contrib.gis.db.models.fields import GeometryField
-from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, Polygon
 from django.core.exceptions import ValidationError
 from django.db import connection, models, transaction
 from django.db.models import Q
@@ -28,8 +30,10 @@ from qgis.core import (
     QgsCoordinateTransformContext,
     QgsGeometry,
     QgsExpression,
+    QgsRectangle,
 )
 
+from core.utils.cache import vector_cache_key, vector_cache_get, vector_cache_set
 from core.utils.qgisapi import get_qgis_features, get_qgis_layer
 from qdjango.models import Layer
 
@@ -44,6 +48,20 @@ CONSTRAINT_LAYER_TYPE_GRANTED = (
     'oracle'
 )
 
+# Process cache of constraint geometries (and prepared geometry engines) by GeoConstraintRule.geometry_cache_key
+_CONSTRAINT_GEOMETRIES = OrderedDict()
+CONSTRAINT_GEOMETRIES_CACHE_SIZE = 32
+
+
+def _cache_constraint_geometry(key, data):
+    """Stores constraint geometry data into the process cache, least recently used keys are evicted"""
+
+    _CONSTRAINT_GEOMETRIES[key] = data
+    _CONSTRAINT_GEOMETRIES.move_to_end(key)
+    while len(_CONSTRAINT_GEOMETRIES) > CONSTRAINT_GEOMETRIES_CACHE_SIZE:
+        _CONSTRAINT_GEOMETRIES.popitem(last=False)
+
+
 class GeoConstraint(models.Model):
     """Main GeoConstraint class. Links together two layers: the editing layer and the constraint layer.
     """
@@ -169,16 +187,39 @@ class GeoConstraintRule(models.Model):
             raise ValidationError(
                 _('There is an error in the SQL rule where condition: %s' % ex))
 
-    def get_constraint_geometry(self):
-        """Returns the geometry from the constraint layer and rule
+    @property
+    def geometry_cache_key(self):
+        """Key of the cached constraint geometry: changes with the rule and the constraint layer data version
 
-        :return: the constraint geometry and the number of matched records
-        :rtype: tuple( MultiPolygon, integer)
+        :rtype: str
+        """
+
+        constraint_layer = self.constraint.constraint_layer
+        return '{}:{}:{}:{}:{}'.format(
+            self.pk,
+            self.constraint.layer_id,
+            constraint_layer.pk,
+            constraint_layer.data_version,
+            hashlib.md5(self.rule.encode('utf-8')).hexdigest()[:12])
+
+    def _build_constraint_geometry(self):
+        """Reads the geometries from the constraint layer and rule, in the CRS of the layer
+
+        :return: WKB, SRID, number of polygons and bounding box of the constraint geometry,
+                 WKB and bounding box are None if no feature matches the rule
+        :rtype: dict
         """
 
         constraint_layer = get_qgis_layer(self.constraint.constraint_layer)
         layer = get_qgis_layer(self.constraint.layer)
 
+        data = {
+            'wkb': None,
+            'srid': layer.crs().postgisSrid(),
+            'count': 0,
+            'bbox': None
+        }
+
         # Get the geometries from constraint layer and rule
         qgis_feature_request = QgsFeatureRequest()
         qgis_feature_request.combineFilterExpression(self.rule)
@@ -186,7 +227,7 @@ class GeoConstraintRule(models.Model):
         features = get_qgis_features(constraint_layer, qgis_feature_request, exclude_fields='__all__')
 
         if not features:
-            return '', 0
+            return data
 
         geometry = QgsMultiPolygon()
 
@@ -197,33 +238,125 @@ class GeoConstraintRule(models.Model):
             else:
                 geom = [geom.constGet()]
 
-            i = 0
             for g in geom:
                 geometry.insertGeometry(g.clone(), 0)
-                i += 1
 
-        # Now, transform into a GEOS geometry
         if constraint_layer.crs() != layer.crs():
             ct = QgsCoordinateTransform(QgsCoordinateReferenceSystem(constraint_layer.crs()), QgsCoordinateReferenceSystem(layer.crs()), QgsCoordinateTransformContext())
             geometry.transform(ct)
 
-        constraint_geometry = MultiPolygon.from_ewkt('SRID=%s;' % layer.crs().postgisSrid() + geometry.asWkt())
+        # Constraint is 2D, plain WKB can be read by GEOS
+        geometry.dropZValue()
+        geometry.dropMValue()
 
-        return constraint_geometry, constraint_geometry.num_geom
+        bbox = geometry.boundingBox()
+        data.update({
+            'wkb': bytes(geometry.asWkb()),
+            'count': geometry.numGeometries(),
+            'bbox': (bbox.xMinimum(), bbox.yMinimum(), bbox.xMaximum(), bbox.yMaximum())
+        })
+        return data
 
-    def get_qgis_expression(self):
-        """Returns the QGIS expression text for this rule
+    def get_constraint_geometry_data(self):
+        """Returns the constraint geometry data, see _build_constraint_geometry().
+
+        Data are cached by process and into G3WADMIN_VECTOR_CACHE (if set), the cache
+        is invalidated by constraint layer editing commits and project updates.
+
+        :rtype: dict
         """
 
-        constraint_geometry, __ = self.get_constraint_geometry()
+        key = self.geometry_cache_key
+        if key in _CONSTRAINT_GEOMETRIES:
+            _CONSTRAINT_GEOMETRIES.move_to_end(key)
+            return _CONSTRAINT_GEOMETRIES[key]
+
+        cache_key = vector_cache_key('geoconstraint', self.constraint.constraint_layer.datasource, key)
+        data = vector_cache_get(cache_key)
+        if data is None:
+            data = self._build_constraint_geometry()
+            vector_cache_set(cache_key, data)
 
-        expression = ''
+        _cache_constraint_geometry(key, data)
+        return data
+
+    def get_constraint_geometry(self):
+        """Returns the geometry from the constraint layer and rule
+
+        :return: the constraint geometry and the number of matched records
+        :rtype: tuple( MultiPolygon, integer)
+        """
+
+        data = self.get_constraint_geometry_data()
+        if not data['wkb']:
+            return '', 0
+
+        constraint_geometry = GEOSGeometry(memoryview(data['wkb']), srid=data['srid'])
+
+        return constraint_geometry, data['count']
+
+    def get_constraint_bbox(self):
+        """Returns the bounding box of the constraint geometry, in the CRS of the layer
+
+        :return: the bounding box, None if no feature matches the rule
+        :rtype: QgsRectangle
+        """
+
+        bbox = self.get_constraint_geometry_data()['bbox']
+        return QgsRectangle(*bbox) if bbox else None
+
+    @classmethod
+    def check_geometry(cls, geometry_cache_key, geometry):
+        """Checks the EDITING_CONSTRAINT_SPATIAL_PREDICATE between a rule constraint geometry and a geometry,
+        with a prepared geometry engine. Used by the g3w_geoconstraint QGIS expression function.
+
+        :param geometry_cache_key: GeoConstraintRule.geometry_cache_key of the rule
+        :type geometry_cache_key: str
+        :param geometry: the geometry to check, in the CRS of the layer
+        :type geometry: QgsGeometry
+        :return: True if the predicate is satisfied
+        :rtype: bool
+        """
+
+        if geometry is None or geometry.isNull():
+            return False
+
+        data = _CONSTRAINT_GEOMETRIES.get(geometry_cache_key)
+        if data is None:
+            # Evicted, built by another process or stale key (rule or constraint layer changed while filtering):
+            # data are stored under the requested key too, so they are read once per filter
+            try:
+                rule = cls.objects.get(pk=int(geometry_cache_key.split(':')[0]))
+                data = rule.get_constraint_geometry_data()
+            except (cls.DoesNotExist, ValueError):
+                data = {'wkb': None}
+            _cache_constraint_geometry(geometry_cache_key, data)
+
+        if not data['wkb']:
+            return False
+
+        if 'engine' not in data:
+            constraint_geometry = QgsGeometry()
+            constraint_geometry.fromWkb(data['wkb'])
+            engine = QgsGeometry.createGeometryEngine(constraint_geometry.constGet())
+            engine.prepareGeometry()
+
+            # Keep the geometry alive with its engine
+            data['geometry'] = constraint_geometry
+            data['engine'] = engine
+
+        spatial_predicate = getattr(settings, 'EDITING_CONSTRAINT_SPATIAL_PREDICATE', 'contains')
+        return bool(getattr(data['engine'], spatial_predicate)(geometry.constGet()))
+
+    def get_qgis_expression(self):
+        """Returns the QGIS expression text for this rule: the constraint geometry is not embedded
+        into the expression, it is read from cache by g3w_geoconstraint QGIS expression function.
+        """
 
-        if constraint_geometry:
-            spatial_predicate = getattr(
-            settings, 'EDITING_CONSTRAINT_SPATIAL_PREDICATE', 'contains')
-            return f"{spatial_predicate}(geom_from_wkt( '{constraint_geometry.wkt}' ), $geometry )"
+        data = self.get_constraint_geometry_data()
 
+        if data['wkb']:
+            return f"g3w_geoconstraint('{self.geometry_cache_key}')"
 
     def validate_sql(self):
         """Checks if the rule can be executed without errors
@@ -1,6 +1,7 @@
 import logging
 import os
 import time
+from collections import OrderedDict
 from autoslug import AutoSlugField
 from autoslug.utils import slugify
 from ordered_model.models import OrderedModel
@@ -14,7 +15,9 @@ from django.conf import settings
 from django.contrib.auth.models import Group as AuthGroup
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import F
 from django.db.models.signals import post_delete
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from guardian.shortcuts import get_perms
 from guardian.utils import get_anonymous_user
@@ -50,6 +53,30 @@ TYPE_LAYER_FOR_DOWNLOAD = (
     'oracle'
 )
 
+# Process cache of fields visible by users, see Layer.visible_fields_for_user()
+_VISIBLE_FIELDS = OrderedDict()
+VISIBLE_FIELDS_CACHE_SIZE = 2048
+
+# Seconds of validity of cached visible fields without the ACL cache shared between processes (QDJANGO_ACL_CACHE):
+# changes made by other processes are seen after this delay
+VISIBLE_FIELDS_CACHE_TIMEOUT = 60
+
+
+def invalidate_visible_fields(layer_pks=None):
+    """Removes cached visible fields of layers
+
+    :param layer_pks: list of qdjango Layer pks, None for all layers
+    """
+
+    if layer_pks is None:
+        _VISIBLE_FIELDS.clear()
+        return
+
+    layer_pks = set(layer_pks)
+    for key in [k for k in _VISIBLE_FIELDS if k[0] in layer_pks]:
+        del _VISIBLE_FIELDS[key]
+
+
 TYPE_RASTER_LAYER_FOR_DOWNLOAD = (
     'gdal',
     'raster'
@@ -590,6 +617,19 @@ class Layer(G3WACLModelMixins, models.Model):
     has_column_acl = models.BooleanField(
         _('Has column ACL constraints'), default=False, editable=False, db_index=True)
 
+    # Data version: bumped on editing commits, project updates and style changes,
+    # used to build the ETag of the vector API responses
+    data_version = models.PositiveIntegerField(
+        _('Data version'), default=0, editable=False)
+    data_modified = models.DateTimeField(
+        _('Data last modified'), null=True, blank=True, editable=False)
+
+    # Text index of the fields of search widgets: a FTS5 sidecar file for file based layers,
+    # trigram indexes for postgres layers. See qdjango.utils.search_index.
+    search_index = models.BooleanField(
+        _('Search index'), default=False, blank=True,
+        help_text=_('Build a text index on fields of layer search widgets'))
+
     objects = models.Manager()  # The default manager.
     vectors = VectorLayersManager()
 
@@ -603,11 +643,15 @@ class Layer(G3WACLModelMixins, models.Model):
 
         layer = None
         try:
-            return self.project.qgis_project.mapLayers()[self.qgs_layer_id]
+            # mapLayer() is a lookup, mapLayers() builds the dict of every project layer
+            layer = self.project.qgis_project.mapLayer(self.qgs_layer_id)
         except:
+            pass
+
+        if layer is None:
             logger.warning(
                 'Cannot retrieve QgsMapLayer for QDjango layer %s' % self.qgs_layer_id)
-            return layer
+        return layer
 
     @property
     def styles(self):
@@ -632,11 +676,30 @@ class Layer(G3WACLModelMixins, models.Model):
 
     def visible_fields_for_user(self, user):
         """Returns a list of field names visible by the user
-        according to ColumnAcl"""
+        according to ColumnAcl.
 
-        if isinstance(self.qgis_layer, QgsVectorLayer):
+        Results are cached by layer and user, the cache is invalidated by ColumnAcl, Layer, Project and
+        user groups changes (see qdjango.receivers) in this process and by the shared ACL version
+        (see qdjango.utils.acl) in the other ones. Without the shared ACL cache (QDJANGO_ACL_CACHE)
+        results are valid for VISIBLE_FIELDS_CACHE_TIMEOUT seconds.
+        """
+
+        from qdjango.utils.acl import get_acl_version
+
+        acl_version = get_acl_version()
+        key = (self.pk, 'anonymous' if user.is_anonymous else user.pk)
+        stamp = (self.has_column_acl, self.qgs_layer_id, self.datasource, acl_version)
+
+        cached = _VISIBLE_FIELDS.get(key)
+        if cached is not None and cached[0] == stamp and \
+                (acl_version is not None or time.time() - cached[2] < VISIBLE_FIELDS_CACHE_TIMEOUT):
+            _VISIBLE_FIELDS.move_to_end(key)
+            return list(cached[1])
 
-            attributes = self.qgis_layer.fields().names()
+        qgis_layer = self.qgis_layer
+        if isinstance(qgis_layer, QgsVectorLayer):
+
+            attributes = qgis_layer.fields().names()
 
             if self.has_column_acl:
 
@@ -647,10 +710,41 @@ class Layer(G3WACLModelMixins, models.Model):
                     attributes = list(set(attributes) -
                                       set(acl.restricted_fields))
 
+            _VISIBLE_FIELDS[key] = (stamp, tuple(attributes), time.time())
+            _VISIBLE_FIELDS.move_to_end(key)
+            while len(_VISIBLE_FIELDS) > VISIBLE_FIELDS_CACHE_SIZE:
+                _VISIBLE_FIELDS.popitem(last=False)
+
             return attributes
         else:
             return []
 
+    @classmethod
+    def bump_data_version(cls, layers, same_datasource=True):
+        """Increments the data version of layers
+
+        :param layers: iterable of Layer instances (or a Layer queryset)
+        :type layers: iterable
+        :param same_datasource: bump also the layers of other projects sharing
+                                the same datasource, defaults to True
+        :type same_datasource: bool, optional
+        :return: number of updated layers
+        :rtype: int
+        """
+
+        if same_datasource:
+            to_update = cls.objects.filter(
+                datasource__in=set([l.datasource for l in layers]))
+        else:
+            to_update = cls.objects.filter(pk__in=[l.pk for l in layers])
+
+        updated = to_update.update(data_version=F('data_version') + 1, data_modified=timezone.now())
+
+        from qdjango.utils.search_index import schedule_search_index_refresh
+        schedule_search_index_refresh(to_update.filter(search_index=True))
+
+        return updated
+
     def is_embedded(self):
         """Returns true if the layer is embedded from another project"""
 
@@ -32,10 +32,93 @@ except:
     pass
 
 from .auth import QdjangoProjectAuthorizer
+from .utils.acl import ProjectACLSnapshot
+from .utils.ows_cache import OWSResponseCache
+from .utils.project_cache import record_project_usage
+from .utils.render_workers import RenderWorkerUnavailable, get_render_worker_pool
 
 logger = logging.getLogger(__name__)
 
 
+def get_qgs_request_method(method):
+    """
+    Return the QgsBufferServerRequest method of a HTTP method
+    :param method: HTTP method name, i.e. 'GET'
+    :return: QgsServerRequest.Method
+    """
+
+    methods = {
+        'GET': QgsBufferServerRequest.GetMethod,
+        'POST': QgsBufferServerRequest.PostMethod,
+        'PUT': QgsBufferServerRequest.PutMethod,
+        'PATCH': QgsBufferServerRequest.PatchMethod,
+        'HEAD': QgsBufferServerRequest.HeadMethod,
+        'DELETE': QgsBufferServerRequest.DeleteMethod,
+    }
+
+    if method not in methods:
+        logger.warning(
+            "Request method not supported: %s, assuming GET" % method)
+    return methods.get(method, QgsBufferServerRequest.GetMethod)
+
+
+def handle_qgs_server_request(request, project, qgs_project, qgs_request, acl=None):
+    """
+    Render a request with QGIS Server in the current process
+    :param request: Django request (or render worker request), used by server access control filters
+    :param project: qdjango Project model instance
+    :param qgs_project: QgsProject instance of the project
+    :param qgs_request: QgsBufferServerRequest instance
+    :param acl: ProjectACLSnapshot instance of the request user, default a new one
+    :return: tuple (body bytes, status code, headers dict)
+    """
+
+    # Attach user and project to the server object to make them accessible by the
+    # server access control plugins (constraints etc.)
+    QGS_SERVER.djrequest = request
+    QGS_SERVER.user = request.user
+    QGS_SERVER.project = project
+
+    # Access control rules of project layers, shared by access control plugins
+    QGS_SERVER.acl = acl if acl is not None else ProjectACLSnapshot(request.user, project)
+
+    # For GetPrint QGIS functions that rely on layers visibility, we need to check
+    # the layers from LAYERS
+    use_ids = QgsServerProjectUtils.wmsUseLayerIds(qgs_project)
+    tree_root = qgs_project.layerTreeRoot()
+
+    # Loop through the layers and make them visible
+    for layer_name in qgs_request.queryParameter('LAYERS').split(','):
+        layer_name = urllib.parse.unquote(layer_name)
+        layer = None
+        if use_ids:
+            layer = qgs_project.mapLayer(layer_name)
+        else:
+            try:
+                layer = qgs_project.mapLayersByName(layer_name)[0]
+            except:  # short name?
+                for l in qgs_project.mapLayers().values():
+                    if l.shortName() == layer_name:
+                        layer = l
+                        break
+
+        if layer is None:
+            logger.warning(
+                'Could not find layer "{}" when configuring OWS call'.format(layer_name))
+        else:
+            layer_node = tree_root.findLayer(layer)
+            if layer_node is not None:
+                layer_node.setItemVisibilityCheckedParentRecursive(True)
+            else:
+                logger.warning(
+                    'Could not find layer tree node "{}" when configuring OWS call'.format(layer_name))
+
+    qgs_response = QgsBufferServerResponse()
+    QGS_SERVER.handleRequest(qgs_request, qgs_response, qgs_project)
+
+    return bytes(qgs_response.body()), qgs_response.statusCode(), dict(qgs_response.headers())
+
+
 class OWSRequestHandler(OWSRequestHandlerBase):
     """
     Handler for ows request for module qdjango
@@ -77,91 +160,70 @@ class OWSRequestHandler(OWSRequestHandlerBase):
                     ows_request = request.POST['REQUEST'][0].upper()
             q['REQUEST'] = ows_request
 
-        # FIXME: proxy or redirect in case of WMS/WFS/XYZ cascading?
-        qgs_project = get_qgs_project(self.project.qgis_file.path)
-
-        if qgs_project is None:
-            raise Http404('The requested QGIS project could not be loaded!')
-
-        data = None
-        if request.method == 'GET':
-            method = QgsBufferServerRequest.GetMethod
-        elif request.method == 'POST':
-            method = QgsBufferServerRequest.PostMethod
-            data = request.body
-        elif request.method == 'PUT':
-            method = QgsBufferServerRequest.PutMethod
-            data = request.body
-        elif request.method == 'PATCH':
-            method = QgsBufferServerRequest.PatchMethod
-            data = request.body
-        elif request.method == 'HEAD':
-            method = QgsBufferServerRequest.HeadMethod
-        elif request.method == 'DELETE':
-            method = QgsBufferServerRequest.DeleteMethod
-        else:
-            logger.warning(
-                "Request method not supported: %s, assuming GET" % request.method)
-            method = QgsBufferServerRequest.GetMethod
+        # Most used projects are preloaded at workers start
+        record_project_usage(self.project.pk)
 
+        # Access control rules of project layers, shared by access control plugins
+        acl = ProjectACLSnapshot(request.user, self.project)
+
+        data = request.body if request.method in ('POST', 'PUT', 'PATCH') else None
         headers = {}
         for header_key in request.headers.keys():
             headers[header_key] = request.headers.get(header_key)
         uri = request.build_absolute_uri(request.path) + '?' + q.urlencode()
-        logger.debug('Calling QGIS Server: %s' % uri)
-        qgs_request = QgsBufferServerRequest(uri, method, headers, data)
-
-        # Attach user and project to the server object to make them accessible by the
-        # server access control plugins (constraints etc.)
-        QGS_SERVER.djrequest = request
-        QGS_SERVER.user = request.user
-        QGS_SERVER.project = self.project
-
-
-        # For GetPrint QGIS functions that rely on layers visibility, we need to check
-        # the layers from LAYERS
-        use_ids = QgsServerProjectUtils.wmsUseLayerIds(qgs_project)
-        tree_root = qgs_project.layerTreeRoot()
-
-        # Loop through the layers and make them visible
-        for layer_name in qgs_request.queryParameter('LAYERS').split(','):
-            layer_name = urllib.parse.unquote(layer_name)
-            layer = None
-            if use_ids:
-                layer = qgs_project.mapLayer(layer_name)
-            else:
-                try:
-                    layer = qgs_project.mapLayersByName(layer_name)[0]
-                except:  # short name?
-                    for l in qgs_project.mapLayers().values():
-                        if l.shortName() == layer_name:
-                            layer = l
-                            break
-
-            if layer is None:
-                logger.warning(
-                    'Could not find layer "{}" when configuring OWS call'.format(layer_name))
-            else:
-                layer_node = tree_root.findLayer(layer)
-                if layer_node is not None:
-                    layer_node.setItemVisibilityCheckedParentRecursive(True)
-                else:
-                    logger.warning(
-                        'Could not find layer tree node "{}" when configuring OWS call'.format(layer_name))
 
+        # With render workers the project is loaded only by the worker process
+        render_workers = get_render_worker_pool()
+        qgs_project = None
+        if render_workers is None:
+
+            # FIXME: proxy or redirect in case of WMS/WFS/XYZ cascading?
+            qgs_project = get_qgs_project(self.project.qgis_file.path)
+
+            if qgs_project is None:
+                raise Http404('The requested QGIS project could not be loaded!')
+
+        # Rendered responses cache: users with the same access control rules share the responses
+        ows_cache = OWSResponseCache(request, self.project, q, acl=acl)
+        cached = ows_cache.get()
+        if cached is not None:
+            body, status_code, cached_headers = cached
+            response = HttpResponse(body, status=status_code)
+            for key, value in cached_headers.items():
+                response[key] = value
+            return response
 
-        qgs_response = QgsBufferServerResponse()
         try:
-            QGS_SERVER.handleRequest(qgs_request, qgs_response, qgs_project)
+            if render_workers is not None:
+                try:
+                    body, status_code, response_headers = render_workers.render(
+                        request, self.project, uri, headers, data, acl)
+                except RenderWorkerUnavailable as ex:
+                    if not getattr(settings, 'QDJANGO_RENDER_WORKERS_FALLBACK', True):
+                        raise
+                    logger.warning(f'{ex}: request rendered by the current process')
+                    qgs_project = get_qgs_project(self.project.qgis_file.path)
+                    if qgs_project is None:
+                        raise Http404('The requested QGIS project could not be loaded!')
+
+            if qgs_project is not None:
+                logger.debug('Calling QGIS Server: %s' % uri)
+                qgs_request = QgsBufferServerRequest(uri, get_qgs_request_method(request.method), headers, data)
+                body, status_code, response_headers = handle_qgs_server_request(
+                    request, self.project, qgs_project, qgs_request, acl)
+        except Http404:
+            raise
         except Exception as ex:
             return HttpResponseServerError(reason="Error handling server request: %s" % ex)
 
-        response = HttpResponse(bytes(qgs_response.body()))
-        response.status_code = qgs_response.statusCode()
+        response = HttpResponse(body)
+        response.status_code = status_code
 
-        for key, value in qgs_response.headers().items():
+        for key, value in response_headers.items():
             response[key] = value
 
+        ows_cache.set(body, status_code, response_headers)
+
         return response
 
     def doRequest(self):
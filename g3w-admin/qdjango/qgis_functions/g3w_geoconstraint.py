@@ -0,0 +1,21 @@
+from qgis.core import qgsfunction
+
+import logging
+
+logger = logging.getLogger('qdjango')
+
+
+@qgsfunction(args='auto', group='Custom', usesgeometry=True, referenced_columns=[])
+def g3w_geoconstraint(geometry_cache_key, feature, parent):
+    """
+    Returns true if the feature geometry satisfies the EDITING_CONSTRAINT_SPATIAL_PREDICATE
+    with the cached constraint geometry of a geoconstraint rule
+    """
+
+    from qdjango.models import GeoConstraintRule
+
+    try:
+        return GeoConstraintRule.check_geometry(geometry_cache_key, feature.geometry())
+    except Exception as e:
+        logger.error('QGIS function g3w_geoconstraint error: {}'.format(e))
+    return False
@@ -0,0 +1,21 @@
+from qgis.core import qgsfunction
+
+import logging
+
+logger = logging.getLogger('qdjango')
+
+
+@qgsfunction(args='auto', group='Custom', usesgeometry=False, referenced_columns=[])
+def g3w_session_fids(session_filter_key, feature, parent):
+    """
+    Returns true if the feature id passes the feature ids filter of a session filter token
+    """
+
+    from qdjango.models.filters import SessionLayerFilter
+
+    try:
+        session_filter = SessionLayerFilter.get(session_filter_key)
+        return session_filter is not None and session_filter.contains(feature.id())
+    except Exception as e:
+        logger.error('QGIS function g3w_session_fids error: {}'.format(e))
+    return False
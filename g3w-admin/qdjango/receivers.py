@@ -5,17 +5,26 @@ from pathlib import Path
 from core.models import ProjectMapUrlAlias
 from core.signals import (execute_search_on_models, load_layer_actions,
                           pre_delete_project, pre_update_project)
+from core.utils.cache import invalidate_layers
 from django.conf import settings
+from django.contrib.auth.models import Group as AuthGroup
+from django.contrib.auth.models import User
 from django.contrib.auth.signals import user_logged_out
 from django.core.cache import caches
-from django.db.models.signals import (post_delete, post_save, pre_delete,
+from django.db.models.signals import (m2m_changed, post_delete, post_save, pre_delete,
                                       pre_save)
 from django.dispatch import receiver
 from django.template import loader
 from qgis.core import QgsProject
 
-from .models import ColumnAcl, Layer, Project, SessionTokenFilter
+from .apps import ProjectChangeEvents
+from .models import ColumnAcl, Layer, Project, SessionTokenFilter, SingleLayerConstraint, \
+    ConstraintSubsetStringRule, ConstraintExpressionRule, GeoConstraint, GeoConstraintRule, Widget
+from .models.projects import invalidate_visible_fields
 from .searches import ProjectSearch
+from .utils.acl import invalidate_acl_snapshots
+from .utils.ows_cache import invalidate_ows_cache
+from .utils.search_index import LayerSearchIndex, schedule_search_index_refresh
 from .signals import post_save_qdjango_project_file
 from .views import QdjangoProjectListView, QdjangoProjectUpdateView
 
@@ -55,6 +64,15 @@ def delete_cache_project_settings(sender, **kwargs):
 
     instance = kwargs['instance']
 
+    # Project is reloaded: invalidate cached vector API results (i.e. features count)
+    invalidate_layers(instance.layer_set.all())
+
+    # Project file or layer styles changed: new ETags for vector API responses of the project layers
+    Layer.bump_data_version(instance.layer_set.all(), same_datasource=False)
+
+    # Rendered OWS responses of the project
+    invalidate_ows_cache([instance.pk])
+
 
 @receiver(post_delete, sender=Layer)
 def remove_embedded_layers(sender, **kwargs):
@@ -91,10 +109,21 @@ def remove_parent_project_from_cache(sender, **kwargs):
         updated_parents.append(path)
         p = Path(path)
         p.touch()
+        ProjectChangeEvents.broadcast(l.project.qgis_file.path)
         logging.getLogger('g3wadmin.debug').debug(
             'QGIS Server parent project touched to invalidate cache: %s' % path)
 
 
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def broadcast_project_change(sender, **kwargs):
+    """Notifies the project file change to QGIS Server caches of every process"""
+
+    instance = kwargs['instance']
+    if instance.qgis_file:
+        ProjectChangeEvents.broadcast(instance.qgis_file.path)
+
+
 @receiver(post_save, sender=Layer)
 def update_widget(sender, **kwargs):
     """
@@ -224,3 +253,89 @@ def set_layer_acl_flag_delete(sender, **kwargs):
         layer.save()
     except ColumnAcl.DoesNotExist:
         pass
+
+
+@receiver(post_save, sender=ColumnAcl)
+@receiver(post_delete, sender=ColumnAcl)
+@receiver(post_save, sender=SingleLayerConstraint)
+@receiver(post_delete, sender=SingleLayerConstraint)
+@receiver(post_save, sender=ConstraintSubsetStringRule)
+@receiver(post_delete, sender=ConstraintSubsetStringRule)
+@receiver(post_save, sender=ConstraintExpressionRule)
+@receiver(post_delete, sender=ConstraintExpressionRule)
+@receiver(post_save, sender=GeoConstraint)
+@receiver(post_delete, sender=GeoConstraint)
+@receiver(post_save, sender=GeoConstraintRule)
+@receiver(post_delete, sender=GeoConstraintRule)
+def invalidate_acl_cache(sender, **kwargs):
+    """Access control rules changed: invalidate ACL snapshots of QGIS Server access control filters"""
+
+    invalidate_acl_snapshots()
+
+
+@receiver(post_save, sender=ColumnAcl)
+@receiver(post_delete, sender=ColumnAcl)
+@receiver(post_save, sender=Layer)
+@receiver(post_delete, sender=Layer)
+@receiver(post_save, sender=Project)
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(post_delete, sender=AuthGroup)
+def invalidate_visible_fields_cache(sender, **kwargs):
+    """Column ACL, layers, project (reloads) or user groups changed: invalidate cached visible fields"""
+
+    instance = kwargs['instance']
+
+    if sender is Layer:
+        invalidate_visible_fields([instance.pk])
+    elif sender is Project:
+        invalidate_visible_fields(instance.layer_set.values_list('pk', flat=True))
+    elif sender is ColumnAcl:
+        invalidate_visible_fields()
+    elif sender is AuthGroup or kwargs['action'] in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_visible_fields()
+    else:
+        return
+
+    # Other processes: visible fields are cached with the ACL version token, layers fields can be changed
+    # by project reloads
+    invalidate_acl_snapshots()
+
+
+@receiver(post_save, sender=Layer)
+def refresh_layer_search_index(sender, **kwargs):
+    """Build the search index of layer if it's enabled, remove the FTS sidecar file if disabled"""
+
+    layer = kwargs['instance']
+    if layer.search_index:
+        schedule_search_index_refresh([layer])
+    else:
+        LayerSearchIndex(layer).remove()
+
+
+@receiver(post_delete, sender=Layer)
+def remove_layer_search_index(sender, **kwargs):
+    """Remove the FTS sidecar file of a deleted layer"""
+
+    LayerSearchIndex(kwargs['instance']).remove()
+
+
+@receiver(post_save, sender=Widget)
+def refresh_widget_search_index(sender, **kwargs):
+    """Search widget fields changed: refresh search indexes of its layers"""
+
+    schedule_search_index_refresh(kwargs['instance'].layers.filter(search_index=True))
+
+
+@receiver(m2m_changed, sender=Widget.layers.through)
+def refresh_widget_layers_search_index(sender, **kwargs):
+    """Search widget added to or removed from layers: refresh search indexes of its layers"""
+
+    if kwargs['action'] not in ('post_add', 'post_remove'):
+        return
+
+    instance = kwargs['instance']
+    if isinstance(instance, Widget):
+        layers = Layer.objects.filter(pk__in=kwargs['pk_set'], search_index=True)
+    else:
+        layers = [instance]
+    schedule_search_index_refresh(layers)
@@ -14,7 +14,7 @@ __copyright__ = 'Copyright 2020, Gis3W'
 from qgis.server import QgsAccessControlFilter
 from qgis.core import QgsMessageLog, Qgis
 from qdjango.apps import QGS_SERVER
-from qdjango.models import ConstraintSubsetStringRule, ConstraintExpressionRule, Layer, GeoConstraintRule
+from qdjango.utils.acl import get_server_acl
 
 
 class ColumnAclAccessControlFilter(QgsAccessControlFilter):
@@ -26,14 +26,9 @@ class ColumnAclAccessControlFilter(QgsAccessControlFilter):
     def authorizedLayerAttributes(self, layer, attributes):
         """Retrieve and sets column acl"""
 
-        try:
-            qdjango_layer = Layer.objects.get(
-                project=QGS_SERVER.project, qgs_layer_id=layer.id())
-            if qdjango_layer.has_column_acl:
-                user = QGS_SERVER.user
-                return qdjango_layer.visible_fields_for_user(user)
-        except Layer.DoesNotExist:
-            pass
+        layer_acl = get_server_acl().layer(layer.id())
+        if layer_acl is not None and layer_acl['visible_fields'] is not None:
+            return layer_acl['visible_fields']
 
         return attributes
 
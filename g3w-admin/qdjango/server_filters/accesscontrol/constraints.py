@@ -14,7 +14,7 @@ __copyright__ = 'Copyright 2020, Gis3W'
 from qgis.server import QgsAccessControlFilter
 from qgis.core import QgsMessageLog, Qgis
 from qdjango.apps import QGS_SERVER
-from qdjango.models import ConstraintSubsetStringRule, ConstraintExpressionRule, Layer, GeoConstraintRule
+from qdjango.utils.acl import get_server_acl
 
 class SingleLayerSubsetStringAccessControlFilter(QgsAccessControlFilter):
     """A filter that sets a subset string from the layer constraints"""
@@ -25,12 +25,11 @@ class SingleLayerSubsetStringAccessControlFilter(QgsAccessControlFilter):
     def layerFilterSubsetString(self, layer):
         """Retrieve and sets user layer constraints"""
 
-        try:
-            qdjango_layer = Layer.objects.get(project=QGS_SERVER.project, qgs_layer_id=layer.id())
-        except Layer.DoesNotExist:
+        layer_acl = get_server_acl().layer(layer.id())
+        if layer_acl is None:
             return ""
 
-        rule = ConstraintSubsetStringRule.get_rule_definition_for_user(QGS_SERVER.user, qdjango_layer.pk)
+        rule = layer_acl['subset_string']
         if rule:
             QgsMessageLog.logMessage("SingleLayerSubsetStringAccessControlFilter rule for user %s and layer id %s: %s" % (QGS_SERVER.user, layer.id(), rule), "", Qgis.Info)
 
@@ -61,13 +60,12 @@ class SingleLayerExpressionAccessControlFilter(QgsAccessControlFilter):
     def layerFilterExpression(self, layer):
         """Retrieve and sets user layer constraints"""
 
-        try:
-            qdjango_layer = Layer.objects.get(project=QGS_SERVER.project, qgs_layer_id=layer.id())
-        except Layer.DoesNotExist:
+        layer_acl = get_server_acl().layer(layer.id())
+        if layer_acl is None:
             QgsMessageLog.logMessage("SingleLayerExpressionAccessControlFilter for user %s: layer id %s does not exist!" % (QGS_SERVER.user, layer.id()), "", Qgis.Warning)
             return ""
 
-        rule = ConstraintExpressionRule.get_rule_definition_for_user(QGS_SERVER.user, qdjango_layer.pk)
+        rule = layer_acl['expression']
         if rule:
             QgsMessageLog.logMessage("SingleLayerExpressionAccessControlFilter rule for user %s and layer id %s: %s" % (QGS_SERVER.user, layer.id(), rule), "", Qgis.Info)
 
@@ -96,13 +94,12 @@ class GeoConstraintAccessControlFilter(QgsAccessControlFilter):
     def layerFilterExpression(self, layer):
         """Retrieve and sets user layer constraints"""
 
-        try:
-            qdjango_layer = Layer.objects.get(project=QGS_SERVER.project, qgs_layer_id=layer.id())
-        except Layer.DoesNotExist:
+        layer_acl = get_server_acl().layer(layer.id())
+        if layer_acl is None:
             QgsMessageLog.logMessage("SingleLayerExpressionAccessControlFilter for user %s: layer id %s does not exist!" % (QGS_SERVER.user, layer.id()), "", Qgis.Warning)
             return ""
 
-        rule = GeoConstraintRule.get_rule_definition_for_user(QGS_SERVER.user, qdjango_layer)
+        rule = layer_acl['geo_expression']
         if rule:
             QgsMessageLog.logMessage("SingleLayerExpressionAccessControlFilter rule for user %s and layer id %s: %s" % (QGS_SERVER.user, layer.id(), rule), "", Qgis.Info)
 
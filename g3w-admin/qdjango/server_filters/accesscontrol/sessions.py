@@ -14,7 +14,7 @@ __copyright__ = 'Copyright 2015 - 2020, Gis3w'
 from qgis.server import QgsAccessControlFilter
 from qgis.core import QgsMessageLog, Qgis
 from qdjango.apps import QGS_SERVER
-from qdjango.models import SessionTokenFilter, Layer
+from qdjango.utils.acl import get_server_acl
 
 
 class SingleLayerSessionTokenAccessControlFilter(QgsAccessControlFilter):
@@ -23,13 +23,8 @@ class SingleLayerSessionTokenAccessControlFilter(QgsAccessControlFilter):
     def __init__(self, server_iface):
         super().__init__(server_iface)
 
-    def layerFilterExpression(self, layer):
-        """Retrieve and sets user layer constraints"""
-
-        try:
-            qdjango_layer = Layer.objects.get(project=QGS_SERVER.project, qgs_layer_id=layer.id())
-        except Layer.DoesNotExist:
-            return ""
+    def _session_filter(self, layer):
+        """Returns the compiled session filter of the layer for the request filtertoken, or None"""
 
         # check for filtertoken
         request_data = QGS_SERVER.djrequest.POST if QGS_SERVER.djrequest.method == 'POST' \
@@ -37,10 +32,32 @@ class SingleLayerSessionTokenAccessControlFilter(QgsAccessControlFilter):
 
         filtertoken = request_data.get('filtertoken')
         if not filtertoken:
+            return None
+
+        # Memoized for the request: it is called by layerFilterSubsetString() and layerFilterExpression()
+        session_filter = get_server_acl().session_filter(filtertoken, layer.id())
+        if session_filter is None or session_filter.is_empty:
+            return None
+        return session_filter
+
+    def layerFilterSubsetString(self, layer):
+        """Feature ids filters as provider SQL, when supported by the layer provider"""
+
+        session_filter = self._session_filter(layer)
+        if session_filter is None:
+            return ""
+
+        return session_filter.subset_string(layer) or ""
+
+    def layerFilterExpression(self, layer):
+        """Retrieve and sets user layer constraints"""
+
+        session_filter = self._session_filter(layer)
+        if session_filter is None or session_filter.subset_string(layer) is not None:
             return ""
 
-        rule = SessionTokenFilter.get_expr_for_token(filtertoken, qdjango_layer)
-        QgsMessageLog.logMessage("SingleLayerSessionTokenAccessControlFilter expression for filtertoken %s layer id %s: %s" % (filtertoken, layer.id(), rule), "", Qgis.Info)
+        rule = session_filter.expression
+        QgsMessageLog.logMessage("SingleLayerSessionTokenAccessControlFilter expression for layer id %s: %s" % (layer.id(), rule), "", Qgis.Info)
         return rule
 
     def cacheKey(self):
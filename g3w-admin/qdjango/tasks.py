@@ -0,0 +1,54 @@
+# coding=utf-8
+""""Huey tasks for Qdjango
+
+.. note:: This program is free software; you can redistribute it and/or modify
+          it under the terms of the Mozilla Public License 2.0.
+
+"""
+
+import logging
+
+from huey.contrib.djhuey import db_task
+
+logger = logging.getLogger(__name__)
+
+
+@db_task()
+def refresh_search_index_task(layer_pk):
+    """
+    Build or refresh the search index of a layer, see qdjango.utils.search_index
+    :param layer_pk: qdjango Layer primary key
+    """
+
+    from .models import Layer
+    from .utils.search_index import LayerSearchIndex
+
+    try:
+        layer = Layer.objects.get(pk=layer_pk)
+    except Layer.DoesNotExist:
+        return False
+
+    try:
+        return LayerSearchIndex(layer).refresh()
+    except Exception as e:
+        logger.error(f'[SEARCH INDEX] Refresh of layer {layer.qgs_layer_id} failed: {e}')
+        return False
+
+
+@db_task()
+def repair_layer_indexes_task(project_pk):
+    """
+    Build missing spatial and attribute indexes of the file based layers of a project,
+    see qdjango.utils.layer_indexes
+    :param project_pk: qdjango Project primary key
+    """
+
+    from .models import Project
+    from .utils.layer_indexes import repair_project_layer_indexes
+
+    try:
+        project = Project.objects.get(pk=project_pk)
+    except Project.DoesNotExist:
+        return {}
+
+    return repair_project_layer_indexes(project)
@@ -37,6 +37,7 @@ from qdjango.models.geoconstraints import GeoConstraint, GeoConstraintRule
 from qdjango.api.layers.filters import FILTER_RELATIONONETOMANY_PARAM
 from qdjango.utils.data import QgisProject
 from qdjango.models import SessionTokenFilter, SessionTokenFilterLayer
+from qdjango.models.filters import pack_fids, unpack_fids
 from core.tests.base import CoreTestBase
 from core.utils.qgisapi import get_qgs_project
 
@@ -795,6 +796,38 @@ class TestQdjangoLayersAPI(QdjangoTestBase):
         # test layer table saved
         self.assertEqual(sf.stf_layers.count(), 1)
 
+        # test feature ids saved as a packed set
+        stf_layer = sf.stf_layers.get(layer=cities)
+        self.assertEqual(stf_layer.qgs_expr, '')
+        self.assertFalse(stf_layer.fids_exclude)
+        self.assertEqual(unpack_fids(stf_layer.fids), [1, 2, 3, 4])
+        self.assertEqual(stf_layer.version, 2)
+
+        resp = json.loads(self._testApiCall('core-vector-api',
+                                            ['filtertoken', 'qdjango', self.project310.instance.pk,
+                                             cities.qgs_layer_id],
+                                            {
+                                                'fidsout': '2,3'
+                                            }, login=False, logout=False).content)
+
+        stf_layer.refresh_from_db()
+        self.assertEqual(unpack_fids(stf_layer.fids), [1, 4])
+        self.assertEqual(stf_layer.get_filter().expression, f"g3w_session_fids('{stf_layer.pk}:3')")
+
+        # wrong feature ids
+        resp = json.loads(self._testApiCall('core-vector-api',
+                                            ['filtertoken', 'qdjango', self.project310.instance.pk,
+                                             cities.qgs_layer_id],
+                                            {
+                                                'fidsin': '1,a'
+                                            }, status_auth=500, login=False, logout=False).content)
+
+        self.assertFalse(resp['result'])
+        self.assertEqual(resp['error']['data'], "'fidsin' and 'fidsout' must be comma separated feature ids.")
+
+        # packed ids round trip
+        self.assertEqual(unpack_fids(pack_fids([100, 3, -1, 3, 2 ** 40])), [-1, 3, 100, 2 ** 40])
+
         # test create second filtertoken
         # ------------------------------
         resp = json.loads(self._testApiCall('core-vector-api',
@@ -1107,6 +1140,88 @@ class TestQdjangoLayersAPI(QdjangoTestBase):
 
         self.assertEqual(resp['count'], 1)
 
+        # check limit and prefix params
+        # -----------------------------
+
+        resp = json.loads(self._testApiCall('core-vector-api',
+                                            ['data', 'qdjango', self.project310.instance.pk,
+                                                cities.qgs_layer_id],
+                                            {
+                                                'unique': 'ISO2_CODE',
+                                                'limit': '2'
+                                            }).content)
+
+        self.assertEqual(resp['count'], 2)
+
+        resp = json.loads(self._testApiCall('core-vector-api',
+                                            ['data', 'qdjango', self.project310.instance.pk,
+                                                cities.qgs_layer_id],
+                                            {
+                                                'unique': 'ISO2_CODE',
+                                                'prefix': 'i'
+                                            }).content)
+
+        self.assertTrue(resp['count'] > 0)
+        self.assertIn('IT', resp['data'])
+        for value in resp['data']:
+            self.assertTrue(value.startswith('I'))
+
+        # with filters values are fetched iterating features
+        resp = json.loads(self._testApiCall('core-vector-api',
+                                            ['data', 'qdjango', self.project310.instance.pk,
+                                                cities.qgs_layer_id],
+                                            {
+                                                'field': 'ISO2_CODE|eq|IT',
+                                                'unique': 'NAME',
+                                                'prefix': 'flo'
+                                            }).content)
+
+        self.assertTrue(resp['count'] > 0)
+        for value in resp['data']:
+            self.assertTrue(value.lower().startswith('flo'))
+
+    def test_tiles_api(self):
+        """ Test vector layer api Mapbox vector tiles mode """
+
+        cities = Layer.objects.get(
+            project_id=self.project310.instance.pk, origname='cities10000eu')
+
+        response = self._testApiCall('core-vector-api-tiles',
+                                     ['tiles', 'qdjango', self.project310.instance.pk,
+                                      cities.qgs_layer_id, 0, 0, 0])
+
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+
+        # Tile message with one layer (field 3, length delimited)
+        self.assertEqual(response.content[0], 0x1a)
+        self.assertIn(cities.qgs_layer_id.encode('utf-8'), response.content)
+
+        # Same filters of data mode
+        filtered = self._testApiCall('core-vector-api-tiles',
+                                     ['tiles', 'qdjango', self.project310.instance.pk,
+                                      cities.qgs_layer_id, 0, 0, 0], {
+                                         'field': 'ISO2_CODE|eq|IT'
+                                     })
+        self.assertTrue(0 < len(filtered.content) < len(response.content))
+
+        # Empty tile: no features in the Pacific Ocean
+        response = self._testApiCall('core-vector-api-tiles',
+                                     ['tiles', 'qdjango', self.project310.instance.pk,
+                                      cities.qgs_layer_id, 4, 0, 8])
+        self.assertEqual(response.content, b'')
+
+        # Projected layer: low zoom tiles exceed the validity area of the layer CRS
+        Layer.objects.filter(pk=cities.pk).update(srid=32633)
+        try:
+            for z, x, y in ((0, 0, 0), (1, 0, 0), (1, 1, 1)):
+                response = self._testApiCall('core-vector-api-tiles',
+                                             ['tiles', 'qdjango', self.project310.instance.pk,
+                                              cities.qgs_layer_id, z, x, y])
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        finally:
+            Layer.objects.filter(pk=cities.pk).update(srid=cities.srid)
+
     def test_filtertoken_api(self):
         """ Test vector layer api data with 'filtertoken' param """
 
@@ -1143,6 +1258,32 @@ class TestQdjangoLayersAPI(QdjangoTestBase):
 
         self.assertEqual(resp['vector']['count'], 0)
 
+        # feature ids token filter
+        session_filter.qgs_expr = ''
+        session_filter.update_fids(fidsout=[1, 2, 3])
+        session_filter.save()
+
+        resp = json.loads(self._testApiCall('core-vector-api',
+                                            ['data', 'qdjango', self.project310.instance.pk,
+                                                cities.qgs_layer_id],
+                                            {
+                                                'filtertoken': session_token.token
+                                            }).content)
+
+        self.assertEqual(resp['vector']['count'], 8962)
+
+        session_filter.update_fids(fidsin=[1, 4, 5])
+        session_filter.save()
+
+        resp = json.loads(self._testApiCall('core-vector-api',
+                                            ['data', 'qdjango', self.project310.instance.pk,
+                                                cities.qgs_layer_id],
+                                            {
+                                                'filtertoken': session_token.token
+                                            }).content)
+
+        self.assertEqual(resp['vector']['count'], 2)
+
         # submit a fake token/ filter token of other layer
         resp = json.loads(self._testApiCall('core-vector-api',
                                             ['data', 'qdjango', self.project310.instance.pk,
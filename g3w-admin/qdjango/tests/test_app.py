@@ -63,3 +63,116 @@ class AppTest(QdjangoTestBase):
         self.assertTrue(isinstance(qgs_project, QgsProject))
         for layer in list(qgs_project.mapLayers().values()):
             self.assertTrue(layer.isValid(), 'Layer %s is not valid!' % layer.id())
+
+    def test_project_cache_eviction(self):
+        """test bounded projects cache, preloading and stats"""
+
+        from qdjango.apps import PROJECT_CACHE_STATS, get_project_cache_stats, remove_project_from_cache
+        from qdjango.utils.project_cache import (flush_project_usage, get_most_used_project_ids,
+                                                 preload_qgs_projects, record_project_usage)
+
+        path = self.qdjango_project.qgis_file.path
+        other_path = '{}{}{}'.format(CURRENT_PATH, TEST_BASE_PATH, 'geopackage_join.qgs')
+
+        remove_project_from_cache(path)
+        remove_project_from_cache(other_path)
+
+        with self.settings(QDJANGO_PROJECT_CACHE_SIZE=1):
+
+            misses = PROJECT_CACHE_STATS['misses']
+            hits = PROJECT_CACHE_STATS['hits']
+            evictions = PROJECT_CACHE_STATS['evictions']
+
+            self.assertEqual(preload_qgs_projects(), [])
+            with self.settings(QDJANGO_PRELOAD_PROJECTS=[self.qdjango_project.pk]):
+                self.assertEqual(preload_qgs_projects(), [self.qdjango_project.pk])
+            self.assertEqual(PROJECT_CACHE_STATS['misses'], misses + 1)
+
+            get_qgs_project(path)
+            self.assertEqual(PROJECT_CACHE_STATS['hits'], hits + 1)
+
+            # Least recently used project is evicted
+            get_qgs_project(other_path)
+            stats = get_project_cache_stats()
+            self.assertEqual(stats['misses'], misses + 2)
+            self.assertEqual(stats['evictions'], evictions + 1)
+            self.assertEqual(stats['projects'], [other_path])
+            self.assertTrue(stats['avg_load_time'] > 0)
+
+            get_qgs_project(path)
+            self.assertEqual(PROJECT_CACHE_STATS['misses'], misses + 3)
+            self.assertEqual(get_project_cache_stats()['projects'], [path])
+
+        # Most used projects
+        with self.settings(QDJANGO_PROJECT_USAGE_CACHE='default'):
+            record_project_usage(999999)
+            record_project_usage(self.qdjango_project.pk)
+            record_project_usage(self.qdjango_project.pk)
+            flush_project_usage()
+            self.assertEqual(get_most_used_project_ids(1), [self.qdjango_project.pk])
+            self.assertEqual(get_most_used_project_ids(5), [self.qdjango_project.pk, 999999])
+
+    def test_project_change_events(self):
+        """test projects cache invalidation by project change events"""
+
+        from django.core.cache import caches
+        from qdjango.apps import PROJECT_CACHE_STATS, ProjectChangeEvents, get_project_cache_stats
+
+        path = self.qdjango_project.qgis_file.path
+
+        with self.settings(QDJANGO_PROJECT_EVENTS_CACHE='default', QDJANGO_PROJECT_EVENTS_INTERVAL=3600):
+
+            # Project save removes the project from the cache of the current process
+            get_qgs_project(path)
+            self.assertIn(path, get_project_cache_stats()['projects'])
+            self.qdjango_project.save()
+            self.assertNotIn(path, get_project_cache_stats()['projects'])
+
+            get_qgs_project(path)
+            misses = PROJECT_CACHE_STATS['misses']
+            get_qgs_project(path)
+            self.assertEqual(PROJECT_CACHE_STATS['misses'], misses)
+
+            # Change notified by another process: checked after the interval
+            cache = caches['default']
+            cache.set(ProjectChangeEvents._version_key(path), 'other', None)
+            cache.incr(ProjectChangeEvents.EVENTS_CACHE_KEY)
+
+            get_qgs_project(path)
+            self.assertEqual(PROJECT_CACHE_STATS['misses'], misses)
+
+            ProjectChangeEvents._last_check = None
+            get_qgs_project(path)
+            self.assertEqual(PROJECT_CACHE_STATS['misses'], misses + 1)
+
+            get_qgs_project(path)
+            self.assertEqual(PROJECT_CACHE_STATS['misses'], misses + 1)
+
+    def test_get_qgs_project_request_memo(self):
+        """test get_qgs_project per request memo"""
+
+        from qdjango.apps import PROJECT_CACHE_STATS, begin_request_projects, end_request_projects
+
+        path = self.qdjango_project.qgis_file.path
+        other_path = '{}{}{}'.format(CURRENT_PATH, TEST_BASE_PATH, 'geopackage_join.qgs')
+
+        begin_request_projects()
+        try:
+            qgs_project = get_qgs_project(path)
+            hits = PROJECT_CACHE_STATS['hits']
+            misses = PROJECT_CACHE_STATS['misses']
+
+            self.assertIs(get_qgs_project(path), qgs_project)
+            self.assertEqual(PROJECT_CACHE_STATS['hits'], hits)
+
+            # Switching project sets the QGIS project instance
+            other_project = get_qgs_project(other_path)
+            self.assertIs(QgsProject.instance(), other_project)
+            self.assertIs(get_qgs_project(path), qgs_project)
+            self.assertIs(QgsProject.instance(), qgs_project)
+            self.assertEqual(PROJECT_CACHE_STATS['hits'] + PROJECT_CACHE_STATS['misses'], hits + misses + 1)
+        finally:
+            end_request_projects()
+
+        get_qgs_project(path)
+        self.assertEqual(PROJECT_CACHE_STATS['hits'] + PROJECT_CACHE_STATS['misses'], hits + misses + 2)
@@ -14,11 +14,12 @@ import json
 import logging
 import os
 import zipfile
+from collections import OrderedDict
 from io import BytesIO
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import Client
+from django.test import Client, override_settings
 from django.urls import reverse
 from guardian.shortcuts import assign_perm, get_anonymous_user
 from qgis.core import QgsVectorLayer, QgsFeatureRequest, QgsExpression, Qgis
@@ -39,6 +40,8 @@ from qdjango.models import (
     ColumnAcl
 )
 from django.contrib.auth.models import Group as AuthGroup
+from qdjango.models.projects import _VISIBLE_FIELDS, VISIBLE_FIELDS_CACHE_TIMEOUT
+from qdjango.utils.acl import get_acl_version
 
 from unittest import skipIf
 from .base import QdjangoTestBase
@@ -194,6 +197,96 @@ class TestColumnAcl(QdjangoTestBase):
         self.cloned_layer = Layer.objects.get(pk=self.cloned_layer.pk)
         self.assertFalse(self.cloned_layer.has_column_acl)
 
+    def test_visible_fields_cache(self):
+        """Test cached visible fields and their invalidation"""
+
+        self.assertIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+
+        # Cached: no ACL queries
+        with self.assertNumQueries(0):
+            self.assertIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+
+        acl = ColumnAcl(layer=self.cloned_layer, group=self.viewer1_group, restricted_fields=['APPROX'])
+        acl.save()
+        self.assertNotIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+        with self.assertNumQueries(0):
+            self.assertNotIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+
+        # User groups changes
+        self.viewer1_group.user_set.remove(self.test_user1)
+        self.assertIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+        self.viewer1_group.user_set.add(self.test_user1)
+        self.assertNotIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+
+        acl.restricted_fields = ['AREA']
+        acl.save()
+        self.assertIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+        self.assertNotIn('AREA', self.cloned_layer.visible_fields_for_user(self.test_user1))
+
+        acl.delete()
+        self.cloned_layer = Layer.objects.get(pk=self.cloned_layer.pk)
+        self.assertIn('AREA', self.cloned_layer.visible_fields_for_user(self.test_user1))
+
+    def test_visible_fields_other_process(self):
+        """Test visible fields without ACL cache shared between processes: changes made by other processes
+        are seen after VISIBLE_FIELDS_CACHE_TIMEOUT"""
+
+        acl = ColumnAcl(layer=self.cloned_layer, group=self.viewer1_group, restricted_fields=['APPROX'])
+        acl.save()
+        self.cloned_layer = Layer.objects.get(pk=self.cloned_layer.pk)
+        self.assertNotIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+
+        # has_column_acl is not changed, the process cache of this process is not cleared
+        cached = OrderedDict(_VISIBLE_FIELDS)
+        acl.restricted_fields = ['AREA']
+        acl.save()
+        _VISIBLE_FIELDS.update(cached)
+
+        self.cloned_layer = Layer.objects.get(pk=self.cloned_layer.pk)
+        with self.assertNumQueries(0):
+            self.assertNotIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+
+        # Expired
+        for key, (stamp, attributes, cached_time) in list(_VISIBLE_FIELDS.items()):
+            _VISIBLE_FIELDS[key] = (stamp, attributes, cached_time - VISIBLE_FIELDS_CACHE_TIMEOUT)
+        self.assertIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+        self.assertNotIn('AREA', self.cloned_layer.visible_fields_for_user(self.test_user1))
+
+        acl.delete()
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'acl': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'acl'}
+    }, QDJANGO_ACL_CACHE='acl')
+    def test_visible_fields_other_process_acl_cache(self):
+        """Test visible fields cached with the ACL version shared between processes"""
+
+        acl = ColumnAcl(layer=self.cloned_layer, group=self.viewer1_group, restricted_fields=['APPROX'])
+        acl.save()
+        self.cloned_layer = Layer.objects.get(pk=self.cloned_layer.pk)
+        self.assertNotIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+        with self.assertNumQueries(0):
+            self.assertNotIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+
+        # ColumnAcl changed by another process, has_column_acl is not changed
+        cached = OrderedDict(_VISIBLE_FIELDS)
+        acl.restricted_fields = ['AREA']
+        acl.save()
+        _VISIBLE_FIELDS.update(cached)
+
+        self.cloned_layer = Layer.objects.get(pk=self.cloned_layer.pk)
+        self.assertTrue(self.cloned_layer.has_column_acl)
+        self.assertIn('APPROX', self.cloned_layer.visible_fields_for_user(self.test_user1))
+        self.assertNotIn('AREA', self.cloned_layer.visible_fields_for_user(self.test_user1))
+
+        # Project reloaded by another process: layers fields can be changed
+        cached = OrderedDict(_VISIBLE_FIELDS)
+        self.cloned_project.save()
+        _VISIBLE_FIELDS.update(cached)
+        self.assertNotEqual(_VISIBLE_FIELDS[(self.cloned_layer.pk, self.test_user1.pk)][0][3], get_acl_version())
+
+        acl.delete()
+
     def test_model_constraints(self):
         """Test model validation"""
 
@@ -19,10 +19,13 @@ from io import BytesIO
 from django.conf import settings
 from django.contrib.auth.models import Group as UserGroup
 from django.contrib.auth.models import User
-from django.test import Client
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from guardian.shortcuts import assign_perm, get_anonymous_user
-from qgis.core import QgsVectorLayer, QgsFeatureRequest, QgsExpression, Qgis
+from qgis.core import QgsVectorLayer, QgsFeatureRequest, QgsExpression, Qgis, QgsExpressionContext, \
+    QgsFeature, QgsGeometry, QgsPointXY
 from qgis.PyQt.QtCore import QTemporaryDir
 
 from qdjango.apps import QGS_SERVER, get_qgs_project
@@ -37,6 +40,9 @@ from qdjango.models import (
     Layer,
     Project
 )
+from qdjango.models.geoconstraints import _CONSTRAINT_GEOMETRIES
+from qdjango.utils.acl import ProjectACLSnapshot
+from qdjango.utils.models import get_layer_acl_fingerprint
 from unittest import skipIf
 from .base import QdjangoTestBase
 
@@ -1764,6 +1770,83 @@ class SingleLayerExpressionConstraints(TestSingleLayerConstraintsBase):
 class TestGeoConstraintsServerFilters(TestSingleLayerConstraintsBase):
     """For GeoConstraint filters"""
 
+    def test_geoconstraint_geometry_cache(self):
+        """Test GeoConstraintRule cached geometry and g3w_geoconstraint expression function"""
+
+        constraint = GeoConstraint(
+            layer=self.spatialite_points, constraint_layer=self.world, active=True)
+        constraint.save()
+        rule = GeoConstraintRule(constraint=constraint, user=self.test_user1, rule="NAME = 'ITALY'")
+        rule.save()
+
+        key = rule.geometry_cache_key
+        data = rule.get_constraint_geometry_data()
+        self.assertGreater(data['count'], 0)
+        bbox = rule.get_constraint_bbox()
+        self.assertTrue(bbox.contains(QgsPointXY(12.5, 42)))
+        self.assertFalse(bbox.contains(QgsPointXY(3, 28)))
+
+        geometry, count = rule.get_constraint_geometry()
+        self.assertEqual(count, data['count'])
+        self.assertEqual(geometry.srid, 4326)
+
+        # Geometry is not embedded into the expression
+        expression_text = rule.get_qgis_expression()
+        self.assertEqual(expression_text, f"g3w_geoconstraint('{key}')")
+
+        feature = QgsFeature()
+        context = QgsExpressionContext()
+        expression = QgsExpression(expression_text)
+        for wkt, result in (('POINT(12.5 42)', True), ('POINT(3 28)', False)):
+            feature.setGeometry(QgsGeometry.fromWkt(wkt))
+            context.setFeature(feature)
+            self.assertEqual(bool(expression.evaluate(context)), result, wkt)
+
+        # Constraint layer edited: new geometry cache key
+        Layer.bump_data_version([self.world])
+        rule = GeoConstraintRule.objects.get(pk=rule.pk)
+        self.assertNotEqual(rule.geometry_cache_key, key)
+
+        # Stale key of an expression built before the edit: the geometry is rebuilt once
+        _CONSTRAINT_GEOMETRIES.clear()
+        feature.setGeometry(QgsGeometry.fromWkt('POINT(12.5 42)'))
+        context.setFeature(feature)
+        self.assertTrue(expression.evaluate(context))
+        self.assertIn(key, _CONSTRAINT_GEOMETRIES)
+        with self.assertNumQueries(0):
+            self.assertTrue(expression.evaluate(context))
+
+        # Deleted rule: cached negative result
+        self.assertFalse(GeoConstraintRule.check_geometry('0:0:0:0:0', feature.geometry()))
+        with self.assertNumQueries(0):
+            self.assertFalse(GeoConstraintRule.check_geometry('0:0:0:0:0', feature.geometry()))
+
+        constraint.delete()
+
+    def test_geoconstraint_acl_fingerprint(self):
+        """Test ACL fingerprint queries don't grow with geoconstraint rules"""
+
+        def fingerprint_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                fingerprint = get_layer_acl_fingerprint(self.test_user1, self.spatialite_points)
+            return fingerprint, len(ctx.captured_queries)
+
+        constraints = []
+        for rule in ("NAME = 'ITALY'", "NAME = 'FRANCE'"):
+            constraint = GeoConstraint(layer=self.spatialite_points, constraint_layer=self.world, active=True)
+            constraint.save()
+            GeoConstraintRule(constraint=constraint, user=self.test_user1, rule=rule).save()
+            constraints.append(constraint)
+            fingerprint, queries = fingerprint_queries()
+            if len(constraints) == 1:
+                one_rule_queries = queries
+
+        self.assertEqual(len(fingerprint[4]), 2)
+        self.assertEqual(queries, one_rule_queries)
+
+        for constraint in constraints:
+            constraint.delete()
+
     def test_geoconstraint_filter(self):
         """Test GeoConstraint filter"""
 
@@ -2225,3 +2308,70 @@ class TestGeoConstraintsServerFilters(TestSingleLayerConstraintsBase):
         })
 
         self.assertTrue(b'another point' in response.content)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'acl': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'acl'}
+}, QDJANGO_ACL_CACHE='acl')
+class TestProjectACLSnapshot(TestSingleLayerConstraintsBase):
+    """Test access control rules snapshot used by QGIS Server access control filters"""
+
+    def test_snapshot(self):
+        """Test snapshot content, cache and invalidation"""
+
+        admin01 = self.test_user1
+
+        snapshot = ProjectACLSnapshot(admin01, self.qdjango_project)
+        self.assertEqual(snapshot.layer('world20181008111156525')['subset_string'], '')
+        self.assertEqual(snapshot.layer('world20181008111156525')['pk'], self.world.pk)
+        self.assertIsNone(snapshot.layer('world20181008111156525')['visible_fields'])
+        self.assertIsNone(snapshot.layer('not_a_layer'))
+
+        # Rules saving invalidates cached snapshots
+        constraint = SingleLayerConstraint(layer=self.world, active=True)
+        constraint.save()
+        ConstraintSubsetStringRule(constraint=constraint, user=admin01, rule="NAME != 'ITALY'").save()
+        ConstraintExpressionRule(constraint=constraint, user=admin01, rule="NAME != 'GERMANY'").save()
+
+        snapshot = ProjectACLSnapshot(admin01, self.qdjango_project)
+        layer_acl = snapshot.layer('world20181008111156525')
+        self.assertEqual(layer_acl['subset_string'], "(NAME != 'ITALY')")
+        self.assertEqual(layer_acl['expression'], "(NAME != 'GERMANY')")
+        self.assertEqual(snapshot.layer('spatialite_points20190604101052075')['subset_string'], '')
+
+        # Cached: rules are not queried again
+        snapshot = ProjectACLSnapshot(admin01, self.qdjango_project)
+        snapshot.build = None
+        self.assertEqual(snapshot.layer('world20181008111156525')['subset_string'], "(NAME != 'ITALY')")
+
+        # Other users are not affected
+        snapshot = ProjectACLSnapshot(self.test_user2, self.qdjango_project)
+        self.assertEqual(snapshot.layer('world20181008111156525')['subset_string'], '')
+
+        constraint.delete()
+        snapshot = ProjectACLSnapshot(admin01, self.qdjango_project)
+        self.assertEqual(snapshot.layer('world20181008111156525')['subset_string'], '')
+
+        # Snapshot from layers rules built by another process (render workers)
+        with self.assertNumQueries(0):
+            prebuilt = ProjectACLSnapshot(admin01, self.qdjango_project, layers=snapshot.layers)
+            self.assertEqual(prebuilt.layer('world20181008111156525')['pk'], self.world.pk)
+
+    def test_session_filter(self):
+        """Test session filters memoized by the snapshot"""
+
+        session_token = SessionTokenFilter.objects.create(user=self.test_user1)
+        session_token.stf_layers.create(layer=self.world, qgs_expr="NAME = 'ITALY'")
+
+        snapshot = ProjectACLSnapshot(self.test_user1, self.qdjango_project)
+        session_filter = snapshot.session_filter(session_token.token, 'world20181008111156525')
+        self.assertEqual(session_filter.expression, "NAME = 'ITALY'")
+        self.assertIsNone(snapshot.session_filter(session_token.token, 'spatialite_points20190604101052075'))
+        self.assertIsNone(snapshot.session_filter(session_token.token, 'not_a_layer'))
+
+        with self.assertNumQueries(0):
+            self.assertIs(snapshot.session_filter(session_token.token, 'world20181008111156525'), session_filter)
+            self.assertIsNone(snapshot.session_filter(session_token.token, 'spatialite_points20190604101052075'))
+
+        session_token.delete()
@@ -13,6 +13,7 @@ __copyright__ = 'Copyright 2020, Gis3w'
 
 import json
 import os
+import threading
 from unittest import skip
 
 from core.models import G3WSpatialRefSys
@@ -305,9 +306,158 @@ class OwsTest(QdjangoTestBase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/pdf')
 
+    def test_ows_response_cache(self):
+        """Test cache of GetMap responses"""
 
+        from django.core.cache import caches
+        from qdjango.utils.ows_cache import normalize_ows_params, OWSResponseCache
 
+        self.assertEqual(normalize_ows_params({'request': 'GetMap', 'Format': 'IMAGE/PNG', 'LAYERS': 'World',
+                                               'BBOX': '-180.0000000001,-90,180,90.00'}),
+                         [('BBOX', '-180,-90,180,90'), ('FORMAT', 'image/png'), ('LAYERS', 'World'),
+                          ('REQUEST', 'getmap')])
 
+        ows_url = reverse('OWS:ows', kwargs={'group_slug': self.qdjango_project.group.slug, 'project_type': 'qdjango',
+                                             'project_id': self.qdjango_project.id})
+
+        params = {
+            'SERVICE': 'WMS',
+            'VERSION': '1.3.0',
+            'REQUEST': 'GetMap',
+            'FORMAT': 'image/png',
+            'TRANSPARENT': 'true',
+            'LAYERS': 'bluemarble',
+            'CRS': 'EPSG:4326',
+            'STYLES': '',
+            'WIDTH': '256',
+            'HEIGHT': '256',
+            'BBOX': '-90,-180,90,180',
+        }
+
+        ows_caches = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'some',
+            },
+            'ows': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'ows',
+            }
+        }
+
+        with self.settings(CACHES=ows_caches, QDJANGO_OWS_CACHE='ows'):
+
+            ows_cache = caches['ows']
+            ows_cache.clear()
+
+            c = Client()
+            self.assertTrue(c.login(username='admin01', password='admin01'))
+
+            response = c.get(ows_url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+
+            # Project version token and the response
+            self.assertEqual(len(ows_cache._cache), 2)
+
+            # Same request with different case and bbox format: served by the cache
+            cached_params = params.copy()
+            cached_params.update({'FORMAT': 'IMAGE/PNG', 'BBOX': '-90.0,-180.0,90.0,180.0'})
+            cached_response = c.get(ows_url, cached_params)
+            self.assertEqual(cached_response.status_code, 200)
+            self.assertEqual(cached_response.content, response.content)
+            self.assertEqual(len(ows_cache._cache), 2)
 
+            # GetCapabilities is not cached
+            c.get(ows_url, {'REQUEST': 'GetCapabilities', 'SERVICE': 'WMS'})
+            self.assertEqual(len(ows_cache._cache), 2)
 
+            # Project save renews the project token
+            self.qdjango_project.save()
+            response = c.get(ows_url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(ows_cache._cache), 3)
+
+            # Data files modification times are read from layers datasources, also without the QGIS project
+            bluemarble = self.qdjango_project.layer_set.get(qgs_layer_id__startswith='bluemarble')
+            key = OWSResponseCache(None, self.qdjango_project, params).key()
+            stat = os.stat(bluemarble.datasource)
+            os.utime(bluemarble.datasource, (stat.st_atime, stat.st_mtime + 10))
+            try:
+                self.assertNotEqual(OWSResponseCache(None, self.qdjango_project, params).key(), key)
+            finally:
+                os.utime(bluemarble.datasource, (stat.st_atime, stat.st_mtime))
+
+            ows_cache.clear()
+
+    def test_render_workers(self):
+        """Test render workers routing and fallback"""
+
+        from multiprocessing.connection import Listener
+        from qdjango.utils.render_workers import ConsistentHashRing, RenderWorker, get_render_worker_authkey
+
+        ring = ConsistentHashRing(['/tmp/w0.sock', '/tmp/w1.sock', '/tmp/w2.sock'])
+        owners = {str(pk): ring.get_nodes(str(pk)) for pk in range(100)}
+        for nodes in owners.values():
+            self.assertEqual(sorted(nodes), ['/tmp/w0.sock', '/tmp/w1.sock', '/tmp/w2.sock'])
+
+        # Every worker owns a share of projects
+        self.assertEqual(len(set(nodes[0] for nodes in owners.values())), 3)
+
+        # Removing a worker moves only its projects
+        ring = ConsistentHashRing(['/tmp/w0.sock', '/tmp/w1.sock'])
+        for key, nodes in owners.items():
+            if nodes[0] != '/tmp/w2.sock':
+                self.assertEqual(ring.get_nodes(key)[0], nodes[0])
+
+        ows_url = reverse('OWS:ows', kwargs={'group_slug': self.qdjango_project.group.slug, 'project_type': 'qdjango',
+                                             'project_id': self.qdjango_project.id})
+
+        c = Client()
+        self.assertTrue(c.login(username='admin01', password='admin01'))
 
+        # No worker is listening: fallback to the Django process
+        with self.settings(QDJANGO_RENDER_WORKERS=['/tmp/g3w-render-test-missing.sock']):
+            response = c.get(ows_url, {
+                'REQUEST': 'GetCapabilities',
+                'SERVICE': 'WMS'
+            })
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(b'<Name>bluemarble</Name>' in response.content)
+
+        with self.settings(QDJANGO_RENDER_WORKERS=['/tmp/g3w-render-test-missing.sock'],
+                           QDJANGO_RENDER_WORKERS_FALLBACK=False):
+            response = c.get(ows_url, {
+                'REQUEST': 'GetCapabilities',
+                'SERVICE': 'WMS'
+            })
+            self.assertEqual(response.status_code, 500)
+
+        # Worker dying after the connection: fallback to the Django process
+        address = '/tmp/g3w-render-test-dying.sock'
+        if os.path.exists(address):
+            os.remove(address)
+        listener = Listener(address, authkey=get_render_worker_authkey())
+
+        def dying_worker():
+            conn = listener.accept()
+            conn.recv()
+            conn.close()
+
+        worker = threading.Thread(target=dying_worker)
+        worker.start()
+        try:
+            with self.settings(QDJANGO_RENDER_WORKERS=[address]):
+                response = c.get(ows_url, {
+                    'REQUEST': 'GetCapabilities',
+                    'SERVICE': 'WMS'
+                })
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(b'<Name>bluemarble</Name>' in response.content)
+        finally:
+            worker.join(10)
+            listener.close()
+
+        # Not existing user
+        reply = RenderWorker(address).handle({'project': self.qdjango_project.pk, 'user': 0})
+        self.assertEqual(reply['status'], 404)
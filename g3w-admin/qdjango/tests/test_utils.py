@@ -20,10 +20,16 @@ from qdjango.utils.exceptions import QgisProjectLayerException, QgisProjectExcep
 from qdjango.utils.structure import get_schema_table, datasource2dict, datasourcearcgis2dict
 from qdjango.utils.models import get_widgets4layer, comparedbdatasource, get_capabilities4layer
 from qdjango.templatetags.qdjango_tags import is_geom_type_gpx_compatible
+from qdjango.utils.layer_indexes import LayerIndexManager
+from guardian.shortcuts import assign_perm, get_objects_for_user
+from usersmanage.utils import ProjectPermissionsSnapshot
+from qgis.core import QgsVectorLayer
+from qgis.PyQt.QtCore import QTemporaryDir
 from collections import OrderedDict
 import os
 import json
 import requests
+import shutil
 
 CURRENT_PATH = os.getcwd()
 TEST_BASE_PATH = '/qdjango/tests/data/'
@@ -543,3 +549,57 @@ class TestTemplateTags(QdjangoTestBase):
         self.assertTrue(is_geom_type_gpx_compatible(spatialite_points))
         self.assertFalse(is_geom_type_gpx_compatible(world))
 
+
+class TestLayerIndexManager(QdjangoTestBase):
+    """Test spatial and attribute indexes of file based layers"""
+
+    def test_spatial_index(self):
+        """Build the missing spatial index of a Shapefile"""
+
+        world = self.project.instance.layer_set.get(qgs_layer_id='world20181008111156525')
+
+        # Work on a copy of a Shapefile without spatial index
+        tmp_dir = QTemporaryDir()
+        base_path = os.path.join(DATASOURCE_PATH, 'geodata', 'rivers')
+        for ext in ('.shp', '.shx', '.dbf', '.prj'):
+            shutil.copy(base_path + ext, tmp_dir.path())
+        shp_path = os.path.join(tmp_dir.path(), os.path.basename(base_path) + '.shp')
+
+        manager = LayerIndexManager(world, QgsVectorLayer(shp_path, 'rivers', 'ogr'))
+        self.assertTrue(manager.supported)
+        report = manager.report()
+        self.assertTrue(report['spatial'])
+        self.assertEqual(report['attributes'], [])
+
+        created = manager.repair()
+        self.assertTrue(created['spatial'])
+        self.assertTrue(os.path.exists(os.path.join(tmp_dir.path(), os.path.basename(base_path) + '.qix')))
+
+        manager = LayerIndexManager(world, QgsVectorLayer(shp_path, 'rivers', 'ogr'))
+        self.assertFalse(manager.report()['spatial'])
+
+
+class TestProjectPermissionsSnapshot(QdjangoTestBase):
+    """Test permissions snapshot of qdjango projects"""
+
+    def test_layers_with_perm(self):
+        """Layers with a permission are the same of guardian get_objects_for_user()"""
+
+        project = self.project.instance
+        layers = list(project.layer_set.order_by('pk'))
+
+        assign_perm('qdjango.view_layer', self.test_viewer1, layers[0])
+        assign_perm('qdjango.view_layer', self.test_gu_viewer1, layers[1])
+        assign_perm('qdjango.change_layer', self.test_viewer1, layers[1])
+        assign_perm('qdjango.view_layer', self.anonymoususer, layers[2])
+
+        for user in (self.test_viewer1, self.test_viewer1_3, self.anonymoususer, self.test_user1):
+            perms = ProjectPermissionsSnapshot(user, project)
+            for perm in ('qdjango.view_layer', 'qdjango.change_layer'):
+                expected = set(get_objects_for_user(user, perm, Layer).filter(
+                    project=project).values_list('pk', flat=True))
+                self.assertEqual(set(l.pk for l in perms.layers_with_perm(perm)), expected, (user, perm))
+
+        # Superuser: every layer
+        self.assertEqual(len(ProjectPermissionsSnapshot(self.test_user1, project).layers_with_perm(
+            'qdjango.change_layer')), len(layers))
@@ -0,0 +1,210 @@
+# coding=utf-8
+"""
+    Access control snapshot of a project for a user, used by QGIS Server access control filters.
+
+    The snapshot holds, for every layer of the project, the constraints subset string, the constraints
+    expression, the geoconstraints expression and the visible columns: it is built once per OWS request
+    and, if QDJANGO_ACL_CACHE setting is set, shared between requests through the Django cache.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the Mozilla Public License 2.0.
+"""
+
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+ACL_SNAPSHOT_CACHE_KEY = 'qdjango_acl_{}_{}_{}'
+ACL_VERSION_CACHE_KEY = 'qdjango_acl_version'
+
+
+def get_acl_cache():
+    """
+    Return the Django cache instance set by QDJANGO_ACL_CACHE setting
+    :return: Django cache instance or None if ACL snapshots are not shared between requests
+    """
+
+    cache_name = getattr(settings, 'QDJANGO_ACL_CACHE', None)
+    if not cache_name or cache_name not in settings.CACHES:
+        return None
+    return caches[cache_name]
+
+
+def get_acl_version():
+    """
+    Return the current ACL version token, a new one is created if not exists
+    :return: str or None if ACL cache is disabled
+    """
+
+    cache = get_acl_cache()
+    if cache is None:
+        return None
+
+    version = cache.get(ACL_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(ACL_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(ACL_VERSION_CACHE_KEY)
+    return version
+
+
+def invalidate_acl_snapshots():
+    """
+    Renew the ACL version token: every cached ACL snapshot is invalidated
+    :return: None
+    """
+
+    cache = get_acl_cache()
+    if cache is None:
+        return
+    cache.set(ACL_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+class ProjectACLSnapshot(object):
+    """
+    Access control rules of every layer of a project for a user.
+    Rules are loaded lazily at the first access.
+    """
+
+    def __init__(self, user, project, layers=None):
+        """
+        :param user: Django User instance (or AnonymousUser)
+        :param project: qdjango Project model instance
+        :param layers: optional rules of layers already built, i.e. `layers` of a snapshot built by another process
+        """
+
+        self.user = user
+        self.project = project
+        self._layers = layers
+        self._session_filters = {}
+
+    def _cache_key(self):
+        """
+        Cache key: ACL version token, project, user and user groups, data versions of geoconstraint layers
+        :return: str or None if ACL cache is disabled
+        """
+
+        from qdjango.models import GeoConstraint
+
+        version = get_acl_version()
+        if version is None:
+            return None
+
+        if self.user.is_anonymous:
+            user_parts = ['anonymous']
+        else:
+            user_parts = [self.user.pk, sorted(self.user.groups.values_list('pk', flat=True))]
+
+        constraint_layers = sorted(GeoConstraint.objects.filter(layer__project=self.project).values_list(
+            'constraint_layer_id', 'constraint_layer__data_version'))
+
+        parts = str([self.project.modified, user_parts, constraint_layers]).encode('utf-8')
+        return ACL_SNAPSHOT_CACHE_KEY.format(version, self.project.pk, hashlib.md5(parts).hexdigest())
+
+    def build(self):
+        """
+        Query the access control rules of project layers.
+        Only layers with constraints or column ACL are queried for rules.
+        :return: dict, qgs_layer_id as key
+        """
+
+        from qdjango.models import Layer, SingleLayerConstraint, GeoConstraint, \
+            ConstraintSubsetStringRule, ConstraintExpressionRule, GeoConstraintRule
+
+        layers = {}
+        for layer in Layer.objects.filter(project=self.project):
+            layers[layer.qgs_layer_id] = {
+                'pk': layer.pk,
+                'subset_string': '',
+                'expression': '',
+                'geo_expression': '',
+                'visible_fields': layer.visible_fields_for_user(self.user) if layer.has_column_acl else None
+            }
+
+        pks = {l['pk']: l for l in layers.values()}
+
+        constrained = set(SingleLayerConstraint.objects.filter(
+            layer__project=self.project, active=True).values_list('layer_id', flat=True))
+        for layer_id in constrained:
+            pks[layer_id]['subset_string'] = ConstraintSubsetStringRule.get_rule_definition_for_user(
+                self.user, layer_id)
+            pks[layer_id]['expression'] = ConstraintExpressionRule.get_rule_definition_for_user(
+                self.user, layer_id)
+
+        geo_constrained = set(GeoConstraint.objects.filter(
+            layer__project=self.project, active=True).values_list('layer_id', flat=True))
+        for layer in Layer.objects.filter(pk__in=geo_constrained):
+            pks[layer.pk]['geo_expression'] = GeoConstraintRule.get_rule_definition_for_user(self.user, layer)
+
+        return layers
+
+    @property
+    def layers(self):
+        """
+        Access control rules of project layers, loaded from ACL cache or built
+        :return: dict, qgs_layer_id as key
+        """
+
+        if self._layers is None:
+
+            cache = get_acl_cache()
+            key = self._cache_key() if cache is not None else None
+            if key:
+                self._layers = cache.get(key)
+
+            if self._layers is None:
+                self._layers = self.build()
+                if key:
+                    cache.set(key, self._layers, getattr(settings, 'QDJANGO_ACL_CACHE_TIMEOUT', 3600))
+
+        return self._layers
+
+    def layer(self, qgs_layer_id):
+        """
+        Access control rules of a project layer
+        :param qgs_layer_id: QGIS layer id
+        :return: dict with keys `pk`, `subset_string`, `expression`, `geo_expression`
+                 and `visible_fields` (None if layer has not column ACL), None if the layer doesn't exist
+        """
+
+        return self.layers.get(qgs_layer_id)
+
+    def session_filter(self, token, qgs_layer_id):
+        """
+        Session filter of a project layer for a filter token, memoized: QGIS Server access control filters
+        ask for it more times per layer
+        :param token: filter token
+        :param qgs_layer_id: QGIS layer id
+        :return: SessionLayerFilter instance or None
+        """
+
+        from qdjango.models import SessionTokenFilter
+
+        key = (token, qgs_layer_id)
+        if key not in self._session_filters:
+            layer = self.layer(qgs_layer_id)
+            self._session_filters[key] = None if layer is None else \
+                SessionTokenFilter.get_filter_for_token(token, layer['pk'])
+        return self._session_filters[key]
+
+
+def get_server_acl():
+    """
+    Return the ACL snapshot for user and project of the current QGIS Server request
+    (QGS_SERVER.user and QGS_SERVER.project), it's built once per request.
+    :return: ProjectACLSnapshot instance
+    """
+
+    from qdjango import apps
+
+    server = apps.QGS_SERVER
+    snapshot = getattr(server, 'acl', None)
+    if snapshot is None or snapshot.user is not server.user or snapshot.project is not server.project:
+        snapshot = ProjectACLSnapshot(server.user, server.project)
+        server.acl = snapshot
+    return snapshot
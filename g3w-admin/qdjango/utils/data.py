@@ -1521,6 +1521,12 @@ class QgisProject(XmlData):
                     self.instance.qgis_project.layerTreeRoot()))
                 self.instance.save()
 
+            # Build missing indexes of file based layers, in background after the commit
+            if getattr(settings, 'QDJANGO_AUTO_LAYER_INDEXES', True):
+                from qdjango.tasks import repair_layer_indexes_task
+                project_pk = self.instance.pk
+                transaction.on_commit(lambda: repair_layer_indexes_task(project_pk))
+
             post_save_qdjango_project_file.send(self)
 
     def updateQgisFileDatasource(self):
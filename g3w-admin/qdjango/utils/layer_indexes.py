@@ -0,0 +1,241 @@
+# coding=utf-8
+"""Spatial and attribute indexes of file based layers.
+
+Shapefiles and other OGR/SpatiaLite layers uploaded with projects often have no spatial index: bbox filters,
+identify and rendering are full scans of the file. The index manager builds the missing spatial index
+and the attribute indexes of fields used by search widgets, relations and constraints.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+    it under the terms of the Mozilla Public License 2.0.
+"""
+
+import ast
+import logging
+import sqlite3
+
+from qgis.core import (
+    QgsDataSourceUri,
+    QgsExpression,
+    QgsFeatureSource,
+    QgsProviderRegistry,
+    QgsVectorDataProvider,
+    QgsVectorLayer,
+)
+
+from core.utils.subset import SQLITE_OGR_DRIVERS
+from .search_index import get_layer_search_fields
+
+logger = logging.getLogger(__name__)
+
+# Providers of file based layers managed by the index manager
+INDEX_PROVIDERS = ('ogr', 'spatialite')
+
+
+class LayerIndexManager(object):
+    """
+    Report and build missing indexes of a file based layer
+    """
+
+    def __init__(self, layer, qgis_layer=None):
+        """
+        :param layer: qdjango Layer instance
+        :param qgis_layer: QgsVectorLayer instance of the layer, default to layer.qgis_layer
+        """
+
+        self.layer = layer
+        self._qgis_layer = qgis_layer
+
+    @property
+    def qgis_layer(self):
+        """
+        QGIS layer instance, loaded at first access
+        """
+
+        if self._qgis_layer is None:
+            self._qgis_layer = self.layer.qgis_layer
+        return self._qgis_layer
+
+    @property
+    def supported(self):
+        """
+        True for valid vector layers of file based providers
+        """
+
+        return isinstance(self.qgis_layer, QgsVectorLayer) and self.qgis_layer.isValid() and \
+            self.qgis_layer.providerType() in INDEX_PROVIDERS
+
+    def attribute_fields(self):
+        """
+        Fields to index: fields of search widgets, relations and constraints rules
+        :return: sorted list of field names of the layer provider
+        """
+
+        from qdjango.models import ConstraintExpressionRule, ConstraintSubsetStringRule
+
+        fields = set(get_layer_search_fields(self.layer, operators=None))
+
+        # Relations
+        relations = ast.literal_eval(self.layer.project.relations) if self.layer.project.relations else []
+        for relation in relations:
+            if relation['referencingLayer'] == self.layer.qgs_layer_id:
+                fields.add(relation['fieldRef']['referencingField'])
+            if relation['referencedLayer'] == self.layer.qgs_layer_id:
+                fields.add(relation['fieldRef']['referencedField'])
+
+        # Constraints: subset string rules are SQL, only the ones parsed as QGIS expressions are used
+        for model in (ConstraintExpressionRule, ConstraintSubsetStringRule):
+            for rule in model.objects.filter(constraint__layer=self.layer).values_list('rule', flat=True):
+                expression = QgsExpression(rule)
+                if not expression.hasParserError():
+                    fields.update(expression.referencedColumns())
+
+        provider_fields = self.qgis_layer.dataProvider().fields()
+        return sorted(f for f in fields if provider_fields.lookupField(f) >= 0)
+
+    def has_spatial_index(self):
+        """
+        :return: True if the provider has a spatial index, False if it hasn't, None if unknown or not spatial
+        """
+
+        if not self.qgis_layer.isSpatial():
+            return None
+
+        status = self.qgis_layer.dataProvider().hasSpatialIndex()
+        if status == QgsFeatureSource.SpatialIndexPresent:
+            return True
+        if status == QgsFeatureSource.SpatialIndexNotPresent:
+            return False
+        return None
+
+    def _sqlite_table(self):
+        """
+        Return (database path, table name) for SQLite based layers, None for other formats
+        """
+
+        provider_type = self.qgis_layer.providerType()
+        if provider_type == 'spatialite':
+            uri = QgsDataSourceUri(self.qgis_layer.source())
+            return uri.database(), uri.table()
+
+        if self.qgis_layer.dataProvider().storageType() in SQLITE_OGR_DRIVERS:
+            parts = QgsProviderRegistry.instance().decodeUri(provider_type, self.qgis_layer.source())
+            if parts.get('path') and parts.get('layerName'):
+                return parts['path'], parts['layerName']
+
+        return None
+
+    def indexed_fields(self):
+        """
+        Fields with an attribute index (first column of an index, primary keys included)
+        :return: set of field names, None if unknown for the layer format
+        """
+
+        sqlite_table = self._sqlite_table()
+        if sqlite_table is None:
+            return None
+
+        path, table = sqlite_table
+        fields = self.qgis_layer.dataProvider().fields()
+        indexed = set(fields.at(i).name() for i in self.qgis_layer.dataProvider().pkAttributeIndexes())
+
+        quoted_table = '"%s"' % table.replace('"', '""')
+        try:
+            conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+            try:
+                for index in conn.execute(f'PRAGMA index_list({quoted_table})').fetchall():
+                    columns = conn.execute('PRAGMA index_info("%s")' % index[1].replace('"', '""')).fetchall()
+                    if columns:
+                        indexed.add(columns[0][2])
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f'[LAYER INDEXES] Cannot read indexes of {path}: {e}')
+            return None
+
+        return indexed
+
+    def report(self):
+        """
+        Missing indexes of the layer
+
+        :return: dict with keys `spatial` (True if spatial index is missing),
+                 `attributes` (fields without index), `unknown` (fields with unknown index status)
+        """
+
+        report = {
+            'spatial': False,
+            'attributes': [],
+            'unknown': [],
+        }
+
+        if not self.supported:
+            return report
+
+        report['spatial'] = self.has_spatial_index() is False
+
+        fields = self.attribute_fields()
+        indexed = self.indexed_fields()
+        if indexed is None:
+            report['unknown'] = fields
+        else:
+            report['attributes'] = [f for f in fields if f not in indexed]
+
+        return report
+
+    def repair(self, unknown=False):
+        """
+        Build missing indexes
+
+        :param unknown: build also the attribute indexes with unknown status (i.e. Shapefile attribute indexes)
+        :return: dict with keys `spatial` (True if the spatial index has been built) and `attributes`
+                 (fields indexed)
+        """
+
+        created = {
+            'spatial': False,
+            'attributes': [],
+        }
+
+        report = self.report()
+        provider = self.qgis_layer.dataProvider() if self.supported else None
+        if provider is None:
+            return created
+
+        capabilities = provider.capabilities()
+
+        if report['spatial'] and capabilities & QgsVectorDataProvider.CreateSpatialIndex:
+            created['spatial'] = provider.createSpatialIndex()
+            if not created['spatial']:
+                logger.warning(f'[LAYER INDEXES] Cannot create spatial index of layer {self.layer.qgs_layer_id}')
+
+        if capabilities & QgsVectorDataProvider.CreateAttributeIndex:
+            for field in report['attributes'] + (report['unknown'] if unknown else []):
+                if provider.createAttributeIndex(provider.fields().lookupField(field)):
+                    created['attributes'].append(field)
+                else:
+                    logger.warning(f'[LAYER INDEXES] Cannot create index on field {field} '
+                                   f'of layer {self.layer.qgs_layer_id}')
+
+        if created['spatial'] or created['attributes']:
+            logger.info(f'[LAYER INDEXES] Layer {self.layer.qgs_layer_id}: spatial index '
+                        f'{"created" if created["spatial"] else "unchanged"}, '
+                        f'attribute indexes created on {created["attributes"]}')
+
+        return created
+
+
+def repair_project_layer_indexes(project, unknown=False):
+    """
+    Build missing indexes of the file based layers of a project
+    :param project: qdjango Project instance
+    :param unknown: build also the attribute indexes with unknown status
+    :return: dict, qgs_layer_id as key and LayerIndexManager.repair() results as values
+    """
+
+    results = {}
+    for layer in project.layer_set.filter(layer_type__in=INDEX_PROVIDERS, parent_project__isnull=True):
+        try:
+            results[layer.qgs_layer_id] = LayerIndexManager(layer).repair(unknown=unknown)
+        except Exception as e:
+            logger.error(f'[LAYER INDEXES] Layer {layer.qgs_layer_id}: {e}')
+    return results
@@ -9,7 +9,7 @@ __author__ = 'lorenzetti@gis3w.it'
 __date__ = '2019-11-29'
 __copyright__ = 'Copyright 2019, GIS3W'
 
-from django.db.models import Q
+from django.db.models import Q, QuerySet
 from django.conf import settings
 from qdjango.apps import get_qgs_project
 
@@ -144,4 +144,39 @@ def get_geoconstraints4layer(layer):
     """
 
     from qdjango.models import GeoConstraint
-    return GeoConstraint.objects.filter(layer=layer)
\ No newline at end of file
+    return GeoConstraint.objects.filter(layer=layer)
+
+def get_layer_acl_fingerprint(user, layer, context='v'):
+    """
+    Return a list of values identifying the access control rules applied to a layer for a user:
+    permissions, constraint rules (data of geoconstraint layers included) and visible columns.
+    Only database queries are performed, no feature is fetched.
+    :param user: Django User instance (or AnonymousUser)
+    :param layer: Qdjango Layer model instance
+    :param context: constraints context 'v (view)' 'e (editing)' 've (view + editing)'
+    :return: list
+    """
+
+    from guardian.shortcuts import get_perms
+    from guardian.utils import get_anonymous_user
+    from qdjango.models import ConstraintSubsetStringRule, ConstraintExpressionRule, GeoConstraintRule
+
+    fingerprint = [
+        'anonymous' if user.is_anonymous else user.pk,
+        sorted(get_perms(get_anonymous_user() if user.is_anonymous else user, layer)),
+        ConstraintSubsetStringRule.get_rule_definition_for_user(user, layer.pk, context=context),
+        ConstraintExpressionRule.get_rule_definition_for_user(user, layer.pk, context=context)
+    ]
+
+    # Geoconstraint expressions depend on constraint layer features: use rules and constraint layer data version,
+    # read by one query
+    rules = GeoConstraintRule.get_active_constraints_for_user(user, layer, context=context)
+    if isinstance(rules, QuerySet):
+        rules = list(rules.order_by('pk').values_list(
+            'pk', 'rule', 'constraint__constraint_layer_id', 'constraint__constraint_layer__data_version'))
+    fingerprint.append(rules)
+
+    if layer.has_column_acl:
+        fingerprint.append(sorted(layer.visible_fields_for_user(user)))
+
+    return fingerprint
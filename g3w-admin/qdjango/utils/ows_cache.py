@@ -0,0 +1,232 @@
+# coding=utf-8
+"""
+    Cache of QGIS Server rendered responses (GetMap, GetLegendGraphic) of qdjango projects.
+
+    Responses are stored into the Django cache set by QDJANGO_OWS_CACHE setting (file based, Memcached, Redis...),
+    the cache key is made by:
+
+    - the normalized OWS parameters;
+    - the project version (modified time and a project token renewed by project saves and editing commits);
+    - the data versions of project layers (and the modification time of layers data files);
+    - the access control rules applied to the user (constraints, geoconstraints, column ACL) and the session
+      filter token of the request.
+
+    Users with the same access control rules share the cached responses.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the Mozilla Public License 2.0.
+"""
+
+import hashlib
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.utils.qgisapi import get_data_file_mtime
+
+logger = logging.getLogger(__name__)
+
+OWS_CACHE_KEY = 'qdjango_ows_{}_{}'
+OWS_PROJECT_VERSION_CACHE_KEY = 'qdjango_ows_version_{}'
+
+# Parameters with case insensitive values
+OWS_CASE_INSENSITIVE_PARAMS = ('SERVICE', 'REQUEST', 'VERSION', 'FORMAT', 'CRS', 'SRS', 'TRANSPARENT',
+                               'EXCEPTIONS', 'INFO_FORMAT')
+
+# Content types of service exceptions
+OWS_EXCEPTION_CONTENT_TYPES = ('text/xml', 'application/xml', 'application/vnd.ogc.se_xml')
+
+
+def get_ows_cache():
+    """
+    Return the Django cache instance set by QDJANGO_OWS_CACHE setting
+    :return: Django cache instance or None if OWS responses are not cached
+    """
+
+    cache_name = getattr(settings, 'QDJANGO_OWS_CACHE', None)
+    if not cache_name or cache_name not in settings.CACHES:
+        return None
+    return caches[cache_name]
+
+
+def get_project_ows_version(project_pk):
+    """
+    Return the OWS cache version token of a project, a new one is created if not exists
+    :param project_pk: qdjango Project pk
+    :return: str or None if OWS cache is disabled
+    """
+
+    cache = get_ows_cache()
+    if cache is None:
+        return None
+
+    key = OWS_PROJECT_VERSION_CACHE_KEY.format(project_pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_ows_cache(project_pks):
+    """
+    Renew the OWS cache version token of projects: every cached response of the projects is invalidated
+    :param project_pks: iterable of qdjango Project pks
+    :return: None
+    """
+
+    cache = get_ows_cache()
+    if cache is None:
+        return
+    cache.set_many({OWS_PROJECT_VERSION_CACHE_KEY.format(pk): uuid.uuid4().hex for pk in set(project_pks)}, None)
+
+
+def normalize_ows_params(params):
+    """
+    Normalize OWS request parameters: keys uppercased and sorted, case insensitive values lowercased,
+    BBOX coordinates rounded to 9 significant digits.
+    :param params: QueryDict or dict of request parameters
+    :return: sorted list of (key, value) tuples
+    """
+
+    normalized = {}
+    for key, value in params.items():
+        key = key.upper()
+        value = str(value)
+        if key in OWS_CASE_INSENSITIVE_PARAMS:
+            value = value.lower()
+        elif key == 'BBOX':
+            try:
+                value = ','.join('%.9g' % float(c) for c in value.split(','))
+            except ValueError:
+                pass
+        normalized[key] = value
+
+    return sorted(normalized.items())
+
+
+class OWSResponseCache(object):
+    """
+    Cached responses of a qdjango project OWS request
+    """
+
+    def __init__(self, request, project, params, acl=None):
+        """
+        :param request: Django request
+        :param project: qdjango Project model instance
+        :param params: QueryDict of OWS request parameters, keys uppercased
+        :param acl: ProjectACLSnapshot instance of the request user
+        """
+
+        self.request = request
+        self.project = project
+        self.params = params
+        self.acl = acl
+        self._key = None
+
+    @property
+    def cache(self):
+        return get_ows_cache()
+
+    @property
+    def enabled(self):
+        """
+        True for GET requests of OWS requests set by QDJANGO_OWS_CACHE_REQUESTS setting
+        """
+
+        if self.cache is None or self.request.method != 'GET':
+            return False
+
+        ows_request = str(self.params.get('REQUEST', '')).upper()
+        return ows_request in getattr(settings, 'QDJANGO_OWS_CACHE_REQUESTS', ('GETMAP', 'GETLEGENDGRAPHIC'))
+
+    def _session_filters(self):
+        """
+        Versions of the session filters of FILTERTOKEN parameter
+        """
+
+        from qdjango.models import SessionTokenFilterLayer
+
+        token = self.params.get('FILTERTOKEN')
+        if not token:
+            return []
+        return sorted(SessionTokenFilterLayer.objects.filter(
+            session_token_filter__token=token).values_list('pk', 'version'))
+
+    def _layers_data_versions(self):
+        """
+        Data versions of project layers and modification times of layers data files.
+        Data files are read from layers datasources: the QGIS project is not needed (i.e. with render workers).
+        """
+
+        from qdjango.models import Layer
+
+        versions = []
+        mtimes = []
+        for layer_id, data_version, layer_type, datasource in sorted(Layer.objects.filter(
+                project=self.project).values_list('qgs_layer_id', 'data_version', 'layer_type', 'datasource')):
+            versions.append((layer_id, data_version))
+            mtime = get_data_file_mtime(layer_type, datasource)
+            if mtime is not None:
+                mtimes.append((layer_id, mtime))
+        return [versions, mtimes]
+
+    def key(self):
+        """
+        Cache key of the request
+        :return: str
+        """
+
+        if self._key is None:
+            parts = [
+                normalize_ows_params(self.params),
+                str(self.project.modified),
+                self._layers_data_versions(),
+                sorted(self.acl.layers.items()) if self.acl is not None else None,
+                self._session_filters(),
+            ]
+            digest = hashlib.md5(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+            self._key = OWS_CACHE_KEY.format(get_project_ows_version(self.project.pk), digest)
+
+        return self._key
+
+    def get(self):
+        """
+        Return the cached response
+        :return: tuple (body bytes, status code, headers dict) or None
+        """
+
+        if not self.enabled:
+            return None
+
+        cached = self.cache.get(self.key())
+        if cached is not None:
+            logger.debug(f'[OWS CACHE] Hit for project {self.project.pk}: {self.key()}')
+        return cached
+
+    def set(self, body, status_code, headers):
+        """
+        Store a response, only successful responses not bigger than QDJANGO_OWS_CACHE_MAX_SIZE are cached
+        :param body: response body bytes
+        :param status_code: response HTTP status code
+        :param headers: dict of response headers
+        :return: True if the response has been cached
+        """
+
+        if not self.enabled or status_code != 200:
+            return False
+
+        # QGIS Server returns service exceptions as XML with status 200
+        content_type = {k.lower(): v for k, v in headers.items()}.get('content-type', '')
+        if content_type.split(';')[0].strip().lower() in OWS_EXCEPTION_CONTENT_TYPES:
+            return False
+
+        if len(body) > getattr(settings, 'QDJANGO_OWS_CACHE_MAX_SIZE', 5 * 1024 * 1024):
+            return False
+
+        self.cache.set(self.key(), (body, status_code, dict(headers)),
+                       getattr(settings, 'QDJANGO_OWS_CACHE_TIMEOUT', 3600))
+        return True
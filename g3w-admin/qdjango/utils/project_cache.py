@@ -0,0 +1,145 @@
+# coding=utf-8
+"""
+    Warm up of the QGIS Server projects cache.
+
+    Large projects take a long time to load: at worker start the projects set by QDJANGO_PRELOAD_PROJECTS setting
+    (and the QDJANGO_PRELOAD_MOST_USED most requested ones) are loaded before serving requests.
+    Projects usage is counted by OWS requests into the Django cache set by QDJANGO_PROJECT_USAGE_CACHE setting.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the Mozilla Public License 2.0.
+"""
+
+import logging
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+PROJECT_USAGE_CACHE_KEY = 'qdjango_project_usage_{}'
+PROJECT_USAGE_IDS_CACHE_KEY = 'qdjango_project_usage_ids'
+
+# Usage counts of this process not yet stored into the cache
+_PROJECT_USAGE = Counter()
+
+# Counts stored into the cache every PROJECT_USAGE_FLUSH requests
+PROJECT_USAGE_FLUSH = 100
+
+
+def get_project_usage_cache():
+    """
+    Return the Django cache instance set by QDJANGO_PROJECT_USAGE_CACHE setting
+    :return: Django cache instance or None if projects usage is not counted
+    """
+
+    cache_name = getattr(settings, 'QDJANGO_PROJECT_USAGE_CACHE', None)
+    if not cache_name or cache_name not in settings.CACHES:
+        return None
+    return caches[cache_name]
+
+
+def record_project_usage(project_pk):
+    """
+    Count a request of a project, counts are stored into the cache in batches
+    :param project_pk: qdjango Project pk
+    """
+
+    cache = get_project_usage_cache()
+    if cache is None:
+        return
+
+    _PROJECT_USAGE[project_pk] += 1
+    if sum(_PROJECT_USAGE.values()) >= PROJECT_USAGE_FLUSH:
+        flush_project_usage()
+
+
+def flush_project_usage():
+    """
+    Store the usage counts of this process into the cache
+    """
+
+    cache = get_project_usage_cache()
+    if cache is None or not _PROJECT_USAGE:
+        return
+
+    for pk, count in _PROJECT_USAGE.items():
+        key = PROJECT_USAGE_CACHE_KEY.format(pk)
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            # Removed by another process
+            cache.set(key, count, None)
+
+    ids = set(cache.get(PROJECT_USAGE_IDS_CACHE_KEY) or [])
+    if not ids.issuperset(_PROJECT_USAGE.keys()):
+        cache.set(PROJECT_USAGE_IDS_CACHE_KEY, sorted(ids.union(_PROJECT_USAGE.keys())), None)
+
+    _PROJECT_USAGE.clear()
+
+
+def get_most_used_project_ids(limit):
+    """
+    Return the most requested projects
+    :param limit: max number of projects
+    :return: list of qdjango Project pks, most used first
+    """
+
+    cache = get_project_usage_cache()
+    if cache is None or not limit:
+        return []
+
+    ids = cache.get(PROJECT_USAGE_IDS_CACHE_KEY) or []
+    counts = cache.get_many([PROJECT_USAGE_CACHE_KEY.format(pk) for pk in ids])
+    usage = {pk: counts.get(PROJECT_USAGE_CACHE_KEY.format(pk), 0) for pk in ids}
+    return sorted(usage, key=lambda pk: usage[pk], reverse=True)[:limit]
+
+
+def preload_qgs_projects(project_filter=None):
+    """
+    Load into the QGIS Server cache the projects set by QDJANGO_PRELOAD_PROJECTS setting
+    and the QDJANGO_PRELOAD_MOST_USED most requested projects.
+    :param project_filter: callable with a project pk argument, returns False for projects to skip
+    :return: list of loaded projects pks
+    """
+
+    from qdjango.apps import get_qgs_project
+    from qdjango.models import Project
+
+    pks = list(getattr(settings, 'QDJANGO_PRELOAD_PROJECTS', None) or [])
+    pks += [pk for pk in get_most_used_project_ids(getattr(settings, 'QDJANGO_PRELOAD_MOST_USED', 0))
+            if pk not in pks]
+
+    if project_filter is not None:
+        pks = [pk for pk in pks if project_filter(pk)]
+
+    # Projects over the cache size would be evicted at once
+    max_projects = getattr(settings, 'QDJANGO_PROJECT_CACHE_SIZE', None)
+    if max_projects:
+        pks = pks[:max_projects]
+
+    if not pks:
+        return []
+
+    try:
+        projects = Project.objects.in_bulk(pks)
+    except DatabaseError as e:
+        logger.error(f'[PROJECT CACHE] Projects could not be preloaded: {e}')
+        return []
+
+    loaded = []
+    for pk in pks:
+        if pk not in projects:
+            continue
+        start = time.time()
+        if get_qgs_project(projects[pk].qgis_file.path) is not None:
+            loaded.append(pk)
+            logger.info(f'[PROJECT CACHE] Project {pk} preloaded in {time.time() - start:.2f} seconds')
+        else:
+            logger.warning(f'[PROJECT CACHE] Project {pk} could not be preloaded')
+
+    return loaded
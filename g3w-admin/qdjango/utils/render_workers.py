@@ -0,0 +1,311 @@
+# coding=utf-8
+"""
+    Out of process QGIS Server rendering.
+
+    When QDJANGO_RENDER_WORKERS setting is set, OWS requests are not rendered by the Django process: they are
+    forwarded, with the user and the access control rules of the request, to a pool of long lived render workers
+    (`qgis_render_worker` management command) listening on local sockets.
+    Requests are routed by consistent hashing on the project, so every worker keeps loaded only its share of
+    projects; if a worker is down the next one on the hash ring is used.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the Mozilla Public License 2.0.
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+from multiprocessing.connection import Client, Listener
+
+from django.conf import settings
+from django.http import Http404, QueryDict
+
+logger = logging.getLogger(__name__)
+
+# Virtual nodes of every worker on the hash ring
+RENDER_WORKERS_REPLICAS = 64
+
+
+class RenderWorkerUnavailable(Exception):
+    """No render worker can be reached, or every reached worker died or timed out"""
+
+
+class RenderWorkerError(Exception):
+    """Error returned by a render worker"""
+
+
+def parse_worker_address(address):
+    """
+    Return a multiprocessing.connection address
+    :param address: unix socket path or `host:port` str
+    :return: str for unix sockets, (host, port) tuple for TCP sockets
+    """
+
+    if not address.startswith('/') and ':' in address:
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
+    return address
+
+
+def get_render_worker_authkey():
+    """
+    Authentication key of connections between Django processes and render workers, derived from SECRET_KEY
+    """
+
+    return hashlib.sha256(f'qdjango-render-worker-{settings.SECRET_KEY}'.encode('utf-8')).digest()
+
+
+class ConsistentHashRing(object):
+    """
+    Consistent hashing of keys on nodes: adding or removing a node moves only the keys of that node
+    """
+
+    def __init__(self, nodes, replicas=RENDER_WORKERS_REPLICAS):
+        """
+        :param nodes: list of nodes (str)
+        :param replicas: virtual nodes of every node
+        """
+
+        self.nodes = list(nodes)
+        self._ring = sorted((self._hash(f'{node}#{i}'), node) for node in self.nodes for i in range(replicas))
+        self._hashes = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _hash(value):
+        return int(hashlib.md5(str(value).encode('utf-8')).hexdigest()[:16], 16)
+
+    def get_nodes(self, key):
+        """
+        Nodes of a key, in ring order: the first one is the owner of the key, the others are the failover nodes
+        :param key: str
+        :return: list of nodes
+        """
+
+        nodes = []
+        if not self._ring:
+            return nodes
+
+        start = bisect.bisect(self._hashes, self._hash(key))
+        for i in range(len(self._ring)):
+            node = self._ring[(start + i) % len(self._ring)][1]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == len(self.nodes):
+                    break
+        return nodes
+
+
+class RenderWorkerPool(object):
+    """
+    Client of the render workers set by QDJANGO_RENDER_WORKERS setting
+    """
+
+    def __init__(self, addresses):
+        """
+        :param addresses: list of render workers addresses (unix socket path or `host:port`)
+        """
+
+        self.ring = ConsistentHashRing(addresses)
+
+    def render(self, request, project, uri, headers, data, acl):
+        """
+        Render a request by the worker of the project
+        :param request: Django request
+        :param project: qdjango Project model instance
+        :param uri: QGIS Server request URI
+        :param headers: dict of request headers
+        :param data: request body bytes or None
+        :param acl: ProjectACLSnapshot instance of the request user
+        :return: tuple (body bytes, status code, headers dict)
+        """
+
+        payload = {
+            'project': project.pk,
+            'user': None if request.user.is_anonymous else request.user.pk,
+            'method': request.method,
+            'content_type': request.content_type,
+            'uri': uri,
+            'headers': headers,
+            'data': data,
+            'get': request.GET.urlencode(),
+            'post': request.POST.urlencode() if request.method == 'POST' else '',
+            'acl': acl.layers,
+        }
+
+        timeout = getattr(settings, 'QDJANGO_RENDER_WORKERS_TIMEOUT', 60)
+        for address in self.ring.get_nodes(str(project.pk)):
+            try:
+                conn = Client(parse_worker_address(address), authkey=get_render_worker_authkey())
+            except (OSError, EOFError) as e:
+                logger.warning(f'[RENDER WORKERS] Worker {address} is not available: {e}')
+                continue
+
+            # Worker died or timed out: the request is sent to the next worker
+            try:
+                conn.send(payload)
+                if not conn.poll(timeout):
+                    logger.warning(f'[RENDER WORKERS] Worker {address} timed out')
+                    continue
+                reply = conn.recv()
+            except (OSError, EOFError) as e:
+                logger.warning(f'[RENDER WORKERS] Worker {address} connection error: {e}')
+                continue
+            finally:
+                conn.close()
+
+            if 'error' in reply:
+                if reply.get('status') == 404:
+                    raise Http404(reply['error'])
+                raise RenderWorkerError(reply['error'])
+
+            return reply['body'], reply['status'], reply['headers']
+
+        raise RenderWorkerUnavailable('No render worker is available')
+
+
+_RENDER_WORKER_POOL = None
+
+
+def get_render_worker_pool():
+    """
+    Return the render workers pool set by QDJANGO_RENDER_WORKERS setting
+    :return: RenderWorkerPool instance or None if requests are rendered by Django processes
+    """
+
+    global _RENDER_WORKER_POOL
+
+    addresses = tuple(getattr(settings, 'QDJANGO_RENDER_WORKERS', None) or ())
+    if not addresses:
+        return None
+
+    if _RENDER_WORKER_POOL is None or _RENDER_WORKER_POOL[0] != addresses:
+        _RENDER_WORKER_POOL = (addresses, RenderWorkerPool(addresses))
+    return _RENDER_WORKER_POOL[1]
+
+
+class RenderWorkerRequest(object):
+    """
+    Request forwarded to a render worker, with the attributes of Django request used by QGIS Server filters
+    """
+
+    def __init__(self, payload, user):
+        """
+        :param payload: dict sent by RenderWorkerPool.render()
+        :param user: Django User instance (or AnonymousUser)
+        """
+
+        self.method = payload['method']
+        self.content_type = payload['content_type']
+        self.headers = payload['headers']
+        self.body = payload['data']
+        self.GET = QueryDict(payload['get'])
+        self.POST = QueryDict(payload['post'])
+        self.user = user
+
+
+class RenderWorker(object):
+    """
+    Render worker process: it renders the requests forwarded by Django processes, one at a time
+    """
+
+    def __init__(self, address):
+        """
+        :param address: unix socket path or `host:port`
+        """
+
+        self.address = address
+
+    def handle(self, payload):
+        """
+        Render a forwarded request
+        :param payload: dict sent by RenderWorkerPool.render()
+        :return: reply dict
+        """
+
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.models import AnonymousUser
+        from qgis.server import QgsBufferServerRequest
+
+        from qdjango.apps import get_qgs_project
+        from qdjango.models import Project
+        from qdjango.ows import get_qgs_request_method, handle_qgs_server_request
+        from .acl import ProjectACLSnapshot
+
+        User = get_user_model()
+        try:
+            project = Project.objects.get(pk=payload['project'])
+            user = AnonymousUser() if payload['user'] is None else User.objects.get(pk=payload['user'])
+        except (Project.DoesNotExist, User.DoesNotExist) as e:
+            return {'error': str(e), 'status': 404}
+
+        qgs_project = get_qgs_project(project.qgis_file.path)
+        if qgs_project is None:
+            return {'error': 'The requested QGIS project could not be loaded!', 'status': 404}
+
+        # Access control rules computed by the Django process
+        acl = ProjectACLSnapshot(user, project, layers=payload['acl'])
+
+        qgs_request = QgsBufferServerRequest(payload['uri'], get_qgs_request_method(payload['method']),
+                                             payload['headers'], payload['data'])
+        try:
+            body, status, headers = handle_qgs_server_request(
+                RenderWorkerRequest(payload, user), project, qgs_project, qgs_request, acl)
+        except Exception as e:
+            logger.error(f'[RENDER WORKERS] Error rendering {payload["uri"]}: {e}')
+            return {'error': str(e), 'status': 500}
+
+        return {'body': body, 'status': status, 'headers': headers}
+
+    def serve_forever(self):
+        """
+        Accept and render requests until the process is stopped
+        """
+
+        from django.db import close_old_connections
+        from qdjango.apps import begin_request_projects, end_request_projects
+        from .project_cache import preload_qgs_projects
+
+        # Warm up only the projects routed to this worker
+        ring = ConsistentHashRing(getattr(settings, 'QDJANGO_RENDER_WORKERS', None) or [self.address])
+        preload_qgs_projects(lambda pk: ring.get_nodes(str(pk))[0] == self.address)
+        close_old_connections()
+
+        address = parse_worker_address(self.address)
+
+        # Socket file left by a stopped worker
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)
+
+        listener = Listener(address, authkey=get_render_worker_authkey())
+        logger.info(f'[RENDER WORKERS] Worker listening on {self.address}')
+
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # i.e. authentication errors
+                    logger.warning(f'[RENDER WORKERS] Connection refused: {e}')
+                    continue
+
+                try:
+                    payload = conn.recv()
+                    close_old_connections()
+                    # Projects are checked once per request, as in Django processes
+                    begin_request_projects()
+                    try:
+                        reply = self.handle(payload)
+                    except Exception as e:
+                        logger.error(f'[RENDER WORKERS] Error handling request: {e}')
+                        reply = {'error': str(e), 'status': 500}
+                    finally:
+                        end_request_projects()
+                    conn.send(reply)
+                except (OSError, EOFError) as e:
+                    logger.warning(f'[RENDER WORKERS] Connection error: {e}')
+                finally:
+                    conn.close()
+                    close_old_connections()
+        finally:
+            listener.close()
@@ -0,0 +1,354 @@
+# coding=utf-8
+"""Text indexes of the fields used by layer search widgets.
+
+Layers with `search_index` flag get an index on the fields of their search widgets with ILIKE operator:
+
+- file based layers (ogr and spatialite providers): a SQLite FTS5 sidecar file with trigram tokenizer,
+  matches are resolved to feature ids and sent to the provider as a subset string;
+- postgres layers: pg_trgm GIN indexes on the layer table, used by ILIKE conditions pushed down to the provider
+  (see core.utils.subset).
+
+Sidecar indexes are rebuilt in background (huey task) when layer data change: a stale index is never queried.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+    it under the terms of the Mozilla Public License 2.0.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+
+from django.conf import settings
+from qgis.core import (
+    QgsDataSourceUri,
+    QgsFeatureRequest,
+    QgsProviderRegistry,
+    QgsVectorLayer,
+)
+from qgis.PyQt.QtCore import QVariant
+
+from core.utils.qgisapi import get_layer_data_file_mtime
+from core.utils.subset import SubsetStringCompiler, fid_subset_string
+
+logger = logging.getLogger(__name__)
+
+# Search widget operators answered by the index
+SEARCH_INDEX_OPERATORS = ('ILIKE',)
+
+SEARCH_INDEX_BACKEND_FTS = 'fts'
+SEARCH_INDEX_BACKEND_POSTGRES = 'postgres'
+
+# Process cache of fresh FTS indexes: layer pk -> layer data version the index was found fresh with
+_FRESH_INDEXES = {}
+
+
+def get_search_index_path():
+    """
+    Return the directory of FTS sidecar files, QDJANGO_SEARCH_INDEX_PATH setting or `search_index` into MEDIA_ROOT
+    """
+
+    return getattr(settings, 'QDJANGO_SEARCH_INDEX_PATH', None) or \
+        os.path.join(settings.MEDIA_ROOT, 'search_index')
+
+
+def get_layer_search_fields(layer, operators=SEARCH_INDEX_OPERATORS):
+    """
+    Return the fields of layer search widgets with an ILIKE operator
+    :param layer: qdjango Layer instance
+    :param operators: search widget operators of the fields, None for every operator
+    :return: sorted list of field names
+    """
+
+    from qdjango.models import Widget
+
+    fields = set()
+    for widget in Widget.objects.filter(layers=layer, widget_type='search'):
+        try:
+            body = json.loads(widget.body)
+        except ValueError:
+            continue
+        for field in body.get('fields', []):
+            if operators is None or str(field.get('filterop', '')).upper() in operators:
+                fields.add(field['name'])
+
+    return sorted(fields)
+
+
+class LayerSearchIndex(object):
+    """
+    Text index of a layer, built on the fields of its search widgets
+    """
+
+    def __init__(self, layer, qgis_layer=None):
+        """
+        :param layer: qdjango Layer instance
+        :param qgis_layer: QgsVectorLayer instance of the layer, default to layer.qgis_layer
+        """
+
+        self.layer = layer
+        self._qgis_layer = qgis_layer
+        self._fields = None
+
+    @property
+    def qgis_layer(self):
+        """
+        QGIS layer instance, loaded at first access
+        """
+
+        if self._qgis_layer is None:
+            self._qgis_layer = self.layer.qgis_layer
+        return self._qgis_layer
+
+    @property
+    def fields(self):
+        """
+        Indexed fields: text fields of the layer used by search widgets
+        """
+
+        if self._fields is None:
+            layer_fields = self.qgis_layer.fields()
+            self._fields = [f for f in get_layer_search_fields(self.layer)
+                            if layer_fields.lookupField(f) >= 0 and
+                            layer_fields.field(f).type() == QVariant.String]
+        return self._fields
+
+    @property
+    def backend(self):
+        """
+        Index backend for the layer provider, None if the layer can't be indexed
+        """
+
+        if not self.layer.search_index or not isinstance(self.qgis_layer, QgsVectorLayer):
+            return None
+
+        provider = self.qgis_layer.providerType()
+        if provider == 'postgres':
+            return SEARCH_INDEX_BACKEND_POSTGRES
+        if provider in ('ogr', 'spatialite'):
+            return SEARCH_INDEX_BACKEND_FTS
+        return None
+
+    @property
+    def path(self):
+        """
+        FTS sidecar file path
+        """
+
+        return os.path.join(get_search_index_path(), f'layer_{self.layer.pk}.fts.sqlite')
+
+    def version(self):
+        """
+        Version of the indexed data: layer data version, data file modification time and indexed fields
+        """
+
+        return json.dumps([self.layer.data_version, get_layer_data_file_mtime(self.qgis_layer), self.fields])
+
+    def _indexed_version(self):
+        """
+        Version stored into the sidecar file, None if it doesn't exist
+        """
+
+        if not os.path.exists(self.path):
+            return None
+        try:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f'[SEARCH INDEX] Cannot read {self.path}: {e}')
+            return None
+        return row[0] if row else None
+
+    def is_fresh(self):
+        """
+        True if the FTS sidecar file exists and it's updated with layer data.
+        The result is cached in process until the layer data version changes.
+        """
+
+        if _FRESH_INDEXES.get(self.layer.pk) == self.layer.data_version:
+            return True
+
+        fresh = self._indexed_version() == self.version()
+        if fresh:
+            _FRESH_INDEXES[self.layer.pk] = self.layer.data_version
+        return fresh
+
+    def refresh(self):
+        """
+        Build the index if it's missing or stale
+        :return: True if the index has been built
+        """
+
+        backend = self.backend
+        if backend is None or not self.fields:
+            self.remove()
+            return False
+
+        if backend == SEARCH_INDEX_BACKEND_POSTGRES:
+            return self._build_postgres()
+
+        # Not cached freshness: search widget fields may have changed with the same data version
+        if self._indexed_version() == self.version():
+            _FRESH_INDEXES[self.layer.pk] = self.layer.data_version
+            return False
+        return self._build_fts()
+
+    def remove(self):
+        """
+        Remove the FTS sidecar file
+        """
+
+        _FRESH_INDEXES.pop(self.layer.pk, None)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _build_fts(self):
+        """
+        Write a new sidecar file with a FTS5 table (trigram tokenizer, SQLite >= 3.34),
+        feature ids are the rowids of the table.
+        """
+
+        version = self.version()
+        os.makedirs(get_search_index_path(), exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+
+        # Read features from a new layer instance: the project layer may have temporary subset strings
+        qgis_layer = QgsVectorLayer(self.qgis_layer.source(), 'search_index', self.qgis_layer.providerType())
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(self.fields, qgis_layer.fields())
+
+        columns = ', '.join(f'c{i}' for i in range(len(self.fields)))
+        placeholders = ', '.join('?' for _ in range(len(self.fields) + 1))
+
+        try:
+            conn = sqlite3.connect(tmp_path)
+            try:
+                conn.execute(f"CREATE VIRTUAL TABLE search_index USING fts5({columns}, tokenize='trigram')")
+                conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+
+                rows = []
+                for feature in qgis_layer.getFeatures(request):
+                    # NULL values are QVariant instances
+                    rows.append([feature.id()] + [None if isinstance(feature[f], QVariant) else str(feature[f])
+                                                  for f in self.fields])
+                    if len(rows) >= 10000:
+                        conn.executemany(f'INSERT INTO search_index (rowid, {columns}) VALUES ({placeholders})', rows)
+                        rows = []
+                if rows:
+                    conn.executemany(f'INSERT INTO search_index (rowid, {columns}) VALUES ({placeholders})', rows)
+
+                conn.execute("INSERT INTO meta VALUES ('version', ?)", [version])
+                conn.execute("INSERT INTO meta VALUES ('fields', ?)", [json.dumps(self.fields)])
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f'[SEARCH INDEX] Cannot build index of layer {self.layer.qgs_layer_id}: {e}')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        os.replace(tmp_path, self.path)
+        _FRESH_INDEXES[self.layer.pk] = self.layer.data_version
+        logger.info(f'[SEARCH INDEX] Built index of layer {self.layer.qgs_layer_id} on fields {self.fields}')
+        return True
+
+    def _build_postgres(self):
+        """
+        Create pg_trgm GIN indexes on layer table, if they don't exist
+        """
+
+        uri = QgsDataSourceUri(self.qgis_layer.source())
+        table = uri.table()
+
+        # Query layers: no table to index
+        if not table or table.startswith('('):
+            return False
+
+        compiler = SubsetStringCompiler(self.qgis_layer)
+        table_sql = f'{compiler.quote_identifier(uri.schema() or "public")}.{compiler.quote_identifier(table)}'
+
+        try:
+            md = QgsProviderRegistry.instance().providerMetadata('postgres')
+            conn = md.createConnection(self.qgis_layer.source(), {})
+            conn.executeSql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for field in self.fields:
+                name = 'g3w_trgm_' + hashlib.md5(f'{table_sql}.{field}'.encode('utf-8')).hexdigest()[:16]
+                conn.executeSql(f'CREATE INDEX IF NOT EXISTS {compiler.quote_identifier(name)} ON {table_sql} '
+                                f'USING gin ({compiler.quote_identifier(field)} gin_trgm_ops)')
+        except Exception as e:
+            logger.error(f'[SEARCH INDEX] Cannot create trigram indexes for layer {self.layer.qgs_layer_id}: {e}')
+            return False
+
+        return True
+
+    def filter_sql(self, conditions):
+        """
+        Query the FTS sidecar file and return a provider SQL selecting the matching features
+
+        :param conditions: list of (field name, operator, pattern, logic operator with the next condition) tuples,
+                           as the `field` parameter of vector API
+        :return: SQL str or None if the conditions can't be answered by the index
+        """
+
+        if self.backend != SEARCH_INDEX_BACKEND_FTS or not conditions or not self.is_fresh():
+            return None
+
+        max_hits = getattr(settings, 'QDJANGO_SEARCH_INDEX_MAX_HITS', 10000)
+
+        try:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+            try:
+                # Indexed fields are read from the sidecar file: search widgets may have been changed
+                # by another process after the index was built
+                row = conn.execute("SELECT value FROM meta WHERE key = 'fields'").fetchone()
+                fields = json.loads(row[0]) if row else []
+
+                # OR of AND groups, as SQL operators precedence
+                groups = [[]]
+                params = []
+                for idx, (field_name, operator, pattern, logicop) in enumerate(conditions):
+                    # SQLite LIKE folds case of ASCII characters only
+                    if operator.upper() not in SEARCH_INDEX_OPERATORS or field_name not in fields or \
+                            not str(pattern).isascii():
+                        return None
+                    groups[-1].append(f'c{fields.index(field_name)} LIKE ?')
+                    params.append(pattern)
+                    if idx < len(conditions) - 1:
+                        if logicop == 'OR':
+                            groups.append([])
+                        elif logicop != 'AND':
+                            return None
+
+                where = ' OR '.join('(' + ' AND '.join(g) + ')' for g in groups)
+                fids = [r[0] for r in conn.execute(
+                    f'SELECT rowid FROM search_index WHERE {where} LIMIT ?', params + [max_hits + 1])]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f'[SEARCH INDEX] Cannot query {self.path}: {e}')
+            return None
+
+        # Too many hits: a long ids list is slower than the provider filter
+        if len(fids) > max_hits:
+            return None
+
+        return fid_subset_string(self.qgis_layer, fids)
+
+
+def schedule_search_index_refresh(layers):
+    """
+    Refresh in background the search index of layers
+    :param layers: iterable of qdjango Layer instances
+    """
+
+    from qdjango.tasks import refresh_search_index_task
+
+    for layer in layers:
+        if layer.search_index:
+            refresh_search_index_task(layer.pk)
@@ -5,6 +5,7 @@ import zipfile
 
 from django.conf import settings
 from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.translation import ugettext_lazy as _
 from qgis.core import \
     QgsVectorFileWriter, \
     QgsFeatureRequest, \
@@ -12,17 +13,24 @@ from qgis.core import \
     Qgis, \
     QgsFieldConstraints, \
     QgsWkbTypes, \
-    QgsVectorLayer
+    QgsVectorLayer, \
+    QgsCoordinateTransform, \
+    QgsCsException, \
+    QgsRectangle
 
 from core.api.base.vector import MetadataVectorLayer
 from core.api.base.views import (MODE_CONFIG, MODE_DATA, MODE_SHP, MODE_XLS, MODE_GPX, MODE_CSV, MODE_FILTER_TOKEN,
-                                 APIException, BaseVectorApiView, MODE_GPKG,
+                                 APIException, BaseVectorApiView, MODE_GPKG, MODE_TILES,
                                  IntersectsBBoxFilter)
 from core.api.filters import (IntersectsBBoxFilter, OrderingFilter,
                               SearchFilter, SuggestFilterBackend, FieldFilterBackend, QgsExpressionFilterBackend)
 from core.api.permissions import ProjectPermission
 
-from core.utils.qgisapi import get_qgis_layer
+from core.utils.cache import vector_cache_get, vector_cache_set
+from core.utils.mvt import MVT_CONTENT_TYPE, MVTLayerEncoder, encode_tile, tile_bounds, WEB_MERCATOR_MAX_LATITUDE
+from core.utils.qgisapi import get_coordinate_transform, get_qgis_layer, iter_qgis_features, \
+    get_layer_data_file_mtime
+from core.utils.response import build_etag
 from core.utils.structure import mapLayerAttributesFromQgisLayer
 from core.utils.vector import BaseUserMediaHandler
 
@@ -35,12 +43,15 @@ from qdjango.api.layers.filters import (
     FidFilter,
     SingleLayerSessionTokenFilter,
     ColumnAclFilter,
-    FILTER_FID_PARAM
+    FILTER_FID_PARAM,
+    FILTER_SESSION_PARAM
 )
 
 from .models import Layer, SessionTokenFilter, SessionTokenFilterLayer
+from .models.filters import parse_fids
 from .utils.data import QGIS_LAYER_TYPE_NO_GEOM
 from .utils.edittype import MAPPING_EDITTYPE_QGISEDITTYPE
+from .utils.models import get_layer_acl_fingerprint
 
 import json
 import logging
@@ -241,7 +252,8 @@ class LayerVectorView(QGISLayerVectorViewMixin, BaseVectorApiView):
         MODE_GPX,    # get GPX
         MODE_CSV,  # get CSV
         MODE_GPKG,  # get GeoPackage
-        MODE_FILTER_TOKEN  # get session filter token
+        MODE_FILTER_TOKEN,  # get session filter token
+        MODE_TILES  # get Mapbox vector tile
     ]
 
     mapping_layer_attributes_function = mapLayerAttributesFromQgisLayer
@@ -253,8 +265,59 @@ class LayerVectorView(QGISLayerVectorViewMixin, BaseVectorApiView):
         if 'widget_type' in kwargs:
             self.widget_type = kwargs['widget_type']
 
+        if 'z' in kwargs:
+            self.tile = (int(kwargs['z']), int(kwargs['x']), int(kwargs['y']))
+
         super(LayerVectorView, self).initial(request, *args, **kwargs)
 
+    def get_etag(self, request):
+        """
+        ETag for config and data modes, built from layer data versions, file modification time,
+        request parameters and user ACL fingerprint.
+        Data mode is enabled only for layer providers into G3WADMIN_VECTOR_API_ETAG_PROVIDERS setting:
+        data changed outside G3W-SUITE (i.e. from QGIS desktop on a shared DB) don't change the ETag.
+        """
+
+        if self.mode_call not in (MODE_CONFIG, MODE_DATA):
+            return None
+
+        if self.mode_call == MODE_DATA and self.layer.layer_type not in \
+                getattr(settings, 'G3WADMIN_VECTOR_API_ETAG_PROVIDERS', ()):
+            return None
+
+        parts = [
+            self.mode_call,
+            self.layer.pk,
+            self.layer.data_version,
+            sorted(request.query_params.lists()),
+            get_layer_acl_fingerprint(request.user, self.layer, context=getattr(self, 'context', 'v'))
+        ]
+
+        if self.mode_call == MODE_DATA:
+            parts.append(get_layer_data_file_mtime(self.metadata_layer.qgis_layer))
+
+            # Joined attributes come from other layers
+            if self.layer.vectorjoins:
+                parts.append(list(self._layer_model.objects.filter(
+                    project=self.layer.project,
+                    qgs_layer_id__in=[j['joinLayerId'] for j in eval(self.layer.vectorjoins)]
+                ).order_by('pk').values_list('pk', 'data_version')))
+
+            filtertoken = request.query_params.get(FILTER_SESSION_PARAM)
+            if filtertoken:
+                parts.append(SessionTokenFilter.get_expr_for_token(filtertoken, self.layer))
+
+        return build_etag(*parts)
+
+    def get_last_modified(self, request):
+
+        timestamps = [self.layer.project.modified.timestamp()]
+        if self.layer.data_modified:
+            timestamps.append(self.layer.data_modified.timestamp())
+        if self.mode_call == MODE_DATA:
+            timestamps.append(get_layer_data_file_mtime(self.metadata_layer.qgis_layer))
+        return max([t for t in timestamps if t])
+
     def get_forms(self):
         """
         Check if edittype is set for layer and build inputtype
@@ -307,7 +370,8 @@ class LayerVectorView(QGISLayerVectorViewMixin, BaseVectorApiView):
 
     def response_widget_unique_data(self, request_data):
         """
-        Execute a distinct query for unique editing qgis widget
+        Execute a distinct query for unique editing qgis widget,
+        optional 'limit' and 'prefix' (case insensitive) params
         """
         if 'fields' not in request_data:
             raise APIException('The \'fields\' param not in request data')
@@ -318,20 +382,14 @@ class LayerVectorView(QGISLayerVectorViewMixin, BaseVectorApiView):
         if len(fields) == 0:
             raise APIException('The \'fields\' param is empty')
 
+        try:
+            limit = int(request_data.get('limit', -1))
+        except ValueError as e:
+            raise APIException(e)
+
         res = dict()
         for field in fields:
-            uniques = self.metadata_layer.qgis_layer.uniqueValues(
-                self.metadata_layer.qgis_layer.fields().indexOf(field)
-            )
-            tores = []
-            for u in uniques:
-                try:
-                    tores.append(json.loads(QgsJsonUtils.encodeValue(u)))
-                except Exception as e:
-                    logger.error(f'Response vector widget unique: {e}')
-                    continue
-
-            res[field] = tores
+            res[field] = self.get_unique_values(field, limit=limit, prefix=request_data.get('prefix'))
 
         return res
 
@@ -351,6 +409,97 @@ class LayerVectorView(QGISLayerVectorViewMixin, BaseVectorApiView):
 
         self.results.update({'data': res})
 
+    def _tile_layer_extent(self, ct, rect):
+        """
+        Return the extent of a tile into the layer CRS. Tiles of low zoom levels exceed the validity area of
+        projected CRSs: the tile is clamped to the CRS validity area.
+        :param ct: QgsCoordinateTransform from the layer CRS to EPSG:3857
+        :param rect: QgsRectangle of the tile in EPSG:3857
+        :return: QgsRectangle into the layer CRS, empty if the tile is outside the CRS validity area
+        """
+
+        try:
+            return ct.transformBoundingBox(rect, QgsCoordinateTransform.ReverseTransform)
+        except QgsCsException:
+            pass
+
+        bounds = ct.sourceCrs().bounds()
+        bounds = QgsRectangle(bounds.xMinimum(), max(bounds.yMinimum(), -WEB_MERCATOR_MAX_LATITUDE),
+                              bounds.xMaximum(), min(bounds.yMaximum(), WEB_MERCATOR_MAX_LATITUDE))
+        try:
+            clamped = rect.intersect(get_coordinate_transform(4326, 3857).transformBoundingBox(bounds))
+            if clamped.isEmpty():
+                return clamped
+            return ct.transformBoundingBox(clamped, QgsCoordinateTransform.ReverseTransform)
+        except QgsCsException:
+            return QgsRectangle()
+
+    def response_tiles_mode(self, request):
+        """
+        Return a Mapbox vector tile (MVT) of the layer: features are filtered by the same
+        filter backends of data mode (so constraints, column ACL, session token filters are the same)
+        and by the tile extent. The tile is stored into the vector cache keyed by the effective filters
+        and attributes, that reflect the user ACL.
+        """
+
+        qgis_layer = self.metadata_layer.qgis_layer
+        if not qgis_layer.isSpatial():
+            raise APIException(_('Layer has no geometry'))
+
+        z, x, y = self.tile
+        if z > 30 or x >= 2 ** z or y >= 2 ** z:
+            raise APIException(_('Tile out of range'))
+
+        encoder = MVTLayerEncoder(self.layer.qgs_layer_id, tile_bounds(z, x, y))
+
+        qgis_feature_request = QgsFeatureRequest()
+
+        # Apply filter backends, store original subset string
+        original_subset_string = qgis_layer.subsetString()
+        try:
+            self.apply_filter_backends(request, qgis_feature_request)
+
+            # Tile extent into layer CRS, intersected with a possible bbox filter
+            ct = get_coordinate_transform(self.layer.srid, 3857)
+            tile_rect = self._tile_layer_extent(ct, encoder.buffered_rect)
+            if not qgis_feature_request.filterRect().isEmpty():
+                tile_rect = tile_rect.intersect(qgis_feature_request.filterRect())
+
+            if tile_rect.isEmpty():
+                return HttpResponse(b'', content_type=MVT_CONTENT_TYPE)
+            qgis_feature_request.setFilterRect(tile_rect)
+
+            if qgis_feature_request.flags() & QgsFeatureRequest.SubsetOfAttributes:
+                attrs = list(qgis_feature_request.subsetOfAttributes())
+            else:
+                attrs = list(range(len(qgis_layer.fields())))
+
+            key = self._vector_cache_key('mvt', qgis_feature_request, z, x, y, attrs)
+            tile = vector_cache_get(key)
+            if tile is None:
+                plan = self.serialization_plan
+                for feature in iter_qgis_features(qgis_layer, qgis_feature_request):
+                    geometry = feature.geometry()
+                    try:
+                        geometry.transform(ct)
+                    except QgsCsException:
+                        # Feature outside the validity area of the layer CRS
+                        continue
+                    properties = {}
+                    for idx in attrs:
+                        properties[plan.field_names[idx]] = json.loads(
+                            QgsJsonUtils.encodeValue(feature.attribute(idx)))
+                    encoder.add_feature(geometry, properties, plan.server_fid(feature))
+
+                tile = encode_tile([encoder])
+                vector_cache_set(key, tile)
+
+        finally:
+            # Restore the original subset string
+            qgis_layer.setSubsetString(original_subset_string)
+
+        return HttpResponse(tile, content_type=MVT_CONTENT_TYPE)
+
     def response_filtertoken_mode(self, request):
         """
         Create and return a unique filter token for session layer filter, or delete
@@ -385,6 +534,12 @@ class LayerVectorView(QGISLayerVectorViewMixin, BaseVectorApiView):
                 raise APIException(
                     "'fidsin' only or 'fidsout' only parameter is required.")
 
+            try:
+                fidsin = parse_fids(fidsin) if fidsin else None
+                fidsout = parse_fids(fidsout) if fidsout else None
+            except ValueError:
+                raise APIException("'fidsin' and 'fidsout' must be comma separated feature ids.")
+
         s, created = SessionTokenFilter.objects.get_or_create(
             sessionid=sessionid,
             defaults={'user': request.user if request.user.pk else None}
@@ -396,22 +551,12 @@ class LayerVectorView(QGISLayerVectorViewMixin, BaseVectorApiView):
             raise APIException(
                 "Session filter token doesn't exists for current session")
 
-        def _create_qgs_expr(s, fidsin=None, fidsout=None):
-            """ Create qgs expression to save in db """
-
-            expr = f'$id IN ({fidsin})' if fidsin else f'$id NOT IN ({fidsout})'
-            return f'{s.qgs_expr} AND {expr}' if s else expr
-
         if mode == 'create_update':
 
-            l, created = s.stf_layers.get_or_create(
-                layer=self.layer,
-                defaults={'qgs_expr': _create_qgs_expr(None, fidsin, fidsout)}
-            )
-
-            if not created:
-                l.qgs_expr = _create_qgs_expr(l, fidsin, fidsout)
-                l.save()
+            # Feature ids are stored as a compact sorted set, merged on update
+            l, created = s.stf_layers.get_or_create(layer=self.layer)
+            l.update_fids(fidsin, fidsout)
+            l.save()
 
             token_data.update({
                 'filtertoken': s.token
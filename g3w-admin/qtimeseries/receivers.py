@@ -18,7 +18,8 @@ from django.template import loader
 from core.signals import \
     load_layer_actions, \
     initconfig_plugin_start, \
-    after_serialized_project_layer
+    after_serialized_project_layer, \
+    project_config_version
 from .models import QRasterTimeSeriesLayer
 from osgeo import gdal
 
@@ -137,4 +138,17 @@ def add_qtimeseries(sender, **kwargs):
 
     if QRasterTimeSeriesLayer.is_activated(kwargs['layer']):
             data['values'] = {'qtimeseries': True}
-    return data
\ No newline at end of file
+    return data
+
+
+@receiver(project_config_version)
+def qtimeseries_config_version(sender, **kwargs):
+    """
+    Return the layers with 'qtimeseries' property, for the ETag of the project config
+    """
+
+    if kwargs['app_name'] != 'qdjango':
+        return None
+
+    return sorted(QRasterTimeSeriesLayer.objects.filter(
+        layer__project=kwargs['project']).values_list('layer_id', flat=True))
@@ -282,6 +282,30 @@ class UsersManageTest(BaseUsermanageTestCase):
             self.test_viewer1_2
         ]))
 
+    def test_project_permissions_snapshot(self):
+        """ Test permissions snapshot memoized on request """
+
+        assign_perm('view_group', self.test_viewer1, self.group_test)
+        assign_perm('change_group', self.test_gu_viewer1, self.group_test)
+
+        request = self.factory.get('/')
+        request.user = self.test_viewer1
+
+        perms = get_project_permissions(request, self.group_test)
+        self.assertIs(get_project_permissions(request, self.group_test), perms)
+        self.assertTrue(perms.has_perm('core.view_group', self.group_test))
+
+        # Answered from memory, as User.has_perm()
+        can_change = self.test_viewer1.has_perm('core.change_group', self.group_test)
+        with self.assertNumQueries(0):
+            self.assertTrue(perms.has_perm('core.view_group', self.group_test))
+            self.assertEqual(perms.has_perm('core.change_group', self.group_test), can_change)
+            self.assertFalse(perms.has_perm('core.delete_group', self.group_test))
+
+        anonymous_perms = get_project_permissions(request, self.group_test, get_user_model().get_anonymous())
+        self.assertIsNot(anonymous_perms, perms)
+        self.assertFalse(anonymous_perms.has_perm('core.view_group', self.group_test))
+
     def test_crispyBoxACL(self):
         """ Test function of the same name """
 
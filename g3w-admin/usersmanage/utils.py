@@ -4,6 +4,7 @@ from django.contrib.contenttypes.models import ContentType
 from django.db.models import Q
 from guardian.shortcuts import get_users_with_perms, assign_perm, remove_perm, get_groups_with_perms, \
     get_perms, get_objects_for_user
+from guardian.core import ObjectPermissionChecker
 from guardian.models import UserObjectPermission
 from guardian.compat import get_user_model
 from crispy_forms.layout import Div, HTML, Field
@@ -334,4 +335,105 @@ def get_user_groups_for_object(object, user, permission, grouprole=None):
     if editor1_user_groups:
         user_groups = list(set(editor1_user_groups).intersection(set(user_groups)))
 
-    return user_groups
\ No newline at end of file
+    return user_groups
+
+
+class ProjectPermissionsSnapshot(object):
+    """
+    Django-guardian object permissions of a user on a project and on its layers.
+    User and group permissions are loaded at the first check, with one query each for every model,
+    then all checks are answered from memory: use get_project_permissions() to share it during a request.
+    """
+
+    def __init__(self, user, project):
+        """
+        :param user: Django User instance or AnonymousUser
+        :param project: project model instance (i.e. qdjango Project)
+        """
+
+        self.user = get_user_model().get_anonymous() if user.is_anonymous else user
+        self.project = project
+        self._checker = None
+        self._layers = None
+
+    @property
+    def layers(self):
+        """
+        Layers of the project, empty list for project types without layers
+        """
+
+        if self._layers is None:
+            self._layers = list(self.project.layer_set.all()) if hasattr(self.project, 'layer_set') else []
+        return self._layers
+
+    @property
+    def checker(self):
+        """
+        ObjectPermissionChecker with project and layers permissions prefetched
+        """
+
+        if self._checker is None:
+            self._checker = ObjectPermissionChecker(self.user)
+            self._checker.prefetch_perms([self.project])
+            if self.layers:
+                self._checker.prefetch_perms(self.layers)
+        return self._checker
+
+    def has_perm(self, perm, obj):
+        """
+        Check an object permission, as User.has_perm(perm, obj)
+        :param perm: permission, i.e. 'qdjango.change_layer'
+        :param obj: the project or one of its layers, permissions of other objects are queried
+        :return: bool
+        """
+
+        return self.checker.has_perm(perm, obj)
+
+    def get_perms(self, obj):
+        """
+        Permission codenames of the user on the object
+        :param obj: the project or one of its layers
+        :return: list
+        """
+
+        return self.checker.get_perms(obj)
+
+    def layers_with_perm(self, perm):
+        """
+        Layers of the project with a permission, as guardian get_objects_for_user():
+        global permissions give access to all layers
+        :param perm: permission, i.e. 'qdjango.view_layer'
+        :return: list of layer instances
+        """
+
+        if self.user.has_perm(perm):
+            return list(self.layers)
+        return [l for l in self.layers if self.checker.has_perm(perm, l)]
+
+
+def get_project_permissions(request, project, user=None):
+    """
+    Return the permissions snapshot of a user on a project, memoized on the request
+    :param request: Django or DRF request, None for a new snapshot (user is required)
+    :param project: project model instance
+    :param user: Django User instance or AnonymousUser, default to request.user
+    :rtype: ProjectPermissionsSnapshot
+    """
+
+    if request is None:
+        return ProjectPermissionsSnapshot(user, project)
+
+    if user is None:
+        user = request.user
+
+    snapshots = getattr(request, '_project_permissions', None)
+    if snapshots is None:
+        snapshots = {}
+        request._project_permissions = snapshots
+
+    key = ('anonymous' if user.is_anonymous else user.pk, project._meta.label, project.pk)
+    snapshot = snapshots.get(key)
+    if snapshot is None:
+        snapshot = ProjectPermissionsSnapshot(user, project)
+        snapshots[key] = snapshot
+    return snapshot